@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sync API (gunicorn, routes_api.py) against the async API (hypercorn,
+flask_app/async_api.py) side by side, at several numbers of concurrent connections.
+
+Run: python bench_async.py [--connections 50 200 1000] [--seconds 10] [--write-ratio 0.1]
+                           [--think-ms 0] [--sync-workers N --threads N] [--async-workers N]
+
+Both servers are started with serve.py on a copy of the same freshly seeded temp SQLite
+database. Every connection is a signed-in table client on a keep-alive connection that
+polls its session list (GET /api/session-lists/<id>) and now and then moves an entry
+(PUT .../sounds/<entry>/position), waiting --think-ms between requests (0 = back to back).
+Connections are spread over --client-procs processes, each running an asyncio loop.
+Reports requests/s, p50/p99/max latency and failures (errors, timeouts, refused
+connections) per server and connection count. The clients share the machine with the
+server, so compare the two rows of each pair rather than absolute numbers.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+N_LISTS = 50
+REQUEST_TIMEOUT = 30
+
+
+def seed(db_path):
+    """Seed db_path with bench_db.py's data; returns [(session cookie, list_id, entry_ids)]."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bench_db
+    from flask_app import app
+
+    lists = bench_db.seed(N_LISTS)
+    serializer = app.session_interface.get_signing_serializer(app)
+    return [
+        (serializer.dumps({'_user_id': str(user_id), '_fresh': True}), list_id, entry_ids)
+        for user_id, list_id, entry_ids in lists
+    ]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, extra_args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+           '--bind', '127.0.0.1:%d' % port] + extra_args
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path)
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        if proc.poll() is not None:
+            sys.exit('%s exited with status %d' % (' '.join(cmd), proc.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    sys.exit('%s did not start listening' % ' '.join(cmd))
+
+
+async def read_response(reader):
+    """Status and body of one HTTP/1.1 response (Content-Length or chunked)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers, body
+
+
+async def table_client(port, cookie, list_id, entry_ids, deadline, write_ratio, think, seed_value, stats):
+    rng = random.Random(seed_value)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), REQUEST_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        stats['refused'] += 1
+        return
+    common = 'Host: 127.0.0.1\r\nCookie: session=%s\r\n' % cookie
+    try:
+        while time.time() < deadline:
+            if rng.random() < write_ratio:
+                entry_id, after_id = rng.sample(entry_ids, 2)
+                body = json.dumps({'after_id': after_id}).encode()
+                request = ('PUT /api/session-lists/%d/sounds/%d/position HTTP/1.1\r\n%s'
+                           'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                           % (list_id, entry_id, common, len(body))).encode() + body
+            else:
+                request = ('GET /api/session-lists/%d HTTP/1.1\r\n%s\r\n' % (list_id, common)).encode()
+            t0 = time.perf_counter()
+            writer.write(request)
+            status, headers, _ = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT)
+            if status == 200:
+                stats['latencies'].append(time.perf_counter() - t0)
+            else:
+                stats['failed'] += 1
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            if think:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * think)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        stats['failed'] += 1
+    finally:
+        writer.close()
+
+
+def client_proc(port, clients, deadline, write_ratio, think, results):
+    stats = {'latencies': [], 'failed': 0, 'refused': 0}
+
+    async def run():
+        await asyncio.gather(*(
+            table_client(port, cookie, list_id, entry_ids, deadline, write_ratio, think, n, stats)
+            for n, (cookie, list_id, entry_ids) in clients
+        ))
+    asyncio.run(run())
+    results.put(stats)
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def run_load(port, lists, connections, args):
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    deadline = time.time() + args.seconds
+    clients = [(n, lists[n % len(lists)]) for n in range(connections)]
+    procs_n = max(1, min(args.client_procs, connections))
+    procs = [
+        ctx.Process(target=client_proc, args=(port, clients[i::procs_n], deadline, args.write_ratio,
+                                              args.think_ms / 1000.0, results))
+        for i in range(procs_n)
+    ]
+    start = time.time()
+    for p in procs:
+        p.start()
+    outcome = [results.get() for _ in procs]
+    # Requests in flight at the deadline still finish, so divide by the actual run time.
+    elapsed = time.time() - start
+    for p in procs:
+        p.join()
+    latencies = sorted(s for o in outcome for s in o['latencies'])
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'max': percentile(latencies, 1.0),
+        'failed': sum(o['failed'] + o['refused'] for o in outcome),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--think-ms', type=float, default=0, help='average pause between a client\'s requests')
+    parser.add_argument('--sync-workers', type=int, default=multiprocessing.cpu_count() * 2 + 1)
+    parser.add_argument('--threads', type=int, default=4, help='threads per sync worker')
+    parser.add_argument('--async-workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--client-procs', type=int, default=max(1, multiprocessing.cpu_count() // 2))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_async_')
+    seeded = os.path.join(tmp, 'seed.db')
+    lists = seed(seeded)
+    servers = [
+        ('sync', ['--workers', str(args.sync_workers), '--threads', str(args.threads)]),
+        ('async', ['--asgi', '--workers', str(args.async_workers)]),
+    ]
+    print('sync: gunicorn %d workers x %d threads; async: hypercorn %d workers; %d client processes'
+          % (args.sync_workers, args.threads, args.async_workers, args.client_procs))
+    print('%6s %12s %10s %9s %9s %9s %8s' % ('server', 'connections', 'req/s', 'p50', 'p99', 'max', 'failed'))
+    try:
+        for connections in args.connections:
+            for name, server_args in servers:
+                db_path = os.path.join(tmp, '%s.db' % name)
+                shutil.copyfile(seeded, db_path)
+                proc, port = start_server(db_path, server_args)
+                try:
+                    r = run_load(port, lists, connections, args)
+                finally:
+                    proc.send_signal(signal.SIGINT)
+                    proc.wait()
+                print('%6s %12d %10.0f %7.1fms %7.1fms %7.1fms %8d' % (
+                    name, connections, r['rps'], r['p50'], r['p99'], r['max'], r['failed']))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark read/write throughput of each database engine profile (flask_app/db_profile.py)
+under N parallel clients.
+
+Run: python bench_db.py [--profiles wal legacy] [--clients 1 4 16] [--seconds 5] [--write-ratio 0.2]
+     python bench_db.py --database-url postgresql://user:pw@host/scratch
+         (benchmarks that database instead of a temp SQLite file; it must be a throwaway
+          database: tables are created and filled with benchmark rows)
+
+Each client is its own process with its own app and connection pool, driving the real API
+through Flask's test client: reads are GET /api/session-lists/<id>, writes move one entry
+with PUT /api/session-lists/<id>/sounds/<entry>/position. Reports reads/s, writes/s, p95
+latency and failed requests (e.g. "database is locked") per profile and client count.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+N_SOUNDS = 500
+LIST_SIZE = 100
+
+
+def seed(max_clients):
+    from flask_app import app, db
+    from flask_app.models import Category, SessionList, SessionListSound, Sound, User
+    from flask_app.list_order import ORDER_GAP
+
+    with app.app_context():
+        db.create_all()
+        cat = Category(name='Bench', slug='bench-%d' % time.time_ns(), sort_order=0)
+        db.session.add(cat)
+        db.session.flush()
+        db.session.execute(Sound.__table__.insert(), [
+            {'name': 'Bench Sound %d' % i, 'category_id': cat.id, 'file_path': 'bench/%d.wav' % i, 'is_active': True}
+            for i in range(N_SOUNDS)
+        ])
+        sound_ids = [sid for (sid,) in db.session.query(Sound.id).filter_by(category_id=cat.id)]
+        lists = []
+        for n in range(max_clients):
+            user = User(email='bench-%d-%d@example.com' % (n, time.time_ns()), first_name='Bench', last_name=str(n), password_hash='!')
+            db.session.add(user)
+            db.session.flush()
+            lst = SessionList(user_id=user.id, name='Bench %d' % n)
+            db.session.add(lst)
+            db.session.flush()
+            db.session.execute(SessionListSound.__table__.insert(), [
+                {'session_list_id': lst.id, 'sound_id': sid, 'sort_order': i * ORDER_GAP}
+                for i, sid in enumerate(random.sample(sound_ids, LIST_SIZE))
+            ])
+            entry_ids = [eid for (eid,) in db.session.query(SessionListSound.id).filter_by(session_list_id=lst.id)]
+            lists.append((user.id, lst.id, entry_ids))
+        db.session.commit()
+        db.engine.dispose()
+    return lists
+
+
+def client(user_id, list_id, entry_ids, deadline, write_ratio, results):
+    from flask_app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # never reuse connections inherited from the parent
+    rng = random.Random(user_id)
+    c = app.test_client()
+    with c.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+    reads, writes, failed = [], [], 0
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        if rng.random() < write_ratio:
+            entry_id, after_id = rng.sample(entry_ids, 2)
+            r = c.put('/api/session-lists/%d/sounds/%d/position' % (list_id, entry_id), json={'after_id': after_id})
+            samples = writes
+        else:
+            r = c.get('/api/session-lists/%d' % list_id)
+            samples = reads
+        if r.status_code != 200:
+            failed += 1
+            continue
+        samples.append(time.perf_counter() - t0)
+    results.put((reads, writes, failed))
+
+
+def p95(samples):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+
+
+def run_profile(profile, client_counts, seconds, write_ratio):
+    lists = seed(max(client_counts))
+    ctx = multiprocessing.get_context('fork')
+    print('\nprofile %s (%s)' % (profile, os.environ['DATABASE_URL'].split('@')[-1]))
+    print('%8s %10s %10s %10s %10s %8s' % ('clients', 'reads/s', 'read p95', 'writes/s', 'write p95', 'failed'))
+    for n in client_counts:
+        results = ctx.Queue()
+        deadline = time.time() + seconds
+        procs = [ctx.Process(target=client, args=lists[i] + (deadline, write_ratio, results)) for i in range(n)]
+        for p in procs:
+            p.start()
+        outcome = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        reads = [s for r, _, _ in outcome for s in r]
+        writes = [s for _, w, _ in outcome for s in w]
+        failed = sum(f for _, _, f in outcome)
+        print('%8d %10.0f %8.1fms %10.0f %8.1fms %8d' % (
+            n, len(reads) / seconds, p95(reads), len(writes) / seconds, p95(writes), failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=['wal', 'legacy'])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--database-url', help='benchmark this (throwaway) database instead of a temp SQLite file')
+    parser.add_argument('--run-profile', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        run_profile(args.run_profile, args.clients, args.seconds, args.write_ratio)
+        return
+    # flask_app reads DATABASE_URL and DB_PROFILE at import time, so each profile runs in its own process.
+    profiles = args.profiles if not args.database_url else ['server']
+    for profile in profiles:
+        url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench_db_'), 'bench.db')
+        env = dict(os.environ, DATABASE_URL=url, DB_PROFILE='wal' if profile == 'server' else profile)
+        cmd = [sys.executable, __file__, '--run-profile', profile, '--seconds', str(args.seconds),
+               '--write-ratio', str(args.write_ratio), '--clients'] + [str(n) for n in args.clients]
+        subprocess.run(cmd, env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
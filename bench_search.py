@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark sound search: FTS5 index (flask_app/search.py) vs the old Sound.name ILIKE '%q%'.
+
+Run: python bench_search.py [--sizes 10000 100000] [--repeat 20]
+
+Builds a throwaway SQLite database per size in a temp directory (never touches
+instance/dnd_sfx.db), fills it with generated sounds and variants, builds the
+search index and prints median / p95 latency per query for both strategies.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = (
+    'sword slash stab arrow hit axe shield block metal impact fireball heal teleport frost '
+    'lightning water spell tavern crowd rain dungeon echo dragon roar wolf howl goblin ogre '
+    'zombie spectral breath door lock prison keys carriage horse plates breaking beer pouring '
+    'knight battle scream growl whoosh chime fanfare click quest level'
+).split()
+QUERIES = ('sword', 'sw', 'metal impact', 'gob', 'dragon roar', 'water spell', 'zzz')
+
+
+def build_database(path, n_sounds, seed=1):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from flask_app import app, db
+    from flask_app.models import Category, Sound, SoundVariant
+    from flask_app.search import rebuild_index
+
+    rng = random.Random(seed)
+    with app.app_context():
+        db.create_all()
+        cats = [Category(name=n.title(), slug=n, sort_order=i) for i, n in enumerate(('combat', 'magic', 'ambience', 'creatures'))]
+        db.session.add_all(cats)
+        db.session.flush()
+        sounds = []
+        for i in range(n_sounds):
+            cat = rng.choice(cats)
+            name = ' '.join(rng.sample(WORDS, 3)).title() + f' {i}'
+            sounds.append({'name': name, 'category_id': cat.id, 'file_path': f'{cat.slug}/{name}.wav', 'is_active': True})
+        db.session.execute(Sound.__table__.insert(), sounds)
+        variants = [
+            {'sound_id': sid, 'file_path': f'v/{sid}/{k}.wav', 'label': f'{rng.choice(WORDS).title()} {k}', 'sort_order': k}
+            for sid in range(1, n_sounds + 1) for k in range(rng.randint(0, 3))
+        ]
+        if variants:
+            db.session.execute(SoundVariant.__table__.insert(), variants)
+        t0 = time.perf_counter()
+        rebuild_index()
+        db.session.commit()
+        return app, time.perf_counter() - t0
+
+
+def time_query(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def bench(n_sounds, repeat):
+    tmp = tempfile.mkdtemp(prefix='bench_search_')
+    app, build_s = build_database(os.path.join(tmp, 'bench.db'), n_sounds)
+    from flask_app import db
+    from flask_app.models import Sound
+    from flask_app.search import search_sound_ids
+
+    print(f'\n{n_sounds} sounds (index build {build_s:.2f}s)')
+    print(f'{"query":<14} {"ilike med":>10} {"ilike p95":>10} {"fts med":>9} {"fts p95":>9} {"hits":>7}')
+    with app.app_context():
+        for q in QUERIES:
+            ilike = lambda: db.session.query(Sound.id).filter(Sound.name.ilike(f'%{q}%')).order_by(Sound.name).all()
+            fts = lambda: search_sound_ids(q)
+            i_med, i_p95 = time_query(ilike, repeat)
+            f_med, f_p95 = time_query(fts, repeat)
+            print(f'{q:<14} {i_med:>8.2f}ms {i_p95:>8.2f}ms {f_med:>7.2f}ms {f_p95:>7.2f}ms {len(fts()):>7}')
+        db.session.remove()
+        db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for n in args.sizes:
+        # flask_app binds DATABASE_URL at import time, so each size runs in its own process.
+        if len(args.sizes) > 1:
+            subprocess.run([sys.executable, __file__, '--sizes', str(n), '--repeat', str(args.repeat)], check=True)
+        else:
+            bench(n, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
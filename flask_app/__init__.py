@@ -1,11 +1,13 @@
 """D&D SFX App - Flask application and config."""
 import os
 from datetime import timedelta
-from flask import Flask
+from flask import Flask, request
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 
+from flask_app import db_profile, metrics
+
 _basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 _env_path = os.path.join(_basedir, '.env')
 try:
@@ -22,6 +24,9 @@ os.makedirs(instance_path, exist_ok=True)
 db_path = os.path.join(instance_path, 'dnd_sfx.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Engine profile: SQLite pragmas or server pool sizing (see flask_app/db_profile.py).
+app.config['DB_PROFILE'] = os.getenv('DB_PROFILE', 'wal')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_profile.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -34,8 +39,42 @@ app.config['MAIL_USE_SSL'] = os.getenv('MAIL_USE_SSL', 'false').lower() in ('1',
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', '') or os.getenv('MAIL_USERNAME', 'noreply@example.com')
+# Compressed renditions of the audio masters (sync_sounds.py --transcode, see flask_app/transcode.py).
+app.config['AUDIO_RENDITIONS'] = os.getenv('AUDIO_RENDITIONS', 'aac:96,opus:64')
+app.config['AUDIO_DEFAULT_RENDITION'] = os.getenv('AUDIO_DEFAULT_RENDITION', 'aac')
+app.config['AUDIO_TRANSCODE_ON_SYNC'] = os.getenv('AUDIO_TRANSCODE_ON_SYNC', 'false').lower() in ('1', 'true', 'yes')
+# Let a front proxy send audio bytes (see flask_app/routes_audio.py).
+app.config['USE_X_SENDFILE'] = os.getenv('AUDIO_X_SENDFILE', 'false').lower() in ('1', 'true', 'yes')
+app.config['AUDIO_ACCEL_REDIRECT'] = os.getenv('AUDIO_ACCEL_REDIRECT', '')
+# Live broadcast: a trigger plays this many ms after the DM's tap, on every device (flask_app/broadcast.py).
+app.config['BROADCAST_LEAD_MS'] = int(os.getenv('BROADCAST_LEAD_MS', '350'))
+# How often a worker with listeners reads triggers published by other workers; keep well under the lead.
+app.config['BROADCAST_POLL_MS'] = int(os.getenv('BROADCAST_POLL_MS', '100'))
+# Flask SSE listeners one worker process may hold (each holds a request thread); 0 = no cap. serve.py sets it.
+app.config['BROADCAST_MAX_STREAMS'] = int(os.getenv('BROADCAST_MAX_STREAMS', '0'))
+# Rendered scene mixes kept on disk (flask_app/mixdown.py); oldest are deleted beyond this size.
+app.config['MIXDOWN_CACHE_MB'] = int(os.getenv('MIXDOWN_CACHE_MB', '512'))
+# Session list sprites and their decoded segments (flask_app/sprite.py), each kept within this size.
+app.config['SPRITE_CACHE_MB'] = int(os.getenv('SPRITE_CACHE_MB', '256'))
+# Requests at least this slow are logged with their SQL (flask_app/metrics.py); 0 turns the log off.
+app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', '500'))
 
 db.init_app(app)
+with app.app_context():
+    db_profile.install_sqlite_pragmas(db.engine, db_profile.sqlite_pragmas(app.config['DB_PROFILE']))
+    metrics.install_query_hooks(db.engine)
+
+
+@app.before_request
+def _begin_metrics():
+    metrics.begin_request()
+
+
+@app.after_request
+def _end_metrics(response):
+    metrics.end_request(request.endpoint, request.method, response.status_code, request.path,
+                        app.config['SLOW_REQUEST_MS'])
+    return response
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -62,6 +101,8 @@ def load_user(user_id):
 from flask_app.routes import main_bp
 from flask_app.routes_auth import auth_bp
 from flask_app.routes_api import api_bp
+from flask_app.routes_audio import audio_bp
 app.register_blueprint(main_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(api_bp, url_prefix='/api')
+app.register_blueprint(audio_bp)
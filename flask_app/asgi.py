@@ -0,0 +1,22 @@
+"""D&D SFX App - ASGI entry point.
+
+/api/... is served by the async API (flask_app/async_api.py); every other path (pages,
+auth, audio, static files) by the Flask app on a thread pool.
+
+Run: python serve.py --asgi    (or: hypercorn flask_app.asgi:app)
+"""
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+from flask_app import app as flask_app
+from flask_app.async_api import async_app
+
+API_PREFIX = '/api/'
+
+wsgi_app = AsyncioWSGIMiddleware(flask_app)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan' or scope.get('path', '').startswith(API_PREFIX):
+        await async_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,354 @@
+"""D&D SFX App - Async (ASGI) variant of the API blueprint.
+
+Serves the same /api routes as routes_api.py from a Quart app, with database I/O on an
+asyncio driver (aiosqlite, asyncpg), so one process can hold many concurrent clients
+(polling or live-session tables) without a thread per request. flask_app/asgi.py mounts it
+in front of the Flask app.
+
+The handlers run the same code as the Flask API (flask_app/session_lists.py and the
+catalog snapshot) through AsyncSession.run_sync, with db.session bound to that session,
+so responses are byte-for-byte the same. Sign-in is read from the Flask session (and
+remember-me) cookies; logging in and out stays on the Flask side.
+"""
+import asyncio
+from functools import wraps
+
+from flask_login.utils import decode_cookie
+from quart import Blueprint, Quart, Response, abort, redirect, request, session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from flask_app import app as flask_app
+from flask_app import db, db_profile
+from flask_app import broadcast, metrics, mixdown, peaks, session_lists, similarity
+from flask_app.catalog import catalog_response, document_response, get_snapshot
+from flask_app.models import User
+from flask_app.routes_api import SSE_HEADERS, peaks_response, sound_detail
+
+UNAUTHORIZED = ({'error': 'Authentication required'}, 401)
+
+_uri = flask_app.config['SQLALCHEMY_DATABASE_URI']
+engine = create_async_engine(db_profile.async_database_uri(_uri), **flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+db_profile.install_sqlite_pragmas(engine.sync_engine, db_profile.sqlite_pragmas(flask_app.config['DB_PROFILE']))
+metrics.install_query_hooks(engine.sync_engine)
+
+async_api_bp = Blueprint('async_api_bp', __name__)
+
+
+def _bound_call(sync_session, fn, args):
+    with flask_app.app_context():
+        db.session.registry.set(sync_session)
+        try:
+            return fn(*args)
+        finally:
+            # Unbind before the context pops, so its teardown does not close our session.
+            db.session.registry.clear()
+
+
+async def run_db(fn, *args):
+    """Run fn(*args), sync code written against db.session, on a pooled async connection."""
+    async with AsyncSession(engine) as s:
+        return await s.run_sync(_bound_call, fn, args)
+
+
+def _json(result):
+    payload, status = result
+    # Flask's JSON provider, so bodies match jsonify() in routes_api.py exactly.
+    body = flask_app.json.response(payload).get_data()
+    return Response(body, status=status, mimetype='application/json')
+
+
+async def _json_body():
+    """The JSON body or {}; non-JSON bodies get Flask's 415, as request.get_json() does there."""
+    if not request.is_json:
+        abort(415, "Did not attempt to load JSON data because the request Content-Type was not 'application/json'.")
+    return await request.get_json() or {}
+
+
+def _session_user_id():
+    user_id = session.get('_user_id')
+    if user_id is None and session.get('_remember') != 'clear':
+        cookie = request.cookies.get(flask_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+        if cookie:
+            with flask_app.app_context():
+                user_id = decode_cookie(cookie)
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_user(op, user_id, *args):
+    # Same check as the Flask user_loader: the account must still exist.
+    if db.session.get(User, user_id) is None:
+        return UNAUTHORIZED
+    return op(user_id, *args)
+
+
+def login_required(view):
+    """Pass the signed-in user's id to view as its first argument; 401 JSON otherwise."""
+    @wraps(view)
+    async def wrapped(*args, **kwargs):
+        user_id = _session_user_id()
+        if user_id is None:
+            return _json(UNAUTHORIZED)
+        return await view(user_id, *args, **kwargs)
+    return wrapped
+
+
+async def call_as_user(op, user_id, *args):
+    return _json(await run_db(_as_user, op, user_id, *args))
+
+
+async def _in_thread(chunks):
+    """Iterate a blocking generator off the event loop (mixdown renders are CPU and file bound)."""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await asyncio.to_thread(chunks.close)
+
+
+def _list_scene(user_id, list_id, args):
+    if db.session.get(User, user_id) is None:
+        return None, UNAUTHORIZED
+    return mixdown.prepare(mixdown.scene_for_list, user_id, list_id, args)
+
+
+def _request_scene(user_id, data):
+    if db.session.get(User, user_id) is None:
+        return None, UNAUTHORIZED
+    return mixdown.prepare(mixdown.scene_from_request, data)
+
+
+def _mix_response(prepared):
+    scene, error = prepared
+    if error:
+        return _json(error)
+    if scene.cached():
+        return redirect(scene.url, 303)
+    resp = Response(_in_thread(metrics.counted(mixdown.render(scene), 'mix')), mimetype=scene.mime_type,
+                    headers=mixdown.stream_headers(scene))
+    resp.timeout = None  # long scenes take longer than Quart's default response timeout
+    return resp
+
+
+@async_api_bp.route('/catalog', methods=['GET'])
+async def get_catalog():
+    snap = await run_db(get_snapshot)
+    return document_response(snap, request, Response)
+
+
+# ---- Categories ----
+@async_api_bp.route('/categories', methods=['GET'])
+async def list_categories():
+    snap = await run_db(get_snapshot)
+    return catalog_response(snap, ('categories',), lambda: {'categories': snap.categories}, request, Response)
+
+
+# ---- Sounds ----
+@async_api_bp.route('/sounds', methods=['GET'])
+async def list_sounds():
+    category_id = request.args.get('category_id', type=int)
+    search = (request.args.get('q') or '').strip()
+    req = request._get_current_object()
+
+    def respond():
+        # Inside run_db: a search query's first response runs the search on db.session.
+        snap = get_snapshot()
+        return catalog_response(
+            snap,
+            ('sounds', category_id or None, search),
+            lambda: {'sounds': snap.filter_sounds(category_id, search)},
+            req,
+            Response,
+        )
+    return await run_db(respond)
+
+
+@async_api_bp.route('/sounds/<int:sound_id>', methods=['GET'])
+async def get_sound(sound_id):
+    return _json(await run_db(sound_detail, sound_id))
+
+
+@async_api_bp.route('/sounds/<int:sound_id>/peaks', methods=['GET'])
+async def get_sound_peaks(sound_id):
+    args = request.args
+    level, error = await run_db(peaks.prepare, sound_id, args.get('variant', type=int), args.get('points', type=int))
+    if error:
+        return _json(error)
+    return peaks_response(level, request.if_none_match, Response)
+
+
+@async_api_bp.route('/sounds/<int:sound_id>/similar', methods=['GET'])
+async def get_similar_sounds(sound_id):
+    args = request.args
+    return _json(await run_db(similarity.similar, sound_id, args.get('variant', type=int), args.get('limit', type=int)))
+
+
+@async_api_bp.route('/mixdown', methods=['POST'])
+@login_required
+async def render_mixdown(user_id):
+    data = await _json_body()
+    return _mix_response(await run_db(_request_scene, user_id, data))
+
+
+# ---- Session lists (require login) ----
+@async_api_bp.route('/session-lists', methods=['GET'])
+@login_required
+async def list_session_lists(user_id):
+    return await call_as_user(session_lists.list_all, user_id)
+
+
+@async_api_bp.route('/session-lists/summary', methods=['GET'])
+@login_required
+async def list_session_list_summaries(user_id):
+    return await call_as_user(session_lists.summaries, user_id)
+
+
+@async_api_bp.route('/session-lists', methods=['POST'])
+@login_required
+async def create_session_list(user_id):
+    return await call_as_user(session_lists.create, user_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>', methods=['GET'])
+@login_required
+async def get_session_list(user_id, list_id):
+    return await call_as_user(session_lists.get, user_id, list_id)
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/manifest', methods=['GET'])
+@login_required
+async def get_session_list_manifest(user_id, list_id):
+    return await call_as_user(session_lists.manifest, user_id, list_id)
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/mixdown', methods=['GET'])
+@login_required
+async def get_session_list_mixdown(user_id, list_id):
+    return _mix_response(await run_db(_list_scene, user_id, list_id, request.args.to_dict()))
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sprite', methods=['GET'])
+@login_required
+async def get_session_list_sprite(user_id, list_id):
+    return await call_as_user(session_lists.sprite_map, user_id, list_id, request.args.get('format'))
+
+
+@async_api_bp.route('/session-lists/<int:list_id>', methods=['PUT'])
+@login_required
+async def update_session_list(user_id, list_id):
+    return await call_as_user(session_lists.update, user_id, list_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>', methods=['DELETE'])
+@login_required
+async def delete_session_list(user_id, list_id):
+    return await call_as_user(session_lists.delete, user_id, list_id)
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sounds', methods=['POST'])
+@login_required
+async def add_sound_to_session_list(user_id, list_id):
+    return await call_as_user(session_lists.add_sound, user_id, list_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sounds/<int:sound_id>', methods=['DELETE'])
+@login_required
+async def remove_sound_from_session_list(user_id, list_id, sound_id):
+    return await call_as_user(
+        session_lists.remove_sound, user_id, list_id, sound_id, request.args.get('variant_id', type=int),
+    )
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sounds/batch', methods=['POST'])
+@login_required
+async def batch_update_session_list_sounds(user_id, list_id):
+    return await call_as_user(session_lists.batch, user_id, list_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sounds/reorder', methods=['PUT'])
+@login_required
+async def reorder_session_list_sounds(user_id, list_id):
+    return await call_as_user(session_lists.reorder, user_id, list_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/sounds/<int:entry_id>/position', methods=['PUT'])
+@login_required
+async def move_session_list_sound(user_id, list_id, entry_id):
+    return await call_as_user(session_lists.move, user_id, list_id, entry_id, await _json_body())
+
+
+# ---- Live broadcast: listeners are tasks on this loop, so a room can hold hundreds ----
+@async_api_bp.route('/session-lists/<int:list_id>/broadcast', methods=['GET'])
+@login_required
+async def get_broadcast(user_id, list_id):
+    return await call_as_user(broadcast.status, user_id, list_id)
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/broadcast/play', methods=['POST'])
+@login_required
+async def broadcast_play(user_id, list_id):
+    return await call_as_user(broadcast.play, user_id, list_id, await _json_body())
+
+
+@async_api_bp.route('/session-lists/<int:list_id>/broadcast', methods=['DELETE'])
+@login_required
+async def stop_broadcast(user_id, list_id):
+    return await call_as_user(broadcast.stop, user_id, list_id)
+
+
+@async_api_bp.route('/broadcast/time', methods=['GET'])
+async def broadcast_time():
+    # No database: answered straight from the loop, which keeps round trips short for the offset estimate.
+    resp = _json(broadcast.clock())
+    resp.cache_control.no_store = True
+    return resp
+
+
+@async_api_bp.route('/broadcast/<token>', methods=['GET'])
+async def broadcast_room(token):
+    return _json(await run_db(broadcast.room, token))
+
+
+@async_api_bp.route('/broadcast/<token>/events', methods=['GET'])
+async def broadcast_events(token):
+    with flask_app.app_context():
+        list_id = broadcast.list_id_for_token(token)
+    if list_id is None:
+        return _json(broadcast.NOT_FOUND)
+    last_id = broadcast.last_event_id(request.headers.get('Last-Event-ID'))
+    backlog = await run_db(broadcast.replay, list_id, last_id)
+    resp = Response(broadcast.stream_async(list_id, backlog), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+    resp.timeout = None  # the stream stays open until the listener leaves
+    return resp
+
+
+async_app = Quart(__name__)
+# Same key and cookie settings as the Flask app: its session cookie is read (and refreshed) here.
+async_app.secret_key = flask_app.config['SECRET_KEY']
+for _key in ('SESSION_COOKIE_NAME', 'SESSION_COOKIE_HTTPONLY', 'SESSION_COOKIE_SAMESITE', 'SESSION_COOKIE_SECURE',
+             'PERMANENT_SESSION_LIFETIME'):
+    async_app.config[_key] = flask_app.config[_key]
+async_app.register_blueprint(async_api_bp, url_prefix='/api')
+
+
+@async_app.before_request
+async def _begin_metrics():
+    metrics.begin_request()
+
+
+@async_app.after_request
+async def _end_metrics(response):
+    metrics.end_request(request.endpoint, request.method, response.status_code, request.path,
+                        flask_app.config['SLOW_REQUEST_MS'])
+    return response
+
+
+@async_app.after_serving
+async def _close_engine():
+    await engine.dispose()
@@ -0,0 +1,280 @@
+"""D&D SFX App - Read audio metadata from file headers (no decoding, no external tools).
+
+probe_file() returns duration, sample rate, channel count, codec and bit rate for the
+formats in sync_sounds.ALLOWED_EXT (.wav, .ogg, .mp3, .m4a). Only headers and, for Ogg,
+the last page are read, so probing a file costs a few small reads regardless of length.
+"""
+import os
+import struct
+
+# Bytes read from the end of an Ogg file to find the last page (max page size is ~64 KB).
+OGG_TAIL_BYTES = 65307
+
+_WAV_CODECS = {1: 'pcm', 2: 'adpcm_ms', 3: 'pcm_f', 6: 'pcm_alaw', 7: 'pcm_mulaw', 0x11: 'adpcm_ima', 0x55: 'mp3'}
+
+# MPEG audio tables: bitrates (kbps) by [mpeg1?][layer][index], sample rates by version.
+_MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+class ProbeError(ValueError):
+    """File is not in a format this module understands (or is truncated)."""
+
+
+def _result(duration, sample_rate, channels, codec, bit_rate):
+    return {
+        'duration_seconds': round(duration, 3) if duration is not None else None,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'codec': codec,
+        'bit_rate': int(bit_rate) if bit_rate else None,
+    }
+
+
+def probe_wav(f, size):
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ProbeError('not a RIFF/WAVE file')
+    fmt = None
+    data_size = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'fmt ':
+            fmt = f.read(min(chunk_size, 40))
+            f.seek(chunk_size - len(fmt) + (chunk_size & 1), os.SEEK_CUR)
+        elif chunk_id == b'data':
+            # Streaming writers leave 0 or 0xFFFFFFFF here; the rest of the file is the data.
+            data_size = min(chunk_size, size - f.tell()) if chunk_size else size - f.tell()
+            if fmt is not None:
+                break
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    if fmt is None or len(fmt) < 16:
+        raise ProbeError('missing fmt chunk')
+    tag, channels, sample_rate, byte_rate, _block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == 0xFFFE and len(fmt) >= 26:  # WAVE_FORMAT_EXTENSIBLE: real tag starts the SubFormat GUID
+        tag = struct.unpack('<H', fmt[24:26])[0]
+    codec = _WAV_CODECS.get(tag, 'wav_0x%04x' % tag)
+    if codec == 'pcm':
+        codec = 'pcm_u8' if bits == 8 else 'pcm_s%dle' % bits
+    elif codec == 'pcm_f':
+        codec = 'pcm_f%dle' % bits
+    duration = data_size / byte_rate if byte_rate and data_size is not None else None
+    return _result(duration, sample_rate, channels, codec, byte_rate * 8)
+
+
+def probe_ogg(f, size):
+    page = f.read(27)
+    if len(page) < 27 or page[:4] != b'OggS':
+        raise ProbeError('not an Ogg file')
+    segments = page[26]
+    lacing = f.read(segments)
+    packet = f.read(min(sum(lacing), 64))
+    if packet.startswith(b'\x01vorbis') and len(packet) >= 28:
+        codec = 'vorbis'
+        channels = packet[11]
+        sample_rate, _max_br, nominal_br = struct.unpack('<IiI', packet[12:24])
+        granule_rate, pre_skip = sample_rate, 0
+    elif packet.startswith(b'OpusHead') and len(packet) >= 19:
+        codec = 'opus'
+        channels = packet[9]
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+        sample_rate = struct.unpack('<I', packet[12:16])[0] or 48000
+        granule_rate, nominal_br = 48000, 0  # Opus granule positions always count 48 kHz samples
+    elif packet.startswith(b'\x7fFLAC') and len(packet) >= 29:
+        codec = 'flac'
+        info = struct.unpack('>Q', packet[27:35].ljust(8, b'\0'))[0] if len(packet) >= 35 else 0
+        sample_rate = info >> 44
+        channels = ((info >> 41) & 0x7) + 1
+        granule_rate, pre_skip, nominal_br = sample_rate, 0, 0
+    else:
+        raise ProbeError('unsupported Ogg codec')
+    f.seek(max(0, size - OGG_TAIL_BYTES))
+    tail = f.read()
+    last = tail.rfind(b'OggS')
+    duration = None
+    if last != -1 and last + 14 <= len(tail) and granule_rate:
+        granule = struct.unpack('<q', tail[last + 6:last + 14])[0]
+        if granule > 0:
+            duration = max(0, granule - pre_skip) / granule_rate
+    bit_rate = nominal_br if nominal_br > 0 else (size * 8 / duration if duration else None)
+    return _result(duration, sample_rate, channels, codec, bit_rate)
+
+
+def _skip_id3v2(f):
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b'ID3':
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        footer = 10 if header[5] & 0x10 else 0
+        return 10 + tag_size + footer
+    return 0
+
+
+def _parse_mp3_header(b):
+    """Decode a 4-byte MPEG audio frame header; None if it is not a valid one."""
+    if len(b) < 4 or b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = (b[1] >> 3) & 0x3
+    layer = 4 - ((b[1] >> 1) & 0x3)
+    bitrate_index = b[2] >> 4
+    sr_index = (b[2] >> 2) & 0x3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sr_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sr_index]
+    padding = (b[2] >> 1) & 0x1
+    channels = 1 if (b[3] >> 6) == 3 else 2
+    if layer == 1:
+        samples, frame_len = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        frame_len = (samples // 8) * bitrate // sample_rate + padding
+    return {
+        'mpeg1': mpeg1, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'channels': channels, 'samples': samples, 'frame_len': frame_len,
+    }
+
+
+def probe_mp3(f, size):
+    start = _skip_id3v2(f)
+    f.seek(start)
+    buf = f.read(64 * 1024)
+    frame = None
+    pos = 0
+    while True:
+        pos = buf.find(b'\xff', pos)
+        if pos == -1 or pos + 4 > len(buf):
+            raise ProbeError('no MPEG audio frame found')
+        frame = _parse_mp3_header(buf[pos:pos + 4])
+        # Require the next frame to line up too, so stray 0xFF bytes are not mistaken for a header.
+        if frame and (pos + frame['frame_len'] + 4 > len(buf)
+                      or _parse_mp3_header(buf[pos + frame['frame_len']:pos + frame['frame_len'] + 4])):
+            break
+        pos += 1
+    audio_start = start + pos
+    codec = 'mp%d' % frame['layer']
+    # Xing/Info (VBR or LAME CBR) header sits after the side info; VBRI at a fixed offset of 32.
+    side_info = (32 if frame['channels'] == 2 else 17) if frame['mpeg1'] else (17 if frame['channels'] == 2 else 9)
+    xing = buf[pos + 4 + side_info:pos + 4 + side_info + 12]
+    frames = None
+    if xing[:4] in (b'Xing', b'Info') and struct.unpack('>I', xing[4:8])[0] & 0x1:
+        frames = struct.unpack('>I', xing[8:12])[0]
+    elif buf[pos + 36:pos + 40] == b'VBRI':
+        frames = struct.unpack('>I', buf[pos + 50:pos + 54])[0]
+    audio_bytes = size - audio_start
+    f.seek(max(0, size - 128))
+    if f.read(3) == b'TAG':
+        audio_bytes -= 128
+    if frames:
+        duration = frames * frame['samples'] / frame['sample_rate']
+        bit_rate = audio_bytes * 8 / duration if duration else frame['bitrate']
+    else:
+        duration = audio_bytes * 8 / frame['bitrate']
+        bit_rate = frame['bitrate']
+    return _result(duration, frame['sample_rate'], frame['channels'], codec, bit_rate)
+
+
+def _iter_atoms(f, end):
+    """Yield (type, payload_offset, payload_size) for the atoms between f.tell() and end."""
+    pos = f.tell()
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        atom_size, atom_type = struct.unpack('>I4s', header)
+        header_len = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', f.read(8))[0]
+            header_len = 16
+        elif atom_size == 0:
+            atom_size = end - pos
+        if atom_size < header_len:
+            return
+        yield atom_type, pos + header_len, atom_size - header_len
+        pos += atom_size
+
+
+def _find_atom(f, start, end, path):
+    for atom_type, offset, length in _iter_atoms(_seek(f, start), end):
+        if atom_type == path[0]:
+            if len(path) == 1:
+                return offset, length
+            return _find_atom(f, offset, offset + length, path[1:])
+    return None
+
+
+def _seek(f, pos):
+    f.seek(pos)
+    return f
+
+
+def probe_mp4(f, size):
+    f.seek(4)
+    if f.read(4) != b'ftyp':
+        raise ProbeError('not an MP4/M4A file')
+    moov = _find_atom(f, 0, size, (b'moov',))
+    if not moov:
+        raise ProbeError('missing moov atom')
+    mvhd = _find_atom(f, moov[0], moov[0] + moov[1], (b'mvhd',))
+    duration = None
+    if mvhd:
+        f.seek(mvhd[0])
+        data = f.read(32)
+        if data[0] == 1:
+            timescale, length = struct.unpack('>IQ', data[20:32])
+        else:
+            timescale, length = struct.unpack('>II', data[12:20])
+        duration = length / timescale if timescale else None
+    codec = sample_rate = channels = None
+    for atom_type, offset, length in _iter_atoms(_seek(f, moov[0]), moov[0] + moov[1]):
+        if atom_type != b'trak':
+            continue
+        stsd = _find_atom(f, offset, offset + length, (b'mdia', b'minf', b'stbl', b'stsd'))
+        if not stsd:
+            continue
+        f.seek(stsd[0])
+        # stsd: version/flags(4) entry_count(4), then the first sample entry (size, format, ...).
+        entry = f.read(8 + 36)
+        if len(entry) < 44:
+            continue
+        fmt = entry[12:16]
+        if fmt not in (b'mp4a', b'alac', b'Opus', b'fLaC', b'.mp3', b'ac-3', b'ec-3'):
+            continue
+        codec = {b'mp4a': 'aac', b'.mp3': 'mp3', b'Opus': 'opus', b'fLaC': 'flac', b'ac-3': 'ac3', b'ec-3': 'eac3'}.get(
+            fmt, fmt.decode('latin-1'))
+        channels = struct.unpack('>H', entry[32:34])[0]
+        sample_rate = struct.unpack('>I', entry[40:44])[0] >> 16
+        break
+    if codec is None:
+        raise ProbeError('no audio track')
+    bit_rate = size * 8 / duration if duration else None
+    return _result(duration, sample_rate, channels, codec, bit_rate)
+
+
+_PROBES = {'.wav': probe_wav, '.ogg': probe_ogg, '.opus': probe_ogg, '.mp3': probe_mp3, '.m4a': probe_mp4}
+
+
+def probe_file(path):
+    """Metadata dict for one file, or {} when its format is unsupported or the header is broken."""
+    probe = _PROBES.get(os.path.splitext(path)[1].lower())
+    if probe is None:
+        return {}
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            return probe(f, size)
+    except (OSError, ProbeError, struct.error, IndexError, ZeroDivisionError):
+        return {}
@@ -0,0 +1,454 @@
+"""D&D SFX App - Live broadcast rooms: the DM fires a sound, every player device plays it.
+
+Each session list has one room, joined through a signed token (the /listen/<token> link).
+Players hold a server-sent events stream open; a trigger becomes one SSE frame, encoded
+once and pushed to every listener's queue, carrying play_at (server clock, epoch ms) a
+little in the future. Clients estimate their offset to the server clock from
+/api/broadcast/time and start the sound at play_at on their own clock (broadcast.js).
+
+Listeners of one room may be connected to different worker processes. A trigger is
+written to the broadcast_events table (its row id is the SSE event id) and delivered
+straight to the publishing process's own listeners. In every other process that has
+listeners, a poller thread reads new rows every BROADCAST_POLL_MS and fans them out.
+That is well inside the lead time. While a process has listeners it also records how
+many per room in broadcast_listeners, so listener counts cover every worker. A
+reconnecting listener (Last-Event-ID) gets the room's not-yet-due events replayed from
+the table, whichever worker it lands on. SQLite hands out row ids in commit order (one
+writer at a time), so reading rows past the last id seen never skips one; on other
+databases a lower id can commit later, so the poller re-checks skipped ids for
+GAP_WAIT_SECONDS.
+
+Listeners may be threads (Flask) or asyncio tasks (async_api.py). Under gunicorn each one
+holds a request thread, so serve.py caps them per worker (BROADCAST_MAX_STREAMS; the
+rest get 503 and retry); `serve.py --asgi` holds hundreds per worker.
+
+Like session_lists.py, the operations return (payload, status) for both APIs.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from flask_app import db
+from flask_app import session_lists
+from flask_app.models import (
+    BroadcastEvent, BroadcastListener, Sound, SoundVariant, SessionList, SessionListSound, playback_urls,
+)
+
+# Frames a listener may fall behind by before it is disconnected (it reconnects and catches up).
+MAX_PENDING = 64
+# Most recent events of a room replayed to a reconnecting listener (Last-Event-ID) if not yet due.
+RECENT_EVENTS = 16
+# Events kept in broadcast_events; older rows are deleted every PRUNE_EVERY publishes.
+KEEP_EVENTS = 1000
+PRUNE_EVERY = 100
+HEARTBEAT_SECONDS = 15
+# A worker refreshes its listener counts this often; counts older than PRESENCE_TTL_MS are ignored.
+PRESENCE_SECONDS = 5
+PRESENCE_TTL_MS = 3 * PRESENCE_SECONDS * 1000
+RETRY_MS = 2000
+# Outside SQLite, event ids skipped by a poll (a transaction still open) are looked for this long.
+GAP_WAIT_SECONDS = 2
+MAX_GAPS = 100
+PING = b': ping\n\n'
+
+NOT_FOUND = ({'error': 'Broadcast not found'}, 404)
+BUSY = ({'error': 'Too many listeners on this server process; retrying'}, 503)
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def sse_frame(seq, event_type, data):
+    return ('id: %d\nevent: %s\ndata: %s\n\n' % (seq, event_type, json.dumps(data, separators=(',', ':')))).encode()
+
+
+def _event_frame(row):
+    return sse_frame(row.id, row.event_type, dict(json.loads(row.data), id=row.id))
+
+
+class Subscriber:
+    """One listener: a thread queue, or an asyncio queue owned by loop."""
+
+    def __init__(self, list_id, loop=None):
+        self.list_id = list_id
+        self.loop = loop
+        self.queue = asyncio.Queue(MAX_PENDING) if loop else queue.Queue(MAX_PENDING)
+        self.dropped = False
+
+    def put(self, frame):
+        """Queue frame. A listener that has fallen behind gets None instead: its stream ends."""
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except (queue.Full, asyncio.QueueFull):
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+def _deliver(subscribers, frame):
+    for sub in subscribers:
+        sub.put(frame)
+
+
+class Room:
+    def __init__(self):
+        self.threaded = set()
+        self.by_loop = {}  # loop -> set of Subscribers
+
+    def __len__(self):
+        return len(self.threaded) + sum(len(subs) for subs in self.by_loop.values())
+
+
+class LocalBroker:
+    """In-process fan-out hub. deliver() hands an encoded frame to every listener of a room:
+    directly for thread queues, with one call_soon_threadsafe per event loop for asyncio ones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+    def subscribe(self, list_id, loop=None):
+        sub = Subscriber(list_id, loop)
+        with self._lock:
+            room = self._rooms.setdefault(list_id, Room())
+            if loop is None:
+                room.threaded.add(sub)
+            else:
+                room.by_loop.setdefault(loop, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            room = self._rooms.get(sub.list_id)
+            if room is None:
+                return
+            if sub.loop is None:
+                room.threaded.discard(sub)
+            else:
+                subs = room.by_loop.get(sub.loop, set())
+                subs.discard(sub)
+                if not subs:
+                    room.by_loop.pop(sub.loop, None)
+            if not len(room):
+                del self._rooms[sub.list_id]
+
+    def listeners(self, list_id):
+        with self._lock:
+            room = self._rooms.get(list_id)
+            return len(room) if room else 0
+
+    def rooms(self):
+        """{list_id: listener count} of every room with a listener in this process."""
+        with self._lock:
+            return {list_id: len(room) for list_id, room in self._rooms.items()}
+
+    def threaded_listeners(self):
+        with self._lock:
+            return sum(len(room.threaded) for room in self._rooms.values())
+
+    def deliver(self, list_id, frame):
+        """Send frame to this process's listeners in the room. Returns how many there are."""
+        with self._lock:
+            room = self._rooms.get(list_id)
+            if room is None:
+                return 0
+            threaded = list(room.threaded)
+            by_loop = [(loop, list(subs)) for loop, subs in room.by_loop.items()]
+            count = len(room)
+        _deliver(threaded, frame)
+        for loop, subs in by_loop:
+            try:
+                loop.call_soon_threadsafe(_deliver, subs, frame)
+            except RuntimeError:  # loop closed; its listeners are gone
+                pass
+        return count
+
+
+def commits_in_id_order():
+    """SQLite has one writer at a time, so rows commit in id order. Elsewhere a lower id can
+    commit after a higher one has been read."""
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+
+class SharedBroker:
+    """Rooms spanning every worker process, through broadcast_events (see the module docstring).
+
+    publish(), listeners() and replay() use db.session, so they run where the operations do;
+    the poller thread opens its own app context.
+    """
+
+    def __init__(self):
+        self.local = LocalBroker()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._poller = None
+        self.origin = uuid.uuid4().hex  # this process, in broadcast_events.origin and broadcast_listeners.worker
+
+    def subscribe(self, list_id, loop=None):
+        with self._lock:
+            sub = self.local.subscribe(list_id, loop)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='broadcast-poller', daemon=True)
+                self._poller.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        self.local.unsubscribe(sub)
+
+    def publish(self, list_id, event_type, data, play_at=None):
+        """Record an event and send it to this process's listeners (the pollers of other processes
+        send it to theirs). Returns (event id, listeners in the room)."""
+        row = BroadcastEvent(session_list_id=list_id, event_type=event_type, data=json.dumps(data),
+                             play_at=play_at, origin=self.origin)
+        db.session.add(row)
+        db.session.flush()
+        if row.id % PRUNE_EVERY == 0:
+            BroadcastEvent.query.filter(BroadcastEvent.id <= row.id - KEEP_EVENTS).delete(synchronize_session=False)
+        db.session.commit()
+        self.local.deliver(list_id, _event_frame(row))
+        return row.id, self.listeners(list_id)
+
+    def listeners(self, list_id):
+        """Listeners in the room across processes (other processes' counts up to PRESENCE_SECONDS old)."""
+        others = db.session.query(db.func.sum(BroadcastListener.count)).filter(
+            BroadcastListener.session_list_id == list_id,
+            BroadcastListener.worker != self.origin,
+            BroadcastListener.seen_at > now_ms() - PRESENCE_TTL_MS,
+        ).scalar()
+        return self.local.listeners(list_id) + (others or 0)
+
+    def replay(self, list_id, last_id):
+        """Frames a listener reconnecting after event last_id missed that are not yet due."""
+        if last_id is None:
+            return []
+        rows = (BroadcastEvent.query
+                .filter(BroadcastEvent.session_list_id == list_id, BroadcastEvent.id > last_id)
+                .order_by(BroadcastEvent.id.desc()).limit(RECENT_EVENTS).all())
+        now = now_ms()
+        return [_event_frame(row) for row in reversed(rows) if row.play_at is None or row.play_at > now]
+
+    # ---- Poller: runs while this process has listeners ----
+    def _poll(self):
+        from flask_app import app
+
+        with app.app_context():
+            interval = app.config['BROADCAST_POLL_MS'] / 1000.0
+            recheck_gaps = not commits_in_id_order()
+            gaps = {}  # skipped id -> monotonic time to stop looking for it
+            try:
+                last = db.session.query(db.func.max(BroadcastEvent.id)).scalar() or 0
+                presence_due = 0.0
+                while True:
+                    with self._lock:
+                        rooms = self.local.rooms()
+                        if not rooms:
+                            self._poller = None
+                            break
+                    now = time.monotonic()
+                    new = BroadcastEvent.id > last
+                    rows = (BroadcastEvent.query
+                            .filter(db.or_(new, BroadcastEvent.id.in_(gaps)) if gaps else new)
+                            .order_by(BroadcastEvent.id).all())
+                    for row in rows:
+                        gaps.pop(row.id, None)
+                        if row.id > last:
+                            if recheck_gaps:
+                                for missing in range(max(last + 1, row.id - MAX_GAPS), row.id):
+                                    gaps[missing] = now + GAP_WAIT_SECONDS
+                            last = row.id
+                        if row.origin != self.origin and row.session_list_id in rooms:
+                            self.local.deliver(row.session_list_id, _event_frame(row))
+                    gaps = {i: until for i, until in gaps.items() if until > now}
+                    if now >= presence_due:
+                        self._write_presence(rooms)
+                        presence_due = now + PRESENCE_SECONDS
+                    db.session.commit()  # ends the read transaction, so the next poll sees new rows
+                    time.sleep(interval)
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self._poller = None
+                # Its listeners stop getting other workers' events; the next subscribe starts a new poller.
+                app.logger.exception('Broadcast poller stopped')
+            finally:
+                try:
+                    self._write_presence({})
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                db.session.remove()
+
+    def _write_presence(self, rooms):
+        now = now_ms()
+        BroadcastListener.query.filter(db.or_(
+            BroadcastListener.worker == self.origin, BroadcastListener.seen_at < now - PRESENCE_TTL_MS,
+        )).delete(synchronize_session=False)
+        db.session.add_all([BroadcastListener(session_list_id=list_id, worker=self.origin, count=count, seen_at=now)
+                            for list_id, count in rooms.items()])
+
+
+broker = SharedBroker()
+
+
+# ---- Tokens: signed list ids, so any process can check a link without shared state ----
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='broadcast-room')
+
+
+def room_token(list_id):
+    return _serializer().dumps(list_id)
+
+
+def list_id_for_token(token):
+    try:
+        list_id = _serializer().loads(token)
+    except BadSignature:
+        return None
+    return list_id if isinstance(list_id, int) else None
+
+
+def last_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---- Operations (payload, status) ----
+def _owned(user_id, list_id):
+    return SessionList.query.filter_by(id=list_id, user_id=user_id).first()
+
+
+def status(user_id, list_id):
+    """Room link and listener count for the DM (starting a broadcast is just sharing the link)."""
+    if not _owned(user_id, list_id):
+        return session_lists.NOT_FOUND
+    token = room_token(list_id)
+    return {
+        'token': token,
+        'listen_url': '/listen/' + token,
+        'listeners': broker.listeners(list_id),
+        'lead_ms': current_app.config['BROADCAST_LEAD_MS'],
+    }, 200
+
+
+def play(user_id, list_id, data):
+    """Fire a sound (or one of its variants) of the list on every listener, lead_ms from now.
+
+    Body: {"sound_id", "sound_variant_id"?}. Returns the event with play_at and the listener count.
+    """
+    if not _owned(user_id, list_id):
+        return session_lists.NOT_FOUND
+    try:
+        sound_id = int(data['sound_id'])
+        variant_id = int(data['sound_variant_id']) if data.get('sound_variant_id') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return {'error': 'sound_id required'}, 400
+    in_list = db.session.query(SessionListSound.id).filter_by(session_list_id=list_id, sound_id=sound_id).first()
+    if not in_list:
+        return {'error': 'Sound not in list'}, 404
+    sound = db.session.get(Sound, sound_id)
+    audio, name = sound, sound.name
+    if variant_id is not None:
+        audio = SoundVariant.query.filter_by(id=variant_id, sound_id=sound_id).first()
+        if audio is None:
+            return {'error': 'Variant not found for this sound'}, 400
+        if audio.label:
+            name = '%s – %s' % (sound.name, audio.label)
+    url = playback_urls(audio.file_path, audio.content_hash, audio.renditions)[0]
+    play_at = now_ms() + current_app.config['BROADCAST_LEAD_MS']
+    event = {'url': url, 'name': name, 'sound_id': sound_id, 'sound_variant_id': variant_id, 'play_at': play_at}
+    seq, listeners = broker.publish(list_id, 'play', event, play_at=play_at)
+    return dict(event, id=seq, listeners=listeners), 200
+
+
+def stop(user_id, list_id):
+    """Tell listeners the DM has stopped (their pages stay connected for the next broadcast)."""
+    if not _owned(user_id, list_id):
+        return session_lists.NOT_FOUND
+    seq, listeners = broker.publish(list_id, 'stop', {})
+    return {'id': seq, 'listeners': listeners}, 200
+
+
+def room(token):
+    """What a listener needs before the first trigger: the list name and its files to preload."""
+    list_id = list_id_for_token(token)
+    lst = db.session.get(SessionList, list_id) if list_id is not None else None
+    if lst is None:
+        return NOT_FOUND
+    manifest, _ = session_lists.manifest(lst.user_id, lst.id)
+    return {
+        'name': lst.name,
+        'items': manifest['items'],
+        'listeners': broker.listeners(lst.id),
+        'lead_ms': current_app.config['BROADCAST_LEAD_MS'],
+    }, 200
+
+
+def clock():
+    """Server time for clock-offset estimation (broadcast.js takes the lowest-RTT sample)."""
+    return {'now': now_ms()}, 200
+
+
+# ---- SSE streams ----
+def replay(list_id, last_id):
+    """Frames to resend to a listener reconnecting with Last-Event-ID (computed in the request, before streaming)."""
+    return broker.replay(list_id, last_id)
+
+
+def streams_full():
+    """Whether this process already holds BROADCAST_MAX_STREAMS thread listeners (0: no cap)."""
+    cap = current_app.config['BROADCAST_MAX_STREAMS']
+    return bool(cap) and broker.local.threaded_listeners() >= cap
+
+
+def stream(list_id, backlog=()):
+    """Blocking SSE body for a thread-per-request server (Flask)."""
+    sub = broker.subscribe(list_id)
+    try:
+        yield ('retry: %d\n\n' % RETRY_MS).encode()
+        for frame in backlog:
+            yield frame
+        while True:
+            try:
+                frame = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                frame = PING
+            if frame is None:
+                return
+            yield frame
+    finally:
+        broker.unsubscribe(sub)
+
+
+async def stream_async(list_id, backlog=()):
+    """SSE body for the async API: an asyncio task per listener instead of a thread."""
+    sub = broker.subscribe(list_id, loop=asyncio.get_running_loop())
+    try:
+        yield ('retry: %d\n\n' % RETRY_MS).encode()
+        for frame in backlog:
+            yield frame
+        while True:
+            try:
+                frame = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                frame = PING
+            if frame is None:
+                return
+            yield frame
+    finally:
+        broker.unsubscribe(sub)
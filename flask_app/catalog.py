@@ -0,0 +1,210 @@
+"""D&D SFX App - In-process catalog snapshot keyed by the catalog version.
+
+The catalog (categories + active sounds) only changes when sync_sounds.py runs, so each
+worker keeps one serialized copy in memory and only rebuilds it when the version stored
+in the catalog_state table moves. The version lives in the database, so a sync run from
+another process invalidates every worker on its next request.
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from flask_app import db, metrics
+from flask_app.models import CatalogState, Category, Sound
+from flask_app.search import search_sound_ids
+
+# Encoded response bodies kept per snapshot (one per distinct filter combination).
+MAX_CACHED_BODIES = 256
+# Sound keys left out of the compact catalog document: the client rebuilds
+# category_name from the categories table, and every catalog sound is active.
+COMPACT_OMIT_FIELDS = ('category_name', 'is_active', 'variants', 'renditions')
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def active_sounds_query():
+    """Active sounds in active categories, with category and variants loaded up front.
+
+    contains_eager reuses the Category join for sound.category, and selectinload fetches
+    every variant in one extra SELECT, so serializing N sounds costs 2 queries instead of N+1.
+    """
+    return (
+        Sound.query.filter_by(is_active=True)
+        .join(Category)
+        .filter(Category.is_active == True)
+        .options(db.contains_eager(Sound.category), db.selectinload(Sound.variants))
+    )
+
+
+def current_version():
+    """Return the catalog version (0 if catalog_state has not been created yet)."""
+    try:
+        state = db.session.get(CatalogState, 1)
+    except (OperationalError, ProgrammingError):
+        # Database created before catalog_state existed; sync_sounds.py creates it.
+        db.session.rollback()
+        return 0
+    return state.version if state else 0
+
+
+def bump_version():
+    """Increment the catalog version. Caller commits (usually with the sync changes)."""
+    state = db.session.get(CatalogState, 1)
+    if not state:
+        state = CatalogState(id=1, version=0)
+        db.session.add(state)
+    state.version = (state.version or 0) + 1
+    return state.version
+
+
+class CatalogSnapshot:
+    """Serialized categories and sounds for one catalog version."""
+
+    def __init__(self, version, categories, sounds):
+        self.version = version
+        self.categories = categories
+        self.sounds = sounds
+        self.sounds_by_id = {s['id']: s for s in sounds}
+        self._bodies = {}
+        self._bodies_lock = threading.Lock()
+        self._documents = None
+
+    def etag(self, *parts):
+        """Strong ETag for a response derived from this version and the given request parts."""
+        key = json.dumps([self.version] + list(parts), separators=(',', ':'))
+        return 'catalog-%d-%s' % (self.version, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+    def filter_sounds(self, category_id=None, search=''):
+        """Sounds in category_id matching search: best match first when searching, else by name."""
+        if search:
+            found = (self.sounds_by_id.get(sound_id) for sound_id in search_sound_ids(search))
+            candidates = [s for s in found if s is not None]
+        else:
+            candidates = self.sounds
+        return [s for s in candidates if not category_id or s['category_id'] == category_id]
+
+    def body(self, key, build):
+        """Return the encoded JSON body for key, building (and keeping) it on first use."""
+        cached = self._bodies.get(key)
+        metrics.cache_lookup('catalog_body', cached is not None)
+        if cached is not None:
+            return cached
+        encoded = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        with self._bodies_lock:
+            if len(self._bodies) >= MAX_CACHED_BODIES:
+                self._bodies.clear()
+            self._bodies[key] = encoded
+        return encoded
+
+    def document(self):
+        """Compact catalog for client-side filtering: sounds and variants as value rows plus field names."""
+        sample = self.sounds[0] if self.sounds else {}
+        fields = [k for k in sample if k not in COMPACT_OMIT_FIELDS]
+        variant_sample = next((s['variants'][0] for s in self.sounds if s['variants']), {})
+        variant_fields = [k for k in variant_sample if k not in COMPACT_OMIT_FIELDS]
+        return {
+            'version': self.version,
+            'categories': self.categories,
+            'fields': fields,
+            'variant_fields': variant_fields,
+            'sounds': [
+                [s[k] for k in fields] + [[[v[k] for k in variant_fields] for v in s['variants']]]
+                for s in self.sounds
+            ],
+        }
+
+    def encoded_document(self, encoding):
+        """Catalog document as bytes for encoding 'br', 'gzip' or 'identity', compressed once per version."""
+        docs = self._documents
+        if docs is None:
+            raw = json.dumps(self.document(), separators=(',', ':')).encode('utf-8')
+            docs = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                docs['br'] = brotli.compress(raw, quality=11)
+            self._documents = docs
+        return docs[encoding]
+
+    def document_encodings(self):
+        return ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'identity')
+
+
+def build_snapshot(version):
+    counts = dict(
+        db.session.query(Sound.category_id, db.func.count(Sound.id)).group_by(Sound.category_id).all()
+    )
+    cats = Category.query.filter_by(is_active=True).order_by(Category.sort_order, Category.name).all()
+    sounds = active_sounds_query().order_by(Sound.name).all()
+    return CatalogSnapshot(
+        version,
+        [c.to_dict(sound_count=counts.get(c.id, 0)) for c in cats],
+        [s.to_dict() for s in sounds],
+    )
+
+
+def get_snapshot():
+    """Return the snapshot for the current catalog version, rebuilding it if the version moved."""
+    global _snapshot
+    version = current_version()
+    snap = _snapshot
+    if snap is not None and snap.version == version:
+        metrics.cache_lookup('catalog_snapshot', True)
+        return snap
+    metrics.cache_lookup('catalog_snapshot', False)
+    with _lock:
+        snap = _snapshot
+        if snap is None or snap.version != version:
+            snap = build_snapshot(version)
+            _snapshot = snap
+    return snap
+
+
+def catalog_response(snap, key, build, request, response_class):
+    """JSON response with a strong ETag; 304 when the client already has this version.
+
+    If-None-Match uses the weak comparison (RFC 7232 3.2): a proxy that re-compresses the
+    body hands the client W/"...". request and response_class come from Flask
+    (routes_api.py) or Quart (async_api.py).
+    """
+    etag = snap.etag(*key)
+    if request.if_none_match.contains_weak(etag):
+        resp = response_class(status=304)
+    else:
+        resp = response_class(snap.body(key, build), mimetype='application/json')
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def document_response(snap, request, response_class):
+    """The compact catalog document in the best encoding the client accepts, with a per-encoding ETag."""
+    encoding = next(
+        (e for e in snap.document_encodings() if e == 'identity' or request.accept_encodings[e]),
+        'identity',
+    )
+    etag = snap.etag('catalog', encoding)
+    if request.if_none_match.contains_weak(etag):
+        resp = response_class(status=304)
+    else:
+        resp = response_class(snap.encoded_document(encoding), mimetype='application/json')
+        if encoding != 'identity':
+            resp.content_encoding = encoding
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+def invalidate():
+    """Drop this process's snapshot (e.g. after editing catalog rows in-process)."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -0,0 +1,80 @@
+"""D&D SFX App - Database engine profiles.
+
+DB_PROFILE picks how the SQLAlchemy engine is set up:
+  wal    (default) SQLite in WAL mode: readers never block the writer and vice versa,
+         synchronous=NORMAL (durable at checkpoints, safe against app crashes), a memory-mapped
+         file and a larger page cache, and busy_timeout so concurrent writers wait instead of
+         failing with "database is locked".
+  legacy SQLite defaults (rollback journal, synchronous=FULL), for comparison in bench_db.py.
+For other databases (e.g. a PostgreSQL DATABASE_URL) the profile is ignored and the pool is
+sized from DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE, with pre-ping so
+connections dropped by the server are replaced instead of surfacing as errors.
+"""
+import os
+
+from sqlalchemy import event
+
+SQLITE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_MB', '256')) * 1024 * 1024,
+        'cache_size': -int(os.getenv('SQLITE_CACHE_MB', '64')) * 1024,  # negative = KiB
+        'temp_store': 'MEMORY',
+    },
+    # Set explicitly: journal_mode is stored in the database file and would otherwise stay WAL.
+    'legacy': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+}
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for uri."""
+    if is_sqlite(uri):
+        # busy_timeout is also set per connection; this covers the connect itself.
+        return {'connect_args': {'timeout': SQLITE_PROFILES['wal']['busy_timeout'] / 1000}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': True,
+    }
+
+
+# Async drivers for the async API (flask_app/async_api.py), by URL scheme.
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg', 'mysql': 'mysql+aiomysql'}
+
+
+def async_database_uri(uri):
+    """uri with its driver swapped for the asyncio one (sqlite:///x.db -> sqlite+aiosqlite:///x.db)."""
+    scheme, sep, rest = uri.partition('://')
+    dialect = scheme.split('+')[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError('No async driver configured for %r databases' % dialect)
+    return ASYNC_DRIVERS[dialect] + sep + rest
+
+
+def sqlite_pragmas(profile):
+    if profile not in SQLITE_PROFILES:
+        raise ValueError('Unknown DB_PROFILE %r (expected one of %s)' % (profile, ', '.join(SQLITE_PROFILES)))
+    return SQLITE_PROFILES[profile]
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run the PRAGMAs on every new pooled connection of engine."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA %s=%s' % (name, value))
+        finally:
+            cursor.close()
@@ -0,0 +1,177 @@
+"""D&D SFX App - Compact audio fingerprints for near-duplicate detection (sync_sounds.py).
+
+fingerprint() hashes the first MAX_SECONDS of a file into one 32-bit word per ~23 ms frame
+(Haitsma & Kalker): bit m of frame n is the sign of the change, from frame n-1 to n, of the
+energy difference between bands m and m+1 (33 log-spaced bands, 300-3000 Hz). Frame timing
+and bands are defined in seconds and Hz, so a copy resampled, re-encoded, turned up or down
+or trimmed still yields mostly the same words, offset by the trim.
+
+near_duplicates() finds candidate pairs through an inverted index of matching word halves
+that agree on an offset, then confirms each with the bit error rate over the aligned overlap.
+Exact copies (same content hash) are left to the caller.
+"""
+import base64
+
+try:
+    import numpy as np
+except ImportError:  # sync_sounds.py skips the stage
+    np = None
+
+from flask_app.mixdown import open_native
+
+BLOCK_FRAMES = 65536
+# Bump when words() changes; the manifest key carries it, so old fingerprints are recomputed.
+FINGERPRINT_VERSION = 1
+MANIFEST_KEY = 'fingerprint_v%d' % FINGERPRINT_VERSION
+MAX_SECONDS = 60
+FRAME_SECONDS = 0.0928
+HOP_SECONDS = FRAME_SECONDS / 4
+LOW_HZ = 300.0
+HIGH_HZ = 3000.0
+BANDS = 33
+# Frames this far below the loudest one hash noise, not the sound: they become word 0 and
+# are left out of matching.
+QUIET_DB = -30.0
+# Word halves seen more often than this (tones, noise) say nothing about which files match.
+MAX_POSTINGS = 64
+MIN_VOTES = 3
+MAX_BIT_ERROR_RATE = 0.25
+MIN_OVERLAP = 0.6  # of the loud frames of the quieter fingerprint
+MIN_LENGTH_RATIO = 0.5  # a short hit inside a long ambience is not a duplicate
+
+
+def _band_matrix(rate, n_fft):
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / rate)
+    edges = np.geomspace(LOW_HZ, min(HIGH_HZ, rate / 2 * 0.95), BANDS + 1)
+    return ((freqs >= edges[:-1, None]) & (freqs < edges[1:, None])).astype(np.float64).T
+
+
+def words(mono, rate):
+    """uint32 sub-fingerprints of a mono float signal."""
+    n_fft = int(round(rate * FRAME_SECONDS))  # the same span of time at every rate
+    hop = rate * HOP_SECONDS
+    if len(mono) < n_fft:
+        mono = np.concatenate([mono, np.zeros(n_fft - len(mono))])
+    starts = np.round(np.arange(int((len(mono) - n_fft) / hop) + 1) * hop).astype(np.int64)
+    frames = mono[starts[:, None] + np.arange(n_fft)] * np.hanning(n_fft)
+    energy = np.square(np.abs(np.fft.rfft(frames, axis=1))) @ _band_matrix(rate, n_fft)
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    out = (bits.astype(np.uint64) << np.arange(BANDS - 1, dtype=np.uint64)).sum(axis=1).astype(np.uint32)
+    total = energy.sum(axis=1)
+    loud = np.minimum(total[1:], total[:-1]) > total.max() * 10 ** (QUIET_DB / 10)
+    out[~loud] = 0
+    return out
+
+
+def fingerprint(path):
+    """{'words': base64 little-endian uint32s, 'seconds': duration fingerprinted} for the file at path.
+
+    Returns {} if it cannot be decoded or is silent, None if decoding it needs ffmpeg and it is
+    missing (so a later sync tries again).
+    """
+    try:
+        reader = open_native(path)
+    except OSError:
+        return {}
+    if reader is None:
+        return None
+    limit = int(reader.rate * MAX_SECONDS)
+    blocks = []
+    read = 0
+    try:
+        while read < limit:
+            block = reader.read_native(min(BLOCK_FRAMES, limit - read))
+            if not len(block):
+                break
+            blocks.append(block.mean(axis=1))
+            read += len(block)
+    except (OSError, ValueError):
+        return {}
+    finally:
+        reader.close()
+    if not read:
+        return {}
+    mono = np.concatenate(blocks).astype(np.float64)
+    if not np.any(mono):
+        return {}
+    return {
+        'words': base64.b64encode(words(mono, reader.rate).astype('<u4').tobytes()).decode('ascii'),
+        'seconds': round(read / reader.rate, 3),
+    }
+
+
+def decode(value):
+    return np.frombuffer(base64.b64decode(value['words']), '<u4')
+
+
+def bit_error_rate(a, b, offset):
+    """Share of differing bits where b[i + offset] lines up with a[i], over the frames loud in
+    both; (rate, frames compared)."""
+    start = max(0, -offset)
+    end = min(len(a), len(b) - offset)
+    if end <= start:
+        return 1.0, 0
+    x, y = a[start:end], b[start + offset:end + offset]
+    both = (x != 0) & (y != 0)
+    compared = int(both.sum())
+    if not compared:
+        return 1.0, 0
+    return np.unpackbits((x[both] ^ y[both]).view(np.uint8)).sum() / (32.0 * compared), compared
+
+
+def _candidates(prints):
+    """{(i, j): {offset: votes}} from word halves shared by fingerprints i < j.
+
+    Halves rather than whole words: at a 10% bit error rate a 16-bit half still matches one
+    time in five, a whole word one time in thirty.
+    """
+    keys, owners, positions = [], [], []
+    for i, p in enumerate(prints):
+        position = np.flatnonzero(p)
+        loud = p[position].astype(np.int64)
+        keys += [loud >> 16, (loud & 0xFFFF) | 0x10000]
+        owners += [np.full(2 * len(position), i)]
+        positions += [position, position]
+    if not keys:
+        return {}
+    values, owner, position = np.concatenate(keys), np.concatenate(owners), np.concatenate(positions)
+    order = np.argsort(values, kind='stable')
+    values, owner, position = values[order], owner[order], position[order]
+    bounds = np.flatnonzero(np.diff(values)) + 1
+    votes = {}
+    for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(values)]])):
+        if hi - lo < 2 or hi - lo > MAX_POSTINGS:
+            continue
+        run = list(zip(owner[lo:hi].tolist(), position[lo:hi].tolist()))
+        for x in range(len(run)):
+            for y in range(x + 1, len(run)):
+                (i, pi), (j, pj) = sorted((run[x], run[y]))
+                if i != j:
+                    pair = votes.setdefault((i, j), {})
+                    pair[pj - pi] = pair.get(pj - pi, 0) + 1
+    return votes
+
+
+def near_duplicates(prints):
+    """[(i, j, bit error rate, offset in words)] for fingerprints (uint32 arrays) that match."""
+    found = []
+    for (i, j), offsets in _candidates(prints).items():
+        a, b = prints[i], prints[j]
+        shorter, longer = sorted((len(a), len(b)))
+        if shorter < MIN_LENGTH_RATIO * longer:
+            continue
+        loud = min(np.count_nonzero(a), np.count_nonzero(b))
+        best_offset, best = max(offsets.items(), key=lambda kv: kv[1])
+        # Neighbouring offsets vote for the same alignment (frame timing jitter).
+        if best + offsets.get(best_offset - 1, 0) + offsets.get(best_offset + 1, 0) < MIN_VOTES:
+            continue
+        rate, offset = min((bit_error_rate(a, b, o)[0], o) for o in (best_offset - 1, best_offset, best_offset + 1))
+        overlap = bit_error_rate(a, b, offset)[1]
+        if rate <= MAX_BIT_ERROR_RATE and overlap >= MIN_OVERLAP * loud:
+            found.append((i, j, float(rate), offset))
+    return found
+
+
+def available():
+    return np is not None
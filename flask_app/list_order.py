@@ -0,0 +1,91 @@
+"""D&D SFX App - Sparse ordering keys for SessionListSound.sort_order.
+
+Entries are spaced ORDER_GAP apart, so moving or inserting one entry takes the midpoint of
+its new neighbours and updates a single row. When two neighbours end up adjacent (no
+integer left between them) the list is renumbered to multiples of ORDER_GAP again, in a
+background thread right after the move that used up the gap, or inline if a move finds no
+room before that has run.
+"""
+import threading
+
+from flask_app import db
+from flask_app.models import SessionList, SessionListSound
+
+ORDER_GAP = 1024
+# Rows per CASE ... WHERE id IN (...) statement: 3 bound parameters each, under SQLite's old 999 limit.
+ORDER_UPDATE_BATCH = 300
+
+
+def key_between(lo, hi):
+    """An integer key strictly between lo and hi (None = open end), or None if there is no room."""
+    if lo is None and hi is None:
+        return 0
+    if lo is None:
+        return hi - ORDER_GAP
+    if hi is None:
+        return lo + ORDER_GAP
+    if hi - lo < 2:
+        return None
+    return (lo + hi) // 2
+
+
+def gap_exhausted(lo, key, hi):
+    """True once the next insert next to key (on either side) would find no room."""
+    return (lo is not None and key - lo < 2) or (hi is not None and hi - key < 2)
+
+
+def write_sort_orders(changes):
+    """Set sort_order for {entry_id: sort_order} with batched UPDATE ... SET sort_order = CASE id ... END."""
+    items = sorted(changes.items())
+    for i in range(0, len(items), ORDER_UPDATE_BATCH):
+        batch = dict(items[i:i + ORDER_UPDATE_BATCH])
+        db.session.execute(
+            db.update(SessionListSound)
+            .where(SessionListSound.id.in_(batch))
+            .values(sort_order=db.case(batch, value=SessionListSound.id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def lock_list(list_id):
+    """Serialize writers to one list's keys: call before reading the keys a write depends on.
+
+    SELECT ... FOR UPDATE where the database has row locks. SQLite ignores FOR UPDATE and a
+    deferred transaction only takes the write lock at its first write, so two moves could
+    both read the same neighbours first; a no-op UPDATE of the list row takes it up front.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(db.update(SessionList).where(SessionList.id == list_id).values(id=SessionList.id))
+    else:
+        db.session.query(SessionList.id).filter_by(id=list_id).with_for_update().first()
+
+
+def rebalance(list_id):
+    """Renumber a list's entries to 0, ORDER_GAP, 2*ORDER_GAP, ... keeping their order. Returns rows changed."""
+    lock_list(list_id)
+    rows = (
+        db.session.query(SessionListSound.id, SessionListSound.sort_order)
+        .filter(SessionListSound.session_list_id == list_id)
+        .order_by(SessionListSound.sort_order, SessionListSound.id)
+        .all()
+    )
+    changes = {row.id: i * ORDER_GAP for i, row in enumerate(rows) if row.sort_order != i * ORDER_GAP}
+    if changes:
+        write_sort_orders(changes)
+    return len(changes)
+
+
+def schedule_rebalance(app, list_id):
+    """Rebalance list_id after the current request, on a daemon thread with its own session."""
+    def run():
+        with app.app_context():
+            try:
+                rebalance(list_id)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Rebalancing session list %s failed', list_id)
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=run, name='rebalance-list-%s' % list_id, daemon=True).start()
@@ -0,0 +1,214 @@
+"""D&D SFX App - Loudness measurement of audio files, for playback gain normalization.
+
+analyze_file() decodes a file once, a block at a time, and returns:
+    loudness_lufs   integrated loudness (ITU-R BS.1770-4: K-weighted, 400 ms blocks every
+                    100 ms, absolute gate -70 LUFS, relative gate -10 LU)
+    true_peak_dbtp  peak of the signal oversampled to >= 176.4 kHz (BS.1770 Annex 2)
+    rms_dbfs        unweighted RMS over all channels (a full-scale square wave is 0 dBFS)
+Silence gives None for each. A clip shorter than one 400 ms block is measured as a single
+ungated block (BS.1770 has no answer for it, and short hits are most of a SFX library).
+
+Everything is vectorized NumPy: the two K-weighting biquads are applied as one FIR (their
+impulse response, to well below the noise floor) and, like the oversampling filter, run as
+FFT overlap-save over each decoded block. sync_sounds.py runs this in a process pool and
+caches the results per file content hash in the manifest.
+"""
+import functools
+import math
+
+try:
+    import numpy as np
+except ImportError:  # sync_sounds.py skips the analysis
+    np = None
+
+from flask_app.mixdown import open_native
+
+BLOCK_FRAMES = 65536
+GATE_ABSOLUTE = -70.0
+GATE_RELATIVE = -10.0
+# Impulse response kept of the K-weighting filter; its 38 Hz high-pass rings for ~100 ms.
+K_WEIGHT_SECONDS = 0.2
+TRUE_PEAK_MIN_RATE = 176400
+TRUE_PEAK_TAPS_PER_PHASE = 16
+
+
+def _biquad(b, a, samples):
+    """samples filtered by b/a (direct form I); only used on an impulse, to derive FIR taps."""
+    x1 = x2 = y1 = y2 = 0.0
+    out = []
+    for x0 in samples:
+        y0 = b[0] * x0 + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        out.append(y0)
+        x1, x2, y1, y2 = x0, x1, y0, y1
+    return out
+
+
+@functools.lru_cache(maxsize=8)
+def k_weighting(rate):
+    """FIR taps of the BS.1770 pre-filter (high shelf) and RLB high-pass at rate.
+
+    Coefficients are derived for any rate as in libebur128; at 48 kHz they match the standard.
+    """
+    k = math.tan(math.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    k = math.tan(math.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    hp_b = (1.0, -2.0, 1.0)
+    hp_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    impulse = [1.0] + [0.0] * (int(rate * K_WEIGHT_SECONDS) - 1)
+    return np.array(_biquad(hp_b, hp_a, _biquad(shelf_b, shelf_a, impulse)))
+
+
+@functools.lru_cache(maxsize=8)
+def oversampling_phases(factor):
+    """Polyphase interpolation filter, (factor, taps): phase p yields the samples at k + p/factor."""
+    half = TRUE_PEAK_TAPS_PER_PHASE // 2
+    n = np.arange(-half * factor, half * factor)
+    taps = np.sinc(n / factor) * np.kaiser(len(n), 8.0)
+    return taps.reshape(-1, factor).T.copy()
+
+
+def oversampling_factor(rate):
+    factor = 1
+    while rate * factor < TRUE_PEAK_MIN_RATE:
+        factor *= 2
+    return factor
+
+
+def channel_weights(channels):
+    """BS.1770 weights: surrounds of a 5.0/5.1 layout count 1.41, LFE not at all."""
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+class Convolver:
+    """Streaming FIR filter (overlap-save). taps is (n,) or (phases, n); output is (frames, channels)
+    or (phases, frames, channels)."""
+
+    def __init__(self, taps, channels):
+        self.taps = np.atleast_2d(taps)
+        self.squeeze = np.ndim(taps) == 1
+        self.history = np.zeros((self.taps.shape[1] - 1, channels))
+        self._spectra = {}
+
+    def __call__(self, block):
+        buf = np.concatenate([self.history, block])
+        size = 1 << (len(buf) - 1).bit_length()
+        spectrum = self._spectra.get(size)
+        if spectrum is None:
+            spectrum = self._spectra[size] = np.fft.rfft(self.taps, size)[:, :, None]
+        out = np.fft.irfft(np.fft.rfft(buf, size, axis=0)[None] * spectrum, size, axis=1)
+        self.history = buf[len(buf) - len(self.history):]
+        out = out[:, len(self.history):len(buf)]
+        return out[0] if self.squeeze else out
+
+
+class Meter:
+    """Loudness, true peak and RMS of a signal fed in blocks of float (frames, channels)."""
+
+    def __init__(self, rate, channels):
+        self.step = int(round(rate / 10))  # gating blocks start every 100 ms
+        self.weights = channel_weights(channels)
+        self.k_filter = Convolver(k_weighting(rate), channels)
+        factor = oversampling_factor(rate)
+        self.oversample = Convolver(oversampling_phases(factor), channels) if factor > 1 else None
+        self.channels = channels
+        self.frames = 0
+        self.square_sum = 0.0
+        self.peak = 0.0
+        self.weighted_sum = np.zeros(channels)
+        self.pending = np.zeros((0, channels))
+        self.steps = []  # per-channel mean square of each 100 ms step
+
+    def feed(self, block):
+        block = block.astype(np.float64)
+        self.frames += len(block)
+        self.square_sum += float(np.square(block).sum())
+        self._peak(block)
+        weighted = self.k_filter(block)
+        self.weighted_sum += np.square(weighted).sum(axis=0)
+        pending = np.concatenate([self.pending, weighted])
+        whole = len(pending) // self.step * self.step
+        if whole:
+            steps = pending[:whole].reshape(-1, self.step, self.channels)
+            self.steps.append(np.square(steps).mean(axis=1))
+        self.pending = pending[whole:]
+
+    def _peak(self, block):
+        if self.oversample is not None:
+            block = self.oversample(block)
+        if block.size:
+            self.peak = max(self.peak, float(np.abs(block).max()))
+
+    def finish(self):
+        """The flush of the oversampling filter catches peaks between the last samples."""
+        if self.oversample is not None:
+            self._peak(np.zeros((len(self.oversample.history), self.channels)))
+
+    def integrated(self):
+        steps = np.concatenate(self.steps) if self.steps else np.zeros((0, self.channels))
+        if len(steps) >= 4:
+            blocks = (steps[:-3] + steps[1:-2] + steps[2:-1] + steps[3:]) / 4
+        elif self.frames:
+            blocks = self.weighted_sum[None] / self.frames
+        else:
+            return None
+        power = blocks @ self.weights
+        with np.errstate(divide='ignore'):
+            levels = -0.691 + 10 * np.log10(power)
+        power = power[levels > GATE_ABSOLUTE]
+        if not len(power):
+            return None
+        relative = -0.691 + 10 * math.log10(power.mean()) + GATE_RELATIVE
+        with np.errstate(divide='ignore'):
+            power = power[-0.691 + 10 * np.log10(power) > relative]
+        return -0.691 + 10 * math.log10(power.mean())
+
+    def result(self):
+        lufs = self.integrated()
+        mean_square = self.square_sum / (self.frames * self.channels) if self.frames else 0.0
+        return {
+            'loudness_lufs': round(lufs, 2) if lufs is not None else None,
+            'true_peak_dbtp': round(20 * math.log10(self.peak), 2) if self.peak > 0 else None,
+            'rms_dbfs': round(10 * math.log10(mean_square), 2) if mean_square > 0 else None,
+        }
+
+
+def analyze_file(path):
+    """Measurements for the file at path (see the module docstring).
+
+    Returns {} if the file cannot be decoded, None if decoding it needs ffmpeg and it is missing
+    (so a later run with ffmpeg tries again).
+    """
+    try:
+        reader = open_native(path)
+    except OSError:
+        return {}
+    if reader is None:
+        return None
+    try:
+        meter = Meter(reader.rate, reader.channels)
+        while True:
+            block = reader.read_native(BLOCK_FRAMES)
+            if not len(block):
+                break
+            meter.feed(block)
+        meter.finish()
+    except (OSError, ValueError):
+        return {}
+    finally:
+        reader.close()
+    return meter.result() if meter.frames else {}
+
+
+def available():
+    return np is not None
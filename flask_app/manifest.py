@@ -0,0 +1,93 @@
+"""D&D SFX App - Persisted manifest of audio files seen by sync_sounds.py.
+
+One entry per file under static/audio (keyed by the same relative path stored in
+Sound.file_path / SoundVariant.file_path) with its size, mtime and content hash. A file is
+only re-hashed when its size or mtime moved, and anything derived from its contents is
+dropped when the hash changes so later sync stages recompute it.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_FORMAT = 1
+
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+
+class ManifestChanges:
+    """Relative paths added, changed (new content) and removed since the last sync."""
+
+    def __init__(self, added, changed, removed):
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return '%d added, %d changed, %d removed' % (len(self.added), len(self.changed), len(self.removed))
+
+
+class SoundManifest:
+    def __init__(self, path, files=None, catalog_version=None):
+        self.path = path
+        self.files = files or {}
+        self.catalog_version = catalog_version
+
+    @classmethod
+    def load(cls, path):
+        """Load the manifest at path; a missing or unreadable file gives an empty manifest (full sync)."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get('format') != MANIFEST_FORMAT:
+            return cls(path)
+        return cls(path, data.get('files') or {}, data.get('catalog_version'))
+
+    def save(self):
+        """Write atomically so an interrupted sync never leaves a truncated manifest."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'format': MANIFEST_FORMAT, 'catalog_version': self.catalog_version, 'files': self.files},
+                f, separators=(',', ':'), sort_keys=True,
+            )
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, stats, audio_dir):
+        """Reconcile with the current file stats ({rel_path: (size, mtime_ns)}); returns ManifestChanges.
+
+        Unchanged size + mtime keeps the stored hash; otherwise the file is hashed and, if the
+        content really differs, its entry is reset to just size/mtime/sha1.
+        """
+        added, changed = set(), set()
+        for rel_path, (size, mtime_ns) in stats.items():
+            entry = self.files.get(rel_path)
+            if entry and entry.get('size') == size and entry.get('mtime_ns') == mtime_ns:
+                continue
+            sha1 = file_sha1(os.path.join(audio_dir, rel_path))
+            if entry is None:
+                added.add(rel_path)
+            elif entry.get('sha1') != sha1:
+                changed.add(rel_path)
+            if entry is None or entry.get('sha1') != sha1:
+                self.files[rel_path] = {'size': size, 'mtime_ns': mtime_ns, 'sha1': sha1}
+            else:
+                # Touched but identical content (e.g. copied back in place): keep derived data.
+                entry['size'] = size
+                entry['mtime_ns'] = mtime_ns
+        removed = set(self.files) - set(stats)
+        for rel_path in removed:
+            del self.files[rel_path]
+        return ManifestChanges(added, changed, removed)
+
+    def sha1(self, rel_path):
+        entry = self.files.get(rel_path)
+        return entry.get('sha1') if entry else None
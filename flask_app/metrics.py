@@ -0,0 +1,372 @@
+"""D&D SFX App - Prometheus metrics and the slow-request log.
+
+GET /metrics (flask_app/routes.py) answers in the Prometheus text format:
+    dnd_http_request_duration_seconds   histogram per endpoint (blueprint.view) and method, both
+                                        apps (api_bp.* is Flask, async_api_bp.* the async API)
+    dnd_http_requests_total             per endpoint, method and status
+    dnd_db_queries_per_request          histogram of SQL statements per request, per endpoint
+    dnd_db_seconds_per_request          histogram of time spent in them
+    dnd_audio_bytes_sent_total          audio bytes served, per kind (m, r, mix, sprite)
+    dnd_audio_offloaded_total           audio responses handed to the front proxy instead
+    dnd_cache_lookups_total             per cache and result (hit/miss): hit rate is
+                                        rate(...{result="hit"}) / rate(...)
+    dnd_sync_duration_seconds           last sync_sounds.py run, per stage, with
+                                        dnd_sync_last_run_timestamp_seconds and dnd_sync_rows
+Statements are timed with SQLAlchemy cursor events on both engines and tallied against the
+request running in the current context. A request slower than SLOW_REQUEST_MS is logged
+(logger flask_app.slow_requests) with its statements and their times, not their parameters.
+
+Each process counts on its own and writes its totals to METRICS_DIR/<pid>-<random>.json at
+most once a second and when it exits; /metrics sums every file there, so the numbers cover
+all gunicorn workers. A scrape folds the files of processes that have exited into
+archive.json (under a lock), so recycled workers neither pile up files nor, when a pid is
+reused, take their counts with them: counters only go up. Delete METRICS_DIR to start from
+zero.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead processes' files are summed but never folded
+    fcntl = None
+
+from sqlalchemy import event
+
+_instance = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+METRICS_DIR = os.path.join(_instance, 'metrics')
+ARCHIVE_NAME = 'archive.json'
+SYNC_STATS_PATH = os.path.join(_instance, 'sync_stats.json')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+FLUSH_SECONDS = 1.0
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+MAX_LOGGED_QUERIES = 50
+MAX_STATEMENT_CHARS = 300
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'dnd_http_request_duration_seconds': ('histogram', 'Request latency (to the first byte of the body).', LATENCY_BUCKETS),
+    'dnd_http_requests_total': ('counter', 'Requests answered.', None),
+    'dnd_db_queries_per_request': ('histogram', 'SQL statements executed per request.', QUERY_BUCKETS),
+    'dnd_db_seconds_per_request': ('histogram', 'Time spent in SQL statements per request.', LATENCY_BUCKETS),
+    'dnd_audio_bytes_sent_total': ('counter', 'Audio bytes sent by the app.', None),
+    'dnd_audio_offloaded_total': ('counter', 'Audio responses handed to the front proxy (X-Accel-Redirect).', None),
+    'dnd_cache_lookups_total': ('counter', 'Cache lookups by cache and result.', None),
+}
+
+slow_log = logging.getLogger('flask_app.slow_requests')
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by (name, labels as a JSON list of pairs)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        # A fresh name per process: a later process with a reused pid never overwrites this one's file.
+        self.file_name = '%d-%s.json' % (self.pid, uuid.uuid4().hex[:12])
+        self.counters = {}
+        self.histograms = {}  # -> [count per bucket (+Inf last), sum]
+        self.flushed = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, json.dumps(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, json.dumps(sorted(labels.items())))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            h[0][next((i for i, b in enumerate(buckets) if value <= b), len(buckets))] += 1
+            h[1] += value
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(h[0]), h[1]] for (name, labels), h in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Write this process's totals to METRICS_DIR, at most once per FLUSH_SECONDS unless forced."""
+        now = time.monotonic()
+        if not force and now - self.flushed < FLUSH_SECONDS:
+            return
+        self.flushed = now
+        data = self.dump()
+        if not data['counters'] and not data['histograms']:
+            return
+        path = os.path.join(METRICS_DIR, self.file_name)
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            tmp = '%s.%d.tmp' % (path, threading.get_ident())
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+registry = Registry()
+# A forked worker starts from zero: what the master counted before forking is in its own file.
+os.register_at_fork(after_in_child=registry.reset)
+# Counts since the last flush would be lost with the process (serve.py also flushes in worker_exit).
+atexit.register(lambda: registry.flush(force=True))
+
+
+def cache_lookup(cache, hit):
+    registry.inc('dnd_cache_lookups_total', {'cache': cache, 'result': 'hit' if hit else 'miss'})
+
+
+def audio_sent(kind, response):
+    """Count an audio response: its body length, or one handoff when the proxy sends the bytes."""
+    if 'X-Accel-Redirect' in response.headers:
+        registry.inc('dnd_audio_offloaded_total', {'kind': kind})
+    elif response.content_length:
+        registry.inc('dnd_audio_bytes_sent_total', {'kind': kind}, response.content_length)
+
+
+def counted(chunks, kind):
+    """chunks passed through, their bytes counted as audio of kind (streamed mixdown renders)."""
+    try:
+        for chunk in chunks:
+            registry.inc('dnd_audio_bytes_sent_total', {'kind': kind}, len(chunk))
+            yield chunk
+    finally:
+        chunks.close()
+
+
+# ---- Requests and their queries ----
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = []
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def begin_request():
+    _current.set(RequestStats())
+
+
+def end_request(endpoint, method, status, path, slow_ms):
+    """Record the request begun in this context; log it when it took at least slow_ms (0: never)."""
+    stats = _current.get()
+    if stats is None:
+        return
+    _current.set(None)
+    seconds = time.perf_counter() - stats.started
+    endpoint = endpoint or 'unmatched'
+    labels = {'endpoint': endpoint, 'method': method}
+    registry.observe('dnd_http_request_duration_seconds', labels, seconds)
+    registry.inc('dnd_http_requests_total', dict(labels, status=str(status)))
+    registry.observe('dnd_db_queries_per_request', {'endpoint': endpoint}, stats.queries)
+    registry.observe('dnd_db_seconds_per_request', {'endpoint': endpoint}, stats.db_seconds)
+    registry.flush()
+    if slow_ms and seconds * 1000 >= slow_ms:
+        lines = ['%s %s -> %s in %.0f ms (%s), %d queries in %.0f ms' % (
+            method, path, status, seconds * 1000, endpoint, stats.queries, stats.db_seconds * 1000)]
+        lines += ['  %7.1f ms  %s' % (s * 1000, statement) for statement, s in stats.statements]
+        if stats.queries > len(stats.statements):
+            lines.append('  ... %d more' % (stats.queries - len(stats.statements)))
+        slow_log.warning('\n'.join(lines))
+
+
+def install_query_hooks(engine):
+    """Time every statement on engine (a sync Engine; for an AsyncEngine pass .sync_engine)."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        started = conn.info.get('metrics_started')
+        if stats is None or not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        stats.queries += 1
+        stats.db_seconds += seconds
+        if len(stats.statements) < MAX_LOGGED_QUERIES:
+            stats.statements.append((' '.join(statement.split())[:MAX_STATEMENT_CHARS], seconds))
+
+
+# ---- Exposition ----
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(counters, histograms, data):
+    """Add one file's totals into counters and histograms (the shapes _merged returns)."""
+    for metric, labels, value in data.get('counters', []):
+        counters[metric, labels] = counters.get((metric, labels), 0) + value
+    for metric, labels, counts, total in data.get('histograms', []):
+        h = histograms.setdefault((metric, labels), [[0] * len(counts), 0.0])
+        if len(h[0]) == len(counts):  # bucket layout changed between versions: skip the old file
+            h[0] = [a + b for a, b in zip(h[0], counts)]
+            h[1] += total
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # e.g. EPERM: someone else's process
+        return True
+    return True
+
+
+def _process_files():
+    """(name, pid) of every per-process file in METRICS_DIR."""
+    try:
+        names = sorted(os.listdir(METRICS_DIR))
+    except OSError:
+        return []
+    found = []
+    for name in names:
+        pid, _, rest = name.partition('-')
+        if rest.endswith('.json') and pid.isdigit():
+            found.append((name, int(pid)))
+    return found
+
+
+def fold_dead():
+    """Move the totals of processes that have exited into archive.json. Returns the files folded."""
+    if fcntl is None:
+        return 0
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        lock = open(os.path.join(METRICS_DIR, '.lock'), 'w')
+    except OSError:
+        return 0
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one scrape folds a file; another sees it gone
+        dead = [name for name, pid in _process_files() if not _alive(pid)]
+        if not dead:
+            return 0
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_NAME)
+        counters, histograms = {}, {}
+        for name in [ARCHIVE_NAME] + dead:
+            data = _load(os.path.join(METRICS_DIR, name))
+            if data:
+                _add(counters, histograms, data)
+        tmp = archive_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'counters': [[metric, labels, value] for (metric, labels), value in counters.items()],
+                'histograms': [[metric, labels, h[0], h[1]] for (metric, labels), h in histograms.items()],
+            }, f)
+        os.replace(tmp, archive_path)
+        for name in dead:
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+        return len(dead)
+
+
+def _merged():
+    """Counters and histograms summed over the archive and every process's file (this one's written first)."""
+    registry.flush(force=True)
+    fold_dead()
+    counters = {}
+    histograms = {}
+    for name in [ARCHIVE_NAME] + [name for name, _ in _process_files()]:
+        data = _load(os.path.join(METRICS_DIR, name))
+        if data:
+            _add(counters, histograms, data)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _sync_lines():
+    try:
+        with open(SYNC_STATS_PATH) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return []
+    lines = ['# HELP dnd_sync_duration_seconds Duration of the last sync_sounds.py run, per stage.',
+             '# TYPE dnd_sync_duration_seconds gauge']
+    lines += ['dnd_sync_duration_seconds%s %s' % (_labels([('stage', stage)]), _number(seconds))
+              for stage, seconds in sorted(stats.get('stages', {}).items())]
+    lines += ['# HELP dnd_sync_last_run_timestamp_seconds When the last sync_sounds.py run finished.',
+              '# TYPE dnd_sync_last_run_timestamp_seconds gauge',
+              'dnd_sync_last_run_timestamp_seconds %s' % _number(stats.get('finished_at', 0)),
+              '# HELP dnd_sync_rows Sound rows changed by the last sync_sounds.py run.',
+              '# TYPE dnd_sync_rows gauge']
+    lines += ['dnd_sync_rows%s %d' % (_labels([('change', change)]), count)
+              for change, count in sorted(stats.get('rows', {}).items())]
+    return lines
+
+
+def render():
+    """Every metric in the Prometheus text format."""
+    counters, histograms = _merged()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, kind)]
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append('%s%s %s' % (name, _labels(json.loads(labels)), _number(value)))
+            continue
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            pairs = json.loads(labels)
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, _labels(pairs, [('le', bound)]), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(pairs), _number(total)))
+            lines.append('%s_count%s %d' % (name, _labels(pairs), cumulative))
+    lines += _sync_lines()
+    return '\n'.join(lines) + '\n'
+
+
+def write_sync_stats(stages, rows):
+    """Called by sync_sounds.py at the end of a run: {stage: seconds}, {change: row count}."""
+    os.makedirs(os.path.dirname(SYNC_STATS_PATH), exist_ok=True)
+    tmp = SYNC_STATS_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'finished_at': time.time(), 'stages': {k: round(v, 3) for k, v in stages.items()}, 'rows': rows}, f)
+    os.replace(tmp, SYNC_STATS_PATH)
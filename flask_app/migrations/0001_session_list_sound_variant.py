@@ -0,0 +1,35 @@
+"""Add session_list_sounds.sound_variant_id; unique on (session_list_id, sound_id, sound_variant_id).
+
+SQLite recreates the table because it cannot drop a unique constraint.
+"""
+from flask_app import db
+
+
+def upgrade():
+    cols = {c['name'] for c in db.inspect(db.engine).get_columns('session_list_sounds')}
+    if 'sound_variant_id' in cols:
+        return
+    if db.engine.dialect.name != 'sqlite':
+        db.session.execute(db.text(
+            "ALTER TABLE session_list_sounds ADD COLUMN sound_variant_id INTEGER REFERENCES sound_variants(id)"
+        ))
+        db.session.execute(db.text("ALTER TABLE session_list_sounds DROP CONSTRAINT IF EXISTS uq_session_list_sound"))
+        return
+
+    db.session.execute(db.text("""
+        CREATE TABLE session_list_sounds_new (
+            id INTEGER NOT NULL PRIMARY KEY,
+            session_list_id INTEGER NOT NULL REFERENCES session_lists(id),
+            sound_id INTEGER NOT NULL REFERENCES sounds(id),
+            sound_variant_id INTEGER REFERENCES sound_variants(id),
+            sort_order INTEGER DEFAULT 0,
+            added_at DATETIME,
+            UNIQUE(session_list_id, sound_id, sound_variant_id)
+        )
+    """))
+    db.session.execute(db.text("""
+        INSERT INTO session_list_sounds_new (id, session_list_id, sound_id, sound_variant_id, sort_order, added_at)
+        SELECT id, session_list_id, sound_id, NULL, sort_order, added_at FROM session_list_sounds
+    """))
+    db.session.execute(db.text("DROP TABLE session_list_sounds"))
+    db.session.execute(db.text("ALTER TABLE session_list_sounds_new RENAME TO session_list_sounds"))
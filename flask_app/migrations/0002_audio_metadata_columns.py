@@ -0,0 +1,32 @@
+"""Add audio metadata and content_hash columns to sounds and sound_variants.
+
+Run python sync_sounds.py --full afterwards to fill them in.
+"""
+from flask_app import db
+
+COLUMNS = {
+    'sounds': [
+        ('sample_rate', 'INTEGER'),
+        ('channels', 'INTEGER'),
+        ('codec', 'VARCHAR(32)'),
+        ('bit_rate', 'INTEGER'),
+        ('content_hash', 'VARCHAR(16)'),
+    ],
+    'sound_variants': [
+        ('duration_seconds', 'FLOAT'),
+        ('sample_rate', 'INTEGER'),
+        ('channels', 'INTEGER'),
+        ('codec', 'VARCHAR(32)'),
+        ('bit_rate', 'INTEGER'),
+        ('content_hash', 'VARCHAR(16)'),
+    ],
+}
+
+
+def upgrade():
+    inspector = db.inspect(db.engine)
+    for table, columns in COLUMNS.items():
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        for name, col_type in columns:
+            if name not in existing:
+                db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}"))
@@ -0,0 +1,23 @@
+"""Index session_list_sounds by (session_list_id, sort_order) and respace keys ORDER_GAP apart."""
+from flask_app import db
+
+ORDER_GAP = 1024  # flask_app/list_order.py at the time of this migration
+
+
+def upgrade():
+    db.session.execute(db.text(
+        "CREATE INDEX IF NOT EXISTS ix_session_list_sounds_order "
+        "ON session_list_sounds (session_list_id, sort_order, sound_id, sound_variant_id)"
+    ))
+    rows = db.session.execute(db.text(
+        "SELECT id, session_list_id, sort_order FROM session_list_sounds ORDER BY session_list_id, sort_order, id"
+    )).fetchall()
+    updates = []
+    position = {}
+    for entry_id, list_id, sort_order in rows:
+        i = position.get(list_id, 0)
+        position[list_id] = i + 1
+        if sort_order != i * ORDER_GAP:
+            updates.append({'id': entry_id, 'sort_order': i * ORDER_GAP})
+    if updates:
+        db.session.execute(db.text("UPDATE session_list_sounds SET sort_order = :sort_order WHERE id = :id"), updates)
@@ -0,0 +1,16 @@
+"""Index the columns the API and sync filter on (see tests/test_query_plans.py)."""
+from flask_app import db
+
+INDEXES = [
+    ('ix_sounds_category_active', 'sounds', 'category_id, is_active'),
+    ('ix_sounds_file_path', 'sounds', 'file_path'),
+    ('ix_sound_variants_sound', 'sound_variants', 'sound_id, sort_order'),
+    ('ix_sound_variants_file_path', 'sound_variants', 'file_path'),
+    ('ix_session_lists_user_updated', 'session_lists', 'user_id, updated_at'),
+    ('ix_pending_email_changes_user', 'pending_email_changes', 'user_id'),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
@@ -0,0 +1,24 @@
+"""Add loudness columns (integrated LUFS, true peak, RMS) to sounds and sound_variants.
+
+Run python sync_sounds.py afterwards to measure every file (flask_app/loudness.py).
+"""
+from flask_app import db
+
+LOUDNESS_COLUMNS = [
+    ('loudness_lufs', 'FLOAT'),
+    ('true_peak_dbtp', 'FLOAT'),
+    ('rms_dbfs', 'FLOAT'),
+]
+COLUMNS = {
+    'sounds': LOUDNESS_COLUMNS,
+    'sound_variants': LOUDNESS_COLUMNS,
+}
+
+
+def upgrade():
+    inspector = db.inspect(db.engine)
+    for table, columns in COLUMNS.items():
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        for name, col_type in columns:
+            if name not in existing:
+                db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}"))
@@ -0,0 +1,6 @@
+"""Index active sounds by name: the catalog snapshot reads them in name order without a sort."""
+from flask_app import db
+
+
+def upgrade():
+    db.session.execute(db.text("CREATE INDEX IF NOT EXISTS ix_sounds_active_name ON sounds (is_active, name)"))
@@ -0,0 +1,70 @@
+"""D&D SFX App - Versioned schema migrations.
+
+Each module here named NNNN_description.py defines upgrade(), which runs inside an app context
+and changes the schema through db.session. `python migrate.py` applies the pending ones in
+order, committing each together with its row in schema_migrations.
+
+Whole tables never need a migration: upgrade() first runs db.create_all(), which adds any
+table the models define that the database lacks. create_all() (also run by init_db.py and
+sync_sounds.py) builds those tables in their current shape, so every migration must check
+before it alters and be a no-op on an up-to-date schema.
+"""
+import importlib
+import os
+import re
+
+from flask_app import db
+from flask_app.models import SchemaMigration
+
+_MODULE_RE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class Migration:
+    def __init__(self, revision, name, module):
+        self.revision = revision
+        self.name = name
+        self.module = module
+
+    @property
+    def description(self):
+        doc = (self.module.__doc__ or self.name).strip()
+        return doc.splitlines()[0]
+
+
+def discover():
+    """All migrations in this package, oldest first."""
+    found = []
+    for filename in sorted(os.listdir(os.path.dirname(os.path.abspath(__file__)))):
+        m = _MODULE_RE.match(filename)
+        if m:
+            module = importlib.import_module('%s.%s' % (__name__, filename[:-3]))
+            found.append(Migration(m.group(1), m.group(2), module))
+    return found
+
+
+def applied_revisions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {rev for (rev,) in db.session.query(SchemaMigration.revision)}
+
+
+def pending():
+    done = applied_revisions()
+    return [m for m in discover() if m.revision not in done]
+
+
+def upgrade(verbose=True):
+    """Apply every pending migration (call inside an app context). Returns the ones applied."""
+    db.create_all()
+    ran = []
+    for migration in pending():
+        if verbose:
+            print('Applying %s_%s: %s' % (migration.revision, migration.name, migration.description))
+        try:
+            migration.module.upgrade()
+            db.session.add(SchemaMigration(revision=migration.revision, name=migration.name))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        ran.append(migration)
+    return ran
@@ -0,0 +1,570 @@
+"""D&D SFX App - Server-side mixdown: a scene of layered sounds rendered to one streamed file.
+
+A scene is a set of tracks mixed for a duration:
+    {"tracks": [{"sound_id": 3, "sound_variant_id": null, "gain": 0.8, "offset": 0, "loop": true}, ...],
+     "duration": 60, "format": "opus"}
+A session list renders as a scene of its entries: ambience loops for the whole duration, the
+other sounds once from the start.
+
+Mixing is vectorized NumPy over BLOCK_FRAMES blocks. Each track is a streaming reader (PCM WAV
+parsed here, anything else decoded by ffmpeg), resampled to MIX_RATE on the fly, so neither the
+sources nor the mix are ever held whole. The 16-bit blocks are piped through ffmpeg into the
+requested format (the transcode.FORMATS encoders), or written out as WAV without ffmpeg.
+The output is teed into MIXDOWN_DIR under the scene's hash (file content hashes plus every
+parameter), and a repeat request is redirected to that file at /audio/mix/.
+
+numpy is optional: without it the endpoints answer 501.
+"""
+import hashlib
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+
+from flask import current_app
+
+try:
+    import numpy as np
+except ImportError:  # mixdown endpoints answer 501
+    np = None
+
+from flask_app import db, metrics
+from flask_app import transcode
+from flask_app.audio_probe import probe_file
+from flask_app.models import Sound, SoundVariant, SessionList, SessionListSound
+from flask_app.routes_audio import AUDIO_DIR, MIXDOWN_DIR
+
+MIXDOWN_URL = '/audio/mix/'  # served by flask_app/routes_audio.py
+
+MIX_RATE = 48000
+CHANNELS = 2
+BLOCK_FRAMES = 16384
+MAX_TRACKS = 16
+MAX_DURATION = 600
+LOOP_DURATION = 60  # default length of a scene that only loops
+MAX_GAIN = 4.0
+# Samples above KNEE are bent smoothly towards full scale instead of clipping hard.
+KNEE = 0.8
+# Bump when a change to the mixing would render the same scene differently (part of the cache key).
+MIX_VERSION = 1
+
+WAV_MIME = 'audio/wav'
+
+
+class SceneError(ValueError):
+    """The scene asks for something that cannot be rendered (shown to the client as a 400)."""
+
+
+# ---- Sources: float32 (frames, 2) blocks at a file's own rate ----
+class WavReader:
+    """PCM (8/16/24/32-bit) or float WAV, read a block at a time."""
+
+    _INT_SCALE = {1: 128.0, 2: 32768.0, 4: 2147483648.0}
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        try:
+            self._parse()
+        except Exception:
+            self.f.close()
+            raise
+
+    def _parse(self):
+        f = self.f
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise SceneError('not a WAV file')
+        size = os.fstat(f.fileno()).st_size
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise SceneError('WAV file has no data chunk')
+            chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                f.seek(chunk_size & 1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                self.data_start = f.tell()
+                self.data_size = min(chunk_size, size - self.data_start) if chunk_size else size - self.data_start
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+        if fmt is None or len(fmt) < 16:
+            raise SceneError('WAV file has no fmt chunk')
+        tag, self.channels, self.rate, _, self.block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+        if tag == 0xFFFE and len(fmt) >= 26:  # WAVE_FORMAT_EXTENSIBLE
+            tag = struct.unpack('<H', fmt[24:26])[0]
+        self.sample_bytes = bits // 8
+        if tag == 1 and self.sample_bytes in (1, 2, 3, 4):
+            self.float = False
+        elif tag == 3 and self.sample_bytes in (4, 8):
+            self.float = True
+        else:
+            raise SceneError('unsupported WAV encoding')
+        if not self.channels or self.block_align != self.channels * self.sample_bytes:
+            raise SceneError('malformed WAV header')
+        self.rewind()
+
+    def rewind(self):
+        self.f.seek(self.data_start)
+        self.remaining = self.data_size // self.block_align
+
+    def read(self, frames):
+        samples = self.read_native(frames)
+        if self.channels == 1:
+            return np.repeat(samples, CHANNELS, axis=1)
+        return samples[:, :CHANNELS]
+
+    def read_native(self, frames):
+        """float32 (frames, self.channels), every channel of the file."""
+        frames = min(frames, self.remaining)
+        raw = self.f.read(frames * self.block_align)
+        frames = len(raw) // self.block_align
+        self.remaining = self.remaining - frames if frames else 0  # a short read means a truncated file
+        raw = raw[:frames * self.block_align]
+        width = self.sample_bytes
+        if self.float:
+            samples = np.frombuffer(raw, '<f4' if width == 4 else '<f8').astype(np.float32)
+        elif width == 1:
+            samples = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / self._INT_SCALE[1]
+        elif width == 3:
+            # Place each 24-bit sample in the top bytes of an int32, then scale as 32-bit.
+            padded = np.zeros((frames * self.channels, 4), np.uint8)
+            padded[:, 1:] = np.frombuffer(raw, np.uint8).reshape(-1, 3)
+            samples = padded.view('<i4').ravel().astype(np.float32) / self._INT_SCALE[4]
+        else:
+            samples = np.frombuffer(raw, '<i%d' % width).astype(np.float32) / self._INT_SCALE[width]
+        return samples.reshape(frames, self.channels)
+
+    def close(self):
+        self.f.close()
+
+
+class FfmpegReader:
+    """Any format ffmpeg decodes, as float32 at MIX_RATE (ffmpeg resamples and mixes to channels)."""
+
+    def __init__(self, ffmpeg, path, channels=CHANNELS):
+        self.cmd = [ffmpeg, '-nostdin', '-v', 'error', '-i', path, '-vn',
+                    '-f', 'f32le', '-ac', str(channels), '-ar', str(MIX_RATE), '-']
+        self.rate = MIX_RATE
+        self.channels = channels
+        self.proc = None
+        self.rewind()
+
+    def rewind(self):
+        self.close()
+        self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, frames):
+        frame_bytes = 4 * self.channels
+        raw = self.proc.stdout.read(frames * frame_bytes)
+        raw = raw[:len(raw) // frame_bytes * frame_bytes]
+        return np.frombuffer(raw, '<f4').reshape(-1, self.channels)
+
+    read_native = read
+
+    def close(self):
+        if self.proc:
+            self.proc.kill()
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.proc = None
+
+
+class Resampler:
+    """Linear-interpolation rate conversion of a reader, one block at a time."""
+
+    def __init__(self, reader, rate):
+        self.reader = reader
+        self.step = reader.rate / rate
+        self.rewind(reset_reader=False)
+
+    def rewind(self, reset_reader=True):
+        if reset_reader:
+            self.reader.rewind()
+        self.buf = np.zeros((0, CHANNELS), np.float32)
+        self.pos = 0.0  # next output sample, in frames of buf
+        self.eof = False
+
+    def read(self, frames):
+        # Output k interpolates buf[left] and buf[left + 1], left = floor(pos + k * step).
+        need = int(self.pos + (frames - 1) * self.step) + 2
+        while len(self.buf) < need and not self.eof:
+            chunk = self.reader.read(max(BLOCK_FRAMES, need - len(self.buf)))
+            if len(chunk):
+                self.buf = np.concatenate([self.buf, chunk])
+            else:
+                self.eof = True
+                # Repeat the last frame so the final source frame is reached exactly.
+                self.buf = np.concatenate([self.buf, self.buf[-1:]])
+        if len(self.buf) < need:
+            span = len(self.buf) - 2 - self.pos
+            frames = min(frames, int(span / self.step) + 1 if span >= 0 else 0)
+            if not frames:
+                return np.zeros((0, CHANNELS), np.float32)
+        idx = self.pos + self.step * np.arange(frames)
+        left = idx.astype(np.int64)
+        frac = (idx - left).astype(np.float32)[:, None]
+        out = self.buf[left] * (1 - frac) + self.buf[left + 1] * frac
+        self.pos += frames * self.step
+        drop = min(int(self.pos), len(self.buf))
+        self.buf = self.buf[drop:]
+        self.pos -= drop
+        return out
+
+    def close(self):
+        self.reader.close()
+
+
+def open_source(path):
+    """A reader of path at MIX_RATE."""
+    try:
+        reader = WavReader(path)
+    except SceneError:
+        ffmpeg = transcode.ffmpeg_binary()
+        if not ffmpeg:
+            raise SceneError('%s needs ffmpeg to decode' % os.path.basename(path))
+        return FfmpegReader(ffmpeg, path)
+    return reader if reader.rate == MIX_RATE else Resampler(reader, MIX_RATE)
+
+
+def open_native(path):
+    """A reader of path with read_native() (its own channels), or None when it needs ffmpeg and
+    there is none. Used by the sync-time analyses (flask_app/loudness.py, flask_app/peaks.py)."""
+    try:
+        return WavReader(path)
+    except SceneError:
+        ffmpeg = transcode.ffmpeg_binary()
+        if not ffmpeg:
+            return None
+        return FfmpegReader(ffmpeg, path, channels=probe_file(path).get('channels') or CHANNELS)
+
+
+# ---- Scenes ----
+class Track:
+    def __init__(self, file_path, content_hash, duration, gain, offset, loop):
+        self.file_path = file_path
+        self.content_hash = content_hash
+        self.duration = duration
+        self.gain = gain
+        self.offset = offset
+        self.loop = loop
+
+    @property
+    def identity(self):
+        """Content hash when sync has recorded one, else path, size and mtime."""
+        if self.content_hash:
+            return self.content_hash
+        st = os.stat(os.path.join(AUDIO_DIR, self.file_path))
+        return '%s:%d:%d' % (self.file_path, st.st_size, st.st_mtime)
+
+
+class Scene:
+    def __init__(self, tracks, duration, fmt, bitrate_kbps, ffmpeg, cache_limit_bytes):
+        self.tracks = sorted(tracks, key=lambda t: (t.offset, t.file_path, t.gain, t.loop))
+        self.duration = duration
+        self.format = fmt
+        self.bitrate_kbps = bitrate_kbps
+        self.ffmpeg = ffmpeg
+        self.cache_limit_bytes = cache_limit_bytes
+        if fmt == 'wav':
+            self.extension, self.mime_type = 'wav', WAV_MIME
+        else:
+            self.extension, self.mime_type = transcode.FORMATS[fmt][:2]
+        spec = {
+            'v': MIX_VERSION, 'rate': MIX_RATE, 'duration': duration, 'format': fmt, 'kbps': bitrate_kbps,
+            'tracks': [[t.identity, t.gain, t.offset, t.loop] for t in self.tracks],
+        }
+        self.key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    @property
+    def file_path(self):
+        """Path relative to MIXDOWN_DIR."""
+        return '%s/%s.%s' % (self.key[:2], self.key, self.extension)
+
+    @property
+    def url(self):
+        return MIXDOWN_URL + self.file_path
+
+    def cached(self):
+        hit = os.path.isfile(os.path.join(MIXDOWN_DIR, self.file_path))
+        metrics.cache_lookup('mixdown', hit)
+        return hit
+
+
+def _number(value, name, low, high, default):
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise SceneError('%s must be a number' % name)
+    if not low <= value <= high:
+        raise SceneError('%s must be between %g and %g' % (name, low, high))
+    return value
+
+
+def _track(sound, variant, gain, offset, loop):
+    audio = variant or sound
+    path = os.path.join(AUDIO_DIR, audio.file_path)
+    if not os.path.isfile(path):
+        raise SceneError('Audio file missing for %s' % sound.name)
+    duration = audio.duration_seconds
+    if duration is None:
+        duration = probe_file(path).get('duration_seconds')
+    return Track(audio.file_path, audio.content_hash, duration, gain, offset, loop)
+
+
+def _scene(tracks, data):
+    if not tracks:
+        raise SceneError('Scene has no tracks')
+    if len(tracks) > MAX_TRACKS:
+        raise SceneError('At most %d tracks per scene' % MAX_TRACKS)
+    ends = [t.offset + (t.duration or 0) for t in tracks if not t.loop]
+    default_duration = min(max(ends or [0]) or LOOP_DURATION, MAX_DURATION)
+    duration = round(_number(data.get('duration'), 'duration', 0.1, MAX_DURATION, default_duration), 3)
+    ffmpeg = transcode.ffmpeg_binary()
+    config = current_app.config
+    fmt = (data.get('format') or config['AUDIO_DEFAULT_RENDITION'] or 'wav').lower()
+    if fmt != 'wav' and fmt not in transcode.FORMATS:
+        raise SceneError('format must be wav or one of %s' % ', '.join(transcode.FORMATS))
+    if not ffmpeg:
+        fmt = 'wav'  # nothing to encode with; WAV needs no encoder
+    bitrate = next((p.bitrate_kbps for p in transcode.parse_profiles(config['AUDIO_RENDITIONS']) if p.format == fmt), 96)
+    return Scene(tracks, duration, fmt, bitrate, ffmpeg, config['MIXDOWN_CACHE_MB'] * 1024 * 1024)
+
+
+def scene_from_request(data):
+    """Ad-hoc scene from a request body (see the module docstring)."""
+    raw_tracks = data.get('tracks')
+    if not isinstance(raw_tracks, list):
+        raise SceneError('tracks must be a list')
+    tracks = []
+    for raw in raw_tracks[:MAX_TRACKS + 1]:
+        if not isinstance(raw, dict):
+            raise SceneError('each track must be an object')
+        try:
+            sound_id = int(raw['sound_id'])
+            variant_id = int(raw['sound_variant_id']) if raw.get('sound_variant_id') is not None else None
+        except (KeyError, TypeError, ValueError):
+            raise SceneError('each track needs a sound_id')
+        sound = Sound.query.filter_by(id=sound_id, is_active=True).first()
+        if sound is None:
+            raise SceneError('Sound %d not found' % sound_id)
+        variant = None
+        if variant_id is not None:
+            variant = SoundVariant.query.filter_by(id=variant_id, sound_id=sound_id).first()
+            if variant is None:
+                raise SceneError('Variant %d not found for sound %d' % (variant_id, sound_id))
+        tracks.append(_track(
+            sound, variant,
+            _number(raw.get('gain'), 'gain', 0, MAX_GAIN, 1.0),
+            _number(raw.get('offset'), 'offset', 0, MAX_DURATION, 0.0),
+            bool(raw.get('loop')),
+        ))
+    return _scene(tracks, data)
+
+
+def scene_for_list(user_id, list_id, data):
+    """A session list as a scene: ambience loops, everything else once; None if not the user's list.
+
+    Every track gets gain 1/sqrt(n), so a full list sums to about full scale.
+    """
+    lst = SessionList.query.filter_by(id=list_id, user_id=user_id).first()
+    if lst is None:
+        return None
+    entries = lst.sounds.options(
+        db.joinedload(SessionListSound.sound).joinedload(Sound.category),
+        db.joinedload(SessionListSound.sound_variant),
+    ).all()
+    gain = 1 / max(1, len(entries)) ** 0.5
+    tracks = [
+        _track(e.sound, e.sound_variant, gain, 0.0, bool(e.sound.category and e.sound.category.slug == 'ambience'))
+        for e in entries
+    ]
+    return _scene(tracks, data)
+
+
+def prepare(builder, *args):
+    """(scene, None), or (None, (payload, status)) for the routes to return."""
+    if np is None:
+        return None, ({'error': 'Mixdown needs numpy: pip install numpy'}, 501)
+    try:
+        scene = builder(*args)
+    except SceneError as e:
+        return None, ({'error': str(e)}, 400)
+    if scene is None:
+        return None, ({'error': 'Session list not found'}, 404)
+    return scene, None
+
+
+# ---- Rendering ----
+def soft_clip(block):
+    """Bend samples above KNEE towards full scale (tanh), in place."""
+    level = np.abs(block)
+    over = level > KNEE
+    if over.any():
+        block[over] = np.sign(block[over]) * (KNEE + (1 - KNEE) * np.tanh((level[over] - KNEE) / (1 - KNEE)))
+    return block
+
+
+def mix_blocks(scene):
+    """Yield the mix as float32 (frames, 2) blocks of at most BLOCK_FRAMES."""
+    total = int(round(scene.duration * MIX_RATE))
+    voices = []
+    try:
+        for track in scene.tracks:
+            voices.append({
+                'reader': open_source(os.path.join(AUDIO_DIR, track.file_path)),
+                'start': int(round(track.offset * MIX_RATE)),
+                'gain': np.float32(track.gain),
+                'loop': track.loop,
+                'played': False,
+                'done': False,
+            })
+        pos = 0
+        while pos < total:
+            n = min(BLOCK_FRAMES, total - pos)
+            out = np.zeros((n, CHANNELS), np.float32)
+            for v in voices:
+                if v['done'] or v['start'] >= pos + n:
+                    continue
+                at = max(0, v['start'] - pos)
+                while at < n:
+                    chunk = v['reader'].read(n - at)
+                    if not len(chunk):
+                        if v['loop'] and v['played']:
+                            v['reader'].rewind()
+                            v['played'] = False
+                            continue
+                        v['done'] = True
+                        break
+                    v['played'] = True
+                    out[at:at + len(chunk)] += chunk * v['gain']
+                    at += len(chunk)
+            yield soft_clip(out)
+            pos += n
+    finally:
+        for v in voices:
+            v['reader'].close()
+
+
+def pcm16(block):
+    return (np.clip(block, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def wav_header(frames):
+    data_size = frames * CHANNELS * 2
+    return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, CHANNELS, MIX_RATE, MIX_RATE * CHANNELS * 2, CHANNELS * 2, 16)
+            + b'data' + struct.pack('<I', data_size))
+
+
+def wav_size(scene):
+    return 44 + int(round(scene.duration * MIX_RATE)) * CHANNELS * 2
+
+
+def _encode_wav(scene):
+    yield wav_header(int(round(scene.duration * MIX_RATE)))
+    for block in mix_blocks(scene):
+        yield pcm16(block)
+
+
+def _encode_ffmpeg(scene):
+    """Feed PCM to ffmpeg from a thread and yield what it writes, so both ends stream."""
+    _, _, muxer, codec_args = transcode.FORMATS[scene.format]
+    # MP4 needs a seekable output unless it is fragmented.
+    movflags = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof'] if muxer == 'ipod' else []
+    cmd = [scene.ffmpeg, '-nostdin', '-v', 'error', '-f', 's16le', '-ar', str(MIX_RATE), '-ac', str(CHANNELS),
+           '-i', '-', *codec_args, '-b:a', '%dk' % scene.bitrate_kbps, *movflags, '-f', muxer, '-']
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    failure = []
+
+    def feed():
+        try:
+            for block in mix_blocks(scene):
+                proc.stdin.write(pcm16(block))
+        except Exception as e:  # BrokenPipeError when the consumer went away
+            failure.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        while True:
+            chunk = proc.stdout.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+        if proc.wait() != 0 or failure:
+            raise RuntimeError('mixdown encode failed: %s' % (failure[0] if failure else 'ffmpeg exited with %d' % proc.returncode))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        feeder.join()
+        proc.wait()
+
+
+def render(scene):
+    """Encoded mix chunks, written through to the cache; an unfinished render leaves no file.
+
+    The last chunk is held back until the file is in place: servers may stop reading a body
+    once Content-Length bytes have gone out, and never resume the generator after that.
+    """
+    dst = os.path.join(MIXDOWN_DIR, scene.file_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix='.part')
+    held = None
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in (_encode_wav(scene) if scene.format == 'wav' else _encode_ffmpeg(scene)):
+                out.write(chunk)
+                if held is not None:
+                    yield held
+                held = chunk
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    prune(scene.cache_limit_bytes)
+    if held is not None:
+        yield held
+
+
+def prune(limit_bytes, directory=MIXDOWN_DIR):
+    """Delete the least recently written files under directory (mixes by default) until it fits limit_bytes."""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith('.part'):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= limit_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def stream_headers(scene):
+    """Headers for a render in progress: where the finished file will be, and its length if known."""
+    headers = {'Cache-Control': 'no-store', 'X-Mixdown-Url': scene.url}
+    if scene.format == 'wav':
+        headers['Content-Length'] = str(wav_size(scene))
+    return headers
@@ -1,8 +1,10 @@
 """D&D SFX App - Database models."""
 from datetime import datetime
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_app import db
+from flask_app.transcode import rendition_url
 
 
 class User(UserMixin, db.Model):
@@ -52,6 +54,8 @@ class PendingEmailChange(db.Model):
 
     user = db.relationship('User', backref=db.backref('pending_email_changes', cascade='all, delete-orphan'))
 
+    __table_args__ = (db.Index('ix_pending_email_changes_user', 'user_id'),)
+
 
 class Category(db.Model):
     """Sound effect category (e.g. Combat, Magic, Ambience)."""
@@ -67,14 +71,88 @@ class Category(db.Model):
 
     sounds = db.relationship('Sound', backref='category', lazy='dynamic')
 
-    def to_dict(self):
+    def to_dict(self, sound_count=None):
         return {
             'id': self.id,
             'name': self.name,
             'slug': self.slug,
             'description': self.description,
             'sort_order': self.sort_order,
-            'sound_count': self.sounds.count(),
+            'sound_count': self.sounds.count() if sound_count is None else sound_count,
+        }
+
+
+class CatalogState(db.Model):
+    """Single-row catalog version. sync_sounds.py bumps it so every worker drops its cached catalog."""
+    __tablename__ = 'catalog_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaMigration(db.Model):
+    """Applied revisions of flask_app/migrations (see migrate.py)."""
+    __tablename__ = 'schema_migrations'
+
+    revision = db.Column(db.String(32), primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def master_url(file_path, content_hash=None):
+    """Cache-forever /audio/m/ URL once sync has hashed the file, else the plain static URL."""
+    if not file_path:
+        return None
+    if content_hash:
+        return f'/audio/m/{content_hash}/{file_path}'
+    return f'/static/audio/{file_path}'
+
+
+def playback_urls(file_path, content_hash, renditions):
+    """(url, master_url, rendition dicts) for one audio file.
+
+    url is the AUDIO_DEFAULT_RENDITION format when that rendition exists, else the master.
+    """
+    master = master_url(file_path, content_hash)
+    if not renditions:
+        return master, master, []
+    items = sorted(renditions, key=lambda r: (r.format, -r.bitrate_kbps))
+    default_format = current_app.config.get('AUDIO_DEFAULT_RENDITION')
+    default = next((r for r in items if r.format == default_format), None)
+    return (
+        rendition_url(default.file_path) if default else master,
+        master,
+        [r.to_dict() for r in items],
+    )
+
+
+class SoundRendition(db.Model):
+    """Compressed delivery copy of one master file under static/audio (see flask_app/transcode.py).
+
+    Keyed by the master's path so a Sound and its first variant (same file) share rows.
+    """
+    __tablename__ = 'sound_renditions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_path = db.Column(db.String(500), nullable=False, index=True)
+    source_sha1 = db.Column(db.String(40), nullable=False)
+    format = db.Column(db.String(16), nullable=False)
+    bitrate_kbps = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(64), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)  # relative to static/renditions
+    size_bytes = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('source_path', 'format', 'bitrate_kbps', name='uq_sound_rendition'),)
+
+    def to_dict(self):
+        return {
+            'format': self.format,
+            'mime_type': self.mime_type,
+            'bitrate_kbps': self.bitrate_kbps,
+            'size_bytes': self.size_bytes,
+            'url': rendition_url(self.file_path),
         }
 
 
@@ -87,14 +165,45 @@ class SoundVariant(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     label = db.Column(db.String(80), nullable=True)  # e.g. "Version 1", "Heavy"
     sort_order = db.Column(db.Integer, default=0)
+    # Header metadata filled in by sync_sounds.py (flask_app/audio_probe.py)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    sample_rate = db.Column(db.Integer, nullable=True)
+    channels = db.Column(db.Integer, nullable=True)
+    codec = db.Column(db.String(32), nullable=True)
+    bit_rate = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(16), nullable=True)  # sha1 prefix of the file, versions its URL
+    # Loudness measured by sync_sounds.py (flask_app/loudness.py), for client-side gain normalization
+    loudness_lufs = db.Column(db.Float, nullable=True)
+    true_peak_dbtp = db.Column(db.Float, nullable=True)
+    rms_dbfs = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    renditions = db.relationship(
+        'SoundRendition',
+        primaryjoin='foreign(SoundRendition.source_path) == SoundVariant.file_path',
+        viewonly=True,
+        lazy='selectin',
+    )
+
+    # Indexes are created on existing databases by flask_app/migrations/0004_hot_query_indexes.py.
+    __table_args__ = (
+        db.Index('ix_sound_variants_sound', 'sound_id', 'sort_order'),
+        db.Index('ix_sound_variants_file_path', 'file_path'),
+    )
+
     def to_dict(self):
+        url, master, renditions = playback_urls(self.file_path, self.content_hash, self.renditions)
         return {
             'id': self.id,
             'file_path': self.file_path,
-            'url': f'/static/audio/{self.file_path}' if self.file_path else None,
+            'url': url,
+            'master_url': master,
+            'renditions': renditions,
             'label': self.label,
+            'duration_seconds': self.duration_seconds,
+            'loudness_lufs': self.loudness_lufs,
+            'true_peak_dbtp': self.true_peak_dbtp,
+            'rms_dbfs': self.rms_dbfs,
         }
 
 
@@ -107,28 +216,54 @@ class Sound(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)  # default/single file under static/audio
     duration_seconds = db.Column(db.Float, nullable=True)
+    sample_rate = db.Column(db.Integer, nullable=True)
+    channels = db.Column(db.Integer, nullable=True)
+    codec = db.Column(db.String(32), nullable=True)
+    bit_rate = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(16), nullable=True)  # sha1 prefix of the file, versions its URL
+    loudness_lufs = db.Column(db.Float, nullable=True)
+    true_peak_dbtp = db.Column(db.Float, nullable=True)
+    rms_dbfs = db.Column(db.Float, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     variants = db.relationship(
         'SoundVariant',
         backref='sound',
-        lazy='joined',
+        lazy='selectin',
         order_by='SoundVariant.sort_order',
         cascade='all, delete-orphan',
     )
+    renditions = db.relationship(
+        'SoundRendition',
+        primaryjoin='foreign(SoundRendition.source_path) == Sound.file_path',
+        viewonly=True,
+        lazy='selectin',
+    )
+
+    __table_args__ = (
+        db.Index('ix_sounds_category_active', 'category_id', 'is_active'),
+        db.Index('ix_sounds_active_name', 'is_active', 'name'),
+        db.Index('ix_sounds_file_path', 'file_path'),
+    )
 
     def to_dict(self):
         variant_list = sorted(self.variants, key=lambda v: (v.sort_order, v.id))
         variants_dict = [v.to_dict() for v in variant_list]
+        url, master, renditions = playback_urls(self.file_path, self.content_hash, self.renditions)
         return {
             'id': self.id,
             'name': self.name,
             'category_id': self.category_id,
             'category_name': self.category.name if self.category else None,
             'file_path': self.file_path,
-            'url': f'/static/audio/{self.file_path}' if self.file_path else None,
+            'url': url,
+            'master_url': master,
+            'renditions': renditions,
             'duration_seconds': self.duration_seconds,
+            'loudness_lufs': self.loudness_lufs,
+            'true_peak_dbtp': self.true_peak_dbtp,
+            'rms_dbfs': self.rms_dbfs,
             'is_active': self.is_active,
             'variants': variants_dict,
         }
@@ -152,14 +287,26 @@ class SessionList(db.Model):
         cascade='all, delete-orphan'
     )
 
-    def to_dict(self):
+    __table_args__ = (db.Index('ix_session_lists_user_updated', 'user_id', 'updated_at'),)
+
+    @staticmethod
+    def eager_entries(query):
+        """Load everything SessionListSound.to_dict() touches in a fixed number of queries."""
+        return query.options(
+            db.selectinload(SessionListSound.sound).joinedload(Sound.category),
+            db.selectinload(SessionListSound.sound_variant),
+        )
+
+    def to_dict(self, entries=None):
+        if entries is None:
+            entries = self.eager_entries(self.sounds).all()
         return {
             'id': self.id,
             'user_id': self.user_id,
             'name': self.name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'sounds': [s.to_dict() for s in self.sounds.all()],
+            'sounds': [s.to_dict() for s in entries],
         }
 
 
@@ -171,20 +318,25 @@ class SessionListSound(db.Model):
     session_list_id = db.Column(db.Integer, db.ForeignKey('session_lists.id'), nullable=False)
     sound_id = db.Column(db.Integer, db.ForeignKey('sounds.id'), nullable=False)
     sound_variant_id = db.Column(db.Integer, db.ForeignKey('sound_variants.id'), nullable=True)
-    sort_order = db.Column(db.Integer, default=0)
+    sort_order = db.Column(db.Integer, default=0)  # sparse keys, see flask_app/list_order.py
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     sound = db.relationship('Sound', backref='session_list_entries')
     sound_variant = db.relationship('SoundVariant', backref='session_list_entries', foreign_keys=[sound_variant_id])
 
-    __table_args__ = (db.UniqueConstraint('session_list_id', 'sound_id', 'sound_variant_id', name='uq_session_list_sound_variant'),)
+    __table_args__ = (
+        db.UniqueConstraint('session_list_id', 'sound_id', 'sound_variant_id', name='uq_session_list_sound_variant'),
+        # Ordered reads of a list (and its id/sound/variant columns) come straight from this index.
+        db.Index('ix_session_list_sounds_order', 'session_list_id', 'sort_order', 'sound_id', 'sound_variant_id'),
+    )
 
     def to_dict(self):
         sound_dict = self.sound.to_dict() if self.sound else None
         variant_url = None
         variant_label = None
         if self.sound_variant_id and self.sound_variant:
-            variant_url = '/static/audio/' + self.sound_variant.file_path if self.sound_variant.file_path else None
+            v = self.sound_variant
+            variant_url = playback_urls(v.file_path, v.content_hash, v.renditions)[0]
             variant_label = self.sound_variant.label
         return {
             'id': self.id,
@@ -196,3 +348,27 @@ class SessionListSound(db.Model):
             'variant_url': variant_url,
             'variant_label': variant_label,
         }
+
+
+class BroadcastEvent(db.Model):
+    """A live broadcast trigger, read back by every worker process (see flask_app/broadcast.py)."""
+    __tablename__ = 'broadcast_events'
+
+    id = db.Column(db.Integer, primary_key=True)  # the SSE event id
+    session_list_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(16), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON payload, without the id
+    play_at = db.Column(db.Float, nullable=True)  # server clock, epoch ms
+    origin = db.Column(db.String(32), nullable=False)  # publishing process (delivered its own listeners directly)
+
+    __table_args__ = (db.Index('ix_broadcast_events_list', 'session_list_id', 'id'),)
+
+
+class BroadcastListener(db.Model):
+    """How many listeners one worker process holds in a room, refreshed while it holds any."""
+    __tablename__ = 'broadcast_listeners'
+
+    session_list_id = db.Column(db.Integer, primary_key=True)
+    worker = db.Column(db.String(32), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    seen_at = db.Column(db.Float, nullable=False)  # epoch ms
@@ -0,0 +1,195 @@
+"""D&D SFX App - Waveform peaks: min/max thumbnails of each audio file, precomputed at sync time.
+
+build_file() decodes a file once (mixed across channels) and reduces it to min/max pairs at
+several resolutions: the finest has at most MAX_POINTS points, each coarser level halves it,
+down to MIN_POINTS. Values are int8 (-127..127 of full scale; min rounded down, max up, so a
+thumbnail never understates a peak). One file per content hash under PEAKS_DIR:
+    header  '<4sBBHII'  b'PEAK', version, bits (8), level count, sample rate, frames
+    levels  '<III'      per level: points, frames per point, byte offset of its data
+    data                per level: points x (min, max) int8
+GET /api/sounds/<id>/peaks answers with one level, sliced from a memory-mapped file:
+    header  '<4sBBHIII' b'PEAK', version, bits, 0, sample rate, frames per point, frames
+    data                points x (min, max) int8
+so a 256-point thumbnail is 532 bytes.
+"""
+import functools
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # sync_sounds.py skips the peaks
+    np = None
+
+from flask_app import db
+from flask_app.mixdown import open_native
+from flask_app.models import Sound, SoundVariant
+
+PEAKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'peaks')
+
+MAGIC = b'PEAK'
+VERSION = 1
+BITS = 8
+SCALE = 127
+FILE_HEADER = struct.Struct('<4sBBHII')
+LEVEL = struct.Struct('<III')
+RESPONSE_HEADER = struct.Struct('<4sBBHIII')
+
+BLOCK_FRAMES = 65536
+# Frames per bucket while streaming; levels are built from these, so it bounds the finest detail.
+BASE_FRAMES = 32
+MAX_POINTS = 4096
+MIN_POINTS = 32
+DEFAULT_POINTS = 256
+MAX_AGE = 3600
+
+NOT_FOUND = ({'error': 'No waveform for this sound (run sync_sounds.py)'}, 404)
+
+
+def peaks_path(content_hash):
+    """Path of a file's peaks relative to PEAKS_DIR."""
+    return '%s/%s.peaks' % (content_hash[:2], content_hash)
+
+
+# ---- Building (sync time) ----
+def _reduce(lows, highs, factor):
+    """Merge every factor consecutive buckets."""
+    pad = -len(lows) % factor
+    if pad:
+        lows = np.concatenate([lows, np.full(pad, np.inf, lows.dtype)])
+        highs = np.concatenate([highs, np.full(pad, -np.inf, highs.dtype)])
+    return lows.reshape(-1, factor).min(axis=1), highs.reshape(-1, factor).max(axis=1)
+
+
+def build_levels(lows, highs):
+    """[(frames per point, int8 (points, 2)), ...] from the finest level down, given BASE_FRAMES buckets."""
+    factor = max(1, -(-len(lows) // MAX_POINTS))
+    lows, highs = _reduce(lows, highs, factor)
+    span = BASE_FRAMES * factor
+    out = []
+    while True:
+        pairs = np.stack([np.floor(np.clip(lows, -1, 1) * SCALE), np.ceil(np.clip(highs, -1, 1) * SCALE)], axis=1)
+        out.append((span, pairs.astype(np.int8)))
+        if len(lows) <= MIN_POINTS:
+            return out
+        lows, highs = _reduce(lows, highs, 2)
+        span *= 2
+
+
+def encode(rate, frames, levels):
+    """The peaks file for build_levels() output (see the module docstring)."""
+    offset = FILE_HEADER.size + LEVEL.size * len(levels)
+    table = []
+    for span, pairs in levels:
+        table.append(LEVEL.pack(len(pairs), span, offset))
+        offset += pairs.nbytes
+    return b''.join([FILE_HEADER.pack(MAGIC, VERSION, BITS, len(levels), rate, frames)] + table
+                    + [pairs.tobytes() for _, pairs in levels])
+
+
+def compute(reader):
+    """(frames, levels) of everything reader yields, BASE_FRAMES buckets at a time."""
+    lows, highs = [], []
+    frames = 0
+    carry = None
+    while True:
+        block = reader.read_native(BLOCK_FRAMES)
+        if not len(block):
+            break
+        frames += len(block)
+        # Mixed across channels: a bucket's extremes over every channel.
+        if carry is not None and len(carry):
+            block = np.concatenate([carry, block])
+        whole = len(block) // BASE_FRAMES * BASE_FRAMES
+        buckets = block[:whole].reshape(-1, BASE_FRAMES * block.shape[1])
+        lows.append(buckets.min(axis=1))
+        highs.append(buckets.max(axis=1))
+        carry = block[whole:]
+    if carry is not None and len(carry):
+        lows.append(np.array([carry.min()], np.float32))
+        highs.append(np.array([carry.max()], np.float32))
+    if not frames:
+        return 0, []
+    return frames, build_levels(np.concatenate(lows), np.concatenate(highs))
+
+
+def build_file(job):
+    """Write the peaks of src to dst; job is (src, dst).
+
+    Returns True when written, False if src cannot be decoded, None if that needs ffmpeg and it
+    is missing (so a later sync tries again).
+    """
+    src, dst = job
+    try:
+        reader = open_native(src)
+    except OSError:
+        return False
+    if reader is None:
+        return None
+    try:
+        frames, result = compute(reader)
+    except (OSError, ValueError):
+        return False
+    finally:
+        reader.close()
+    if not frames:
+        return False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(encode(reader.rate, frames, result))
+    os.replace(tmp, dst)
+    return True
+
+
+def available():
+    return np is not None
+
+
+# ---- Serving ----
+@functools.lru_cache(maxsize=256)
+def _mapped(path):
+    """Peaks files are named by content hash and never rewritten, so a mapping can be kept."""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PeakLevel:
+    def __init__(self, content_hash, rate, frames, points, span, data):
+        self.etag = '%s-%d' % (content_hash, points)
+        self.body = RESPONSE_HEADER.pack(MAGIC, VERSION, BITS, 0, rate, span, frames) + data
+
+    def headers(self):
+        return {'Cache-Control': 'public, max-age=%d' % MAX_AGE, 'ETag': '"%s"' % self.etag}
+
+
+def read_level(content_hash, points):
+    """The coarsest level with at least points points (the finest if none has), or None."""
+    try:
+        buf = _mapped(os.path.join(PEAKS_DIR, peaks_path(content_hash)))
+    except (OSError, ValueError):  # missing, or empty (mmap of a 0-byte file)
+        return None
+    magic, version, _, count, rate, frames = FILE_HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        return None
+    table = [LEVEL.unpack_from(buf, FILE_HEADER.size + i * LEVEL.size) for i in range(count)]
+    n, span, offset = next((level for level in reversed(table) if level[0] >= points), table[0])
+    return PeakLevel(content_hash, rate, frames, n, span, buf[offset:offset + 2 * n])
+
+
+def prepare(sound_id, variant_id=None, points=None):
+    """(PeakLevel, None) for a sound or one of its variants, or (None, (payload, status))."""
+    points = min(max(points or DEFAULT_POINTS, 1), MAX_POINTS)
+    if variant_id is None:
+        audio = Sound.query.filter_by(id=sound_id, is_active=True).first()
+    else:
+        audio = (db.session.query(SoundVariant).join(Sound)
+                 .filter(SoundVariant.id == variant_id, SoundVariant.sound_id == sound_id, Sound.is_active == True)
+                 .first())
+    if audio is None:
+        return None, ({'error': 'Sound not found'}, 404)
+    level = read_level(audio.content_hash, points) if audio.content_hash else None
+    if level is None:
+        return None, NOT_FOUND
+    return level, None
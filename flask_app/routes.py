@@ -1,10 +1,35 @@
 """D&D SFX App - Main page routes."""
-from flask import Blueprint, render_template
+from flask import Blueprint, current_app, render_template
 from flask_login import login_required
 
+from flask_app import metrics
+from flask_app.catalog import current_version
+
 main_bp = Blueprint('main_bp', __name__)
 
 
+@main_bp.app_context_processor
+def inject_catalog_version():
+    """base.html registers the service worker per catalog version (see static/js/sw.js)."""
+    return {'catalog_version': current_version()}
+
+
+@main_bp.route('/sw.js')
+def service_worker():
+    """Served from the site root so the worker's scope covers every page."""
+    resp = current_app.send_static_file('js/sw.js')
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@main_bp.route('/metrics')
+def metrics_page():
+    """Prometheus scrape target (flask_app/metrics.py); keep it internal at the proxy."""
+    resp = current_app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    resp.cache_control.no_store = True
+    return resp
+
+
 @main_bp.route('/')
 def index():
     return render_template('index.html')
@@ -39,6 +64,12 @@ def session_guest_list(guest_id):
     return render_template('session.html', list_id='guest-' + guest_id, is_guest=True)
 
 
+@main_bp.route('/listen/<token>')
+def listen(token):
+    """Player page for a DM's live broadcast (no login: the signed token is the invitation)."""
+    return render_template('listen.html', token=token)
+
+
 @main_bp.route('/profile')
 @login_required
 def profile_page():
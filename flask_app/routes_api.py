@@ -1,18 +1,38 @@
-"""D&D SFX App - API routes for categories, sounds, session lists."""
-from flask import Blueprint, request, jsonify
+"""D&D SFX App - API routes for categories, sounds, session lists.
+
+The session list and broadcast handlers live in flask_app/session_lists.py and
+flask_app/broadcast.py, shared with the async API (flask_app/async_api.py); these routes
+add Flask's request parsing and login.
+"""
+from flask import Blueprint, Response, request, jsonify, current_app, redirect
 from flask_login import login_required, current_user
 
 from flask_app import db
-from flask_app.models import Category, Sound, SoundVariant, SessionList, SessionListSound
+from flask_app import broadcast, metrics, mixdown, peaks, session_lists, similarity
+from flask_app.catalog import catalog_response, document_response, get_snapshot
+from flask_app.models import Sound
 
 api_bp = Blueprint('api_bp', __name__)
 
 
+def _result(result):
+    payload, status = result
+    return jsonify(payload), status
+
+
+@api_bp.route('/catalog', methods=['GET'])
+def get_catalog():
+    """Whole catalog in one compact, precompressed document (browse.js filters it locally)."""
+    return document_response(get_snapshot(), request, current_app.response_class)
+
+
 # ---- Categories ----
 @api_bp.route('/categories', methods=['GET'])
 def list_categories():
-    cats = Category.query.filter_by(is_active=True).order_by(Category.sort_order, Category.name).all()
-    return jsonify({'categories': [c.to_dict() for c in cats]}), 200
+    snap = get_snapshot()
+    return catalog_response(
+        snap, ('categories',), lambda: {'categories': snap.categories}, request, current_app.response_class,
+    )
 
 
 # ---- Sounds ----
@@ -20,146 +40,198 @@ def list_categories():
 def list_sounds():
     category_id = request.args.get('category_id', type=int)
     search = (request.args.get('q') or '').strip()
-    q = Sound.query.filter_by(is_active=True).join(Category).filter(Category.is_active == True)
-    if category_id:
-        q = q.filter(Sound.category_id == category_id)
-    if search:
-        q = q.filter(Sound.name.ilike(f'%{search}%'))
-    sounds = q.order_by(Sound.name).all()
-    return jsonify({'sounds': [s.to_dict() for s in sounds]}), 200
+    snap = get_snapshot()
+    return catalog_response(
+        snap,
+        ('sounds', category_id or None, search),
+        lambda: {'sounds': snap.filter_sounds(category_id, search)},
+        request,
+        current_app.response_class,
+    )
+
+
+def sound_detail(sound_id):
+    s = Sound.query.filter_by(id=sound_id, is_active=True).options(db.joinedload(Sound.category)).first()
+    if not s:
+        return {'error': 'Sound not found'}, 404
+    return s.to_dict(), 200
 
 
 @api_bp.route('/sounds/<int:sound_id>', methods=['GET'])
 def get_sound(sound_id):
-    s = Sound.query.filter_by(id=sound_id, is_active=True).first()
-    if not s:
-        return jsonify({'error': 'Sound not found'}), 404
-    return jsonify(s.to_dict()), 200
+    return _result(sound_detail(sound_id))
+
+
+def peaks_response(level, if_none_match, response_class):
+    """The level's bytes, or 304 when the client already holds them (ETag)."""
+    if if_none_match.contains(level.etag):
+        return response_class(status=304, headers=level.headers())
+    return response_class(level.body, mimetype='application/octet-stream', headers=level.headers())
+
+
+@api_bp.route('/sounds/<int:sound_id>/peaks', methods=['GET'])
+def get_sound_peaks(sound_id):
+    """Waveform thumbnail of a sound (?variant=<id>) with at least ?points min/max pairs (flask_app/peaks.py)."""
+    level, error = peaks.prepare(sound_id, request.args.get('variant', type=int), request.args.get('points', type=int))
+    if error:
+        return _result(error)
+    return peaks_response(level, request.if_none_match, current_app.response_class)
+
+
+@api_bp.route('/sounds/<int:sound_id>/similar', methods=['GET'])
+def get_similar_sounds(sound_id):
+    """Sounds that sound like this one (?variant=<id> for one variant), best first (flask_app/similarity.py)."""
+    return _result(similarity.similar(sound_id, request.args.get('variant', type=int), request.args.get('limit', type=int)))
+
+
+def _mix_response(prepared):
+    """The finished file if this scene was rendered before, else the render as it streams."""
+    scene, error = prepared
+    if error:
+        return _result(error)
+    if scene.cached():
+        return redirect(scene.url, 303)
+    return Response(metrics.counted(mixdown.render(scene), 'mix'), mimetype=scene.mime_type,
+                    headers=mixdown.stream_headers(scene))
+
+
+@api_bp.route('/mixdown', methods=['POST'])
+@login_required
+def render_mixdown():
+    """Mix an ad-hoc scene (flask_app/mixdown.py) into one compressed file. Login required: renders are CPU heavy."""
+    return _mix_response(mixdown.prepare(mixdown.scene_from_request, request.get_json() or {}))
 
 
 # ---- Session lists (require login) ----
 @api_bp.route('/session-lists', methods=['GET'])
 @login_required
 def list_session_lists():
-    lists = SessionList.query.filter_by(user_id=current_user.id).order_by(SessionList.updated_at.desc()).all()
-    return jsonify({'session_lists': [lst.to_dict() for lst in lists]}), 200
+    return _result(session_lists.list_all(current_user.id))
+
+
+@api_bp.route('/session-lists/summary', methods=['GET'])
+@login_required
+def list_session_list_summaries():
+    return _result(session_lists.summaries(current_user.id))
 
 
 @api_bp.route('/session-lists', methods=['POST'])
 @login_required
 def create_session_list():
-    data = request.get_json()
-    name = (data.get('name') or '').strip()
-    if not name:
-        return jsonify({'error': 'List name is required'}), 400
-    lst = SessionList(user_id=current_user.id, name=name)
-    db.session.add(lst)
-    db.session.commit()
-    return jsonify(lst.to_dict()), 201
+    return _result(session_lists.create(current_user.id, request.get_json() or {}))
 
 
 @api_bp.route('/session-lists/<int:list_id>', methods=['GET'])
 @login_required
 def get_session_list(list_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    return jsonify(lst.to_dict()), 200
+    return _result(session_lists.get(current_user.id, list_id))
+
+
+@api_bp.route('/session-lists/<int:list_id>/manifest', methods=['GET'])
+@login_required
+def get_session_list_manifest(list_id):
+    return _result(session_lists.manifest(current_user.id, list_id))
+
+
+@api_bp.route('/session-lists/<int:list_id>/mixdown', methods=['GET'])
+@login_required
+def get_session_list_mixdown(list_id):
+    """The list as one mix (ambience looped): ?duration=<seconds>&format=<opus|aac|mp3|vorbis|wav>."""
+    return _mix_response(mixdown.prepare(mixdown.scene_for_list, current_user.id, list_id, request.args.to_dict()))
+
+
+@api_bp.route('/session-lists/<int:list_id>/sprite', methods=['GET'])
+@login_required
+def get_session_list_sprite(list_id):
+    """The list's files packed into one sprite plus the offset of each: ?format=<opus|aac|mp3|vorbis|wav>."""
+    return _result(session_lists.sprite_map(current_user.id, list_id, request.args.get('format')))
 
 
 @api_bp.route('/session-lists/<int:list_id>', methods=['PUT'])
 @login_required
 def update_session_list(list_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    data = request.get_json()
-    if data.get('name'):
-        lst.name = data['name'].strip()
-    db.session.commit()
-    return jsonify(lst.to_dict()), 200
+    return _result(session_lists.update(current_user.id, list_id, request.get_json() or {}))
 
 
 @api_bp.route('/session-lists/<int:list_id>', methods=['DELETE'])
 @login_required
 def delete_session_list(list_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    db.session.delete(lst)
-    db.session.commit()
-    return jsonify({'message': 'Deleted'}), 200
+    return _result(session_lists.delete(current_user.id, list_id))
 
 
 @api_bp.route('/session-lists/<int:list_id>/sounds', methods=['POST'])
 @login_required
 def add_sound_to_session_list(list_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    data = request.get_json() or {}
-    sound_id = data.get('sound_id')
-    if not sound_id:
-        return jsonify({'error': 'sound_id required'}), 400
-    if not Sound.query.get(sound_id):
-        return jsonify({'error': 'Sound not found'}), 404
-    sound_variant_id = data.get('sound_variant_id')
-    if sound_variant_id is not None:
-        v = SoundVariant.query.filter_by(id=sound_variant_id, sound_id=sound_id).first()
-        if not v:
-            return jsonify({'error': 'Variant not found for this sound'}), 400
-    else:
-        sound_variant_id = None
-    existing = SessionListSound.query.filter_by(
-        session_list_id=list_id, sound_id=sound_id, sound_variant_id=sound_variant_id
-    ).first()
-    if existing:
-        return jsonify({'error': 'This sound (or variant) is already in the list'}), 400
-    max_order = db.session.query(db.func.max(SessionListSound.sort_order)).filter_by(session_list_id=list_id).scalar() or 0
-    entry = SessionListSound(
-        session_list_id=list_id, sound_id=sound_id, sound_variant_id=sound_variant_id, sort_order=max_order + 1
-    )
-    db.session.add(entry)
-    db.session.commit()
-    return jsonify(entry.to_dict()), 201
+    return _result(session_lists.add_sound(current_user.id, list_id, request.get_json() or {}))
 
 
 @api_bp.route('/session-lists/<int:list_id>/sounds/<int:sound_id>', methods=['DELETE'])
 @login_required
 def remove_sound_from_session_list(list_id, sound_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    sound_variant_id = request.args.get('variant_id', type=int)
-    q = SessionListSound.query.filter_by(session_list_id=list_id, sound_id=sound_id)
-    if sound_variant_id is not None:
-        q = q.filter_by(sound_variant_id=sound_variant_id)
-    else:
-        q = q.filter_by(sound_variant_id=None)
-    entry = q.first()
-    if not entry:
-        q_any = SessionListSound.query.filter_by(session_list_id=list_id, sound_id=sound_id)
-        entry = q_any.first()
-    if not entry:
-        return jsonify({'error': 'Sound not in list'}), 404
-    db.session.delete(entry)
-    db.session.commit()
-    return jsonify({'message': 'Removed'}), 200
+    return _result(session_lists.remove_sound(
+        current_user.id, list_id, sound_id, request.args.get('variant_id', type=int),
+    ))
+
+
+@api_bp.route('/session-lists/<int:list_id>/sounds/batch', methods=['POST'])
+@login_required
+def batch_update_session_list_sounds(list_id):
+    return _result(session_lists.batch(current_user.id, list_id, request.get_json() or {}))
 
 
 @api_bp.route('/session-lists/<int:list_id>/sounds/reorder', methods=['PUT'])
 @login_required
 def reorder_session_list_sounds(list_id):
-    lst = SessionList.query.filter_by(id=list_id, user_id=current_user.id).first()
-    if not lst:
-        return jsonify({'error': 'Session list not found'}), 404
-    data = request.get_json()
-    order = data.get('sound_ids')
-    if not isinstance(order, list):
-        return jsonify({'error': 'sound_ids array required'}), 400
-    for i, sound_id in enumerate(order):
-        entry = SessionListSound.query.filter_by(session_list_id=list_id, sound_id=sound_id).first()
-        if entry:
-            entry.sort_order = i
-    db.session.commit()
-    return jsonify(lst.to_dict()), 200
+    return _result(session_lists.reorder(current_user.id, list_id, request.get_json() or {}))
+
+
+@api_bp.route('/session-lists/<int:list_id>/sounds/<int:entry_id>/position', methods=['PUT'])
+@login_required
+def move_session_list_sound(list_id, entry_id):
+    return _result(session_lists.move(current_user.id, list_id, entry_id, request.get_json() or {}))
+
+
+# ---- Live broadcast (flask_app/broadcast.py) ----
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+@api_bp.route('/session-lists/<int:list_id>/broadcast', methods=['GET'])
+@login_required
+def get_broadcast(list_id):
+    return _result(broadcast.status(current_user.id, list_id))
+
+
+@api_bp.route('/session-lists/<int:list_id>/broadcast/play', methods=['POST'])
+@login_required
+def broadcast_play(list_id):
+    return _result(broadcast.play(current_user.id, list_id, request.get_json() or {}))
+
+
+@api_bp.route('/session-lists/<int:list_id>/broadcast', methods=['DELETE'])
+@login_required
+def stop_broadcast(list_id):
+    return _result(broadcast.stop(current_user.id, list_id))
+
+
+@api_bp.route('/broadcast/time', methods=['GET'])
+def broadcast_time():
+    resp, status = _result(broadcast.clock())
+    resp.cache_control.no_store = True
+    return resp, status
+
+
+@api_bp.route('/broadcast/<token>', methods=['GET'])
+def broadcast_room(token):
+    return _result(broadcast.room(token))
+
+
+@api_bp.route('/broadcast/<token>/events', methods=['GET'])
+def broadcast_events(token):
+    """Server-sent events for a listener. Holds a server thread per listener: use the async API for big rooms."""
+    list_id = broadcast.list_id_for_token(token)
+    if list_id is None:
+        return _result(broadcast.NOT_FOUND)
+    if broadcast.streams_full():
+        return _result(broadcast.BUSY)
+    backlog = broadcast.replay(list_id, broadcast.last_event_id(request.headers.get('Last-Event-ID')))
+    return Response(broadcast.stream(list_id, backlog), mimetype='text/event-stream', headers=SSE_HEADERS)
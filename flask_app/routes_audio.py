@@ -0,0 +1,103 @@
+"""D&D SFX App - Audio file serving.
+
+Masters are served at /audio/m/<content hash>/<path>, renditions at /audio/r/<path>,
+rendered scene mixes at /audio/mix/<path> and session list sprites at /audio/sprite/<path>
+(all already named by content hash), so the URLs change whenever the bytes do and can be
+cached by browsers forever. Responses honour Range / If-Range / If-None-Match via
+send_file(conditional=True), and the file body goes through the server's
+wsgi.file_wrapper (sendfile() under gunicorn).
+
+Behind a proxy the bytes can be handed off instead:
+  AUDIO_X_SENDFILE=true                   -> X-Sendfile header (Apache mod_xsendfile, lighttpd)
+  AUDIO_ACCEL_REDIRECT=/_protected_audio/ -> X-Accel-Redirect (nginx); map
+      <prefix>m/ to flask_app/static/audio/, <prefix>r/ to flask_app/static/renditions/,
+      <prefix>mix/ to flask_app/static/mixdowns/ and <prefix>sprite/ to
+      flask_app/static/sprites/ as internal locations that add the same Cache-Control header.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Blueprint, Response, abort, current_app, redirect, send_from_directory
+from werkzeug.security import safe_join
+
+from flask_app import db, metrics
+from flask_app.models import Sound, SoundVariant
+from flask_app.transcode import RENDITIONS_DIR
+
+MIXDOWN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'mixdowns')
+SPRITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'sprites')
+
+audio_bp = Blueprint('audio_bp', __name__)
+
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'audio')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+mimetypes.add_type('audio/mp4', '.m4a')
+mimetypes.add_type('audio/ogg', '.opus')
+
+
+def _immutable(response):
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def send_audio(root, kind, file_path):
+    """Serve file_path from root, or hand it to the front proxy when AUDIO_ACCEL_REDIRECT is set."""
+    accel_prefix = current_app.config.get('AUDIO_ACCEL_REDIRECT')
+    if not accel_prefix:
+        # Missing files and ../ escapes become 404 inside send_from_directory.
+        response = send_from_directory(root, file_path, conditional=True, max_age=IMMUTABLE_MAX_AGE)
+    else:
+        full_path = safe_join(root, file_path)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+        response = Response(mimetype=mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + kind + '/' + quote(file_path)
+    metrics.audio_sent(kind, response)
+    return _immutable(response)
+
+
+def current_digest(file_path):
+    """Content hash sync recorded for file_path (a sound's or a variant's file), or None."""
+    query = db.union_all(*(
+        db.select(model.content_hash).where(model.file_path == file_path, model.content_hash.isnot(None))
+        for model in (Sound, SoundVariant)
+    )).limit(1)
+    return db.session.execute(query).scalar()
+
+
+@audio_bp.route('/audio/m/<digest>/<path:file_path>')
+def audio_master(digest, file_path):
+    """Original file under static/audio, cached forever only under its current content hash.
+
+    An old hash redirects (uncached) to the current URL; a path sync has not hashed is a 404.
+    """
+    current = current_digest(file_path)
+    if current is None:
+        abort(404)
+    if digest != current:
+        response = redirect('/audio/m/%s/%s' % (current, quote(file_path)), 302)
+        response.cache_control.no_cache = True
+        return response
+    return send_audio(AUDIO_DIR, 'm', file_path)
+
+
+@audio_bp.route('/audio/r/<path:file_path>')
+def audio_rendition(file_path):
+    return send_audio(RENDITIONS_DIR, 'r', file_path)
+
+
+@audio_bp.route('/audio/mix/<path:file_path>')
+def audio_mixdown(file_path):
+    """A scene mix rendered by flask_app/mixdown.py (named by the scene's hash)."""
+    return send_audio(MIXDOWN_DIR, 'mix', file_path)
+
+
+@audio_bp.route('/audio/sprite/<path:file_path>')
+def audio_sprite(file_path):
+    """A session list packed into one file by flask_app/sprite.py (named by its files' hashes)."""
+    return send_audio(SPRITES_DIR, 'sprite', file_path)
@@ -0,0 +1,120 @@
+"""D&D SFX App - Full-text sound search.
+
+On SQLite the sound_search FTS5 table indexes sound names, variant labels, category names
+and file path tokens, and is rebuilt by sync_sounds.py. Queries are token-prefix matches
+ranked by bm25. Other databases (or SQLite builds without FTS5) fall back to LIKE filters
+over the same fields. A query with no word characters at all (say "-" or "'") has no tokens
+to match, so it is matched as a case-insensitive substring of sound names, as searches
+were before the index.
+"""
+import re
+
+from sqlalchemy.exc import OperationalError
+
+from flask_app import db
+from flask_app.models import Category, Sound, SoundVariant
+
+FTS_TABLE = 'sound_search'
+# bm25 column weights: name, variant labels, category, paths.
+RANK_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+_TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def query_tokens(q):
+    """Lower-cased word tokens of a search string (punctuation and FTS syntax dropped)."""
+    return [t.lower() for t in _TOKEN_RE.findall(q or '')]
+
+
+def fts_supported():
+    """True when the bound database is SQLite and was compiled with FTS5."""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    rows = db.session.execute(db.text('PRAGMA compile_options')).fetchall()
+    return any(r[0] == 'ENABLE_FTS5' for r in rows)
+
+
+def index_exists():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    row = db.session.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first()
+    return row is not None
+
+
+def rebuild_index():
+    """Rebuild the FTS index from the sounds table. Returns False when FTS5 is unavailable."""
+    if not fts_supported():
+        return False
+    db.session.execute(db.text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, labels, category, paths, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    db.session.execute(db.text(f'DELETE FROM {FTS_TABLE}'))
+    db.session.execute(db.text(f"""
+        INSERT INTO {FTS_TABLE} (rowid, name, labels, category, paths)
+        SELECT s.id, s.name, COALESCE(v.labels, ''), c.name, s.file_path || ' ' || COALESCE(v.paths, '')
+        FROM sounds s
+        JOIN categories c ON c.id = s.category_id
+        LEFT JOIN (
+            SELECT sound_id, group_concat(label, ' ') AS labels, group_concat(file_path, ' ') AS paths
+            FROM sound_variants GROUP BY sound_id
+        ) v ON v.sound_id = s.id
+    """))
+    return True
+
+
+def _fts_search(tokens, limit):
+    match = ' '.join('"%s"*' % t.replace('"', '') for t in tokens)
+    sql = (
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match '
+        f'ORDER BY bm25({FTS_TABLE}, {", ".join(str(w) for w in RANK_WEIGHTS)})'
+    )
+    params = {'match': match}
+    if limit:
+        sql += ' LIMIT :limit'
+        params['limit'] = limit
+    return [row[0] for row in db.session.execute(db.text(sql), params)]
+
+
+def _like_search(tokens, limit):
+    """Fallback: every token must appear in the name, a variant label, the category or a path."""
+    q = db.session.query(Sound.id).join(Category)
+    for t in tokens:
+        pattern = f'%{t}%'
+        variant_match = db.session.query(SoundVariant.id).filter(
+            SoundVariant.sound_id == Sound.id,
+            db.or_(SoundVariant.label.ilike(pattern), SoundVariant.file_path.ilike(pattern)),
+        ).exists()
+        q = q.filter(db.or_(
+            Sound.name.ilike(pattern), Category.name.ilike(pattern), Sound.file_path.ilike(pattern), variant_match,
+        ))
+    q = q.order_by(Sound.name)
+    if limit:
+        q = q.limit(limit)
+    return [row[0] for row in q]
+
+
+def _substring_search(needle, limit):
+    """Sounds whose name contains needle (case-insensitive), by name."""
+    escaped = needle.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    q = db.session.query(Sound.id).filter(Sound.name.ilike(f'%{escaped}%', escape='\\')).order_by(Sound.name)
+    if limit:
+        q = q.limit(limit)
+    return [row[0] for row in q]
+
+
+def search_sound_ids(q, limit=None):
+    """Sound ids matching q, best match first. Does not filter on is_active (callers do)."""
+    tokens = query_tokens(q)
+    if not tokens:
+        needle = (q or '').strip()
+        return _substring_search(needle, limit) if needle else []
+    if db.engine.dialect.name == 'sqlite':
+        try:
+            return _fts_search(tokens, limit)
+        except OperationalError:
+            # Index not built yet (sync_sounds.py creates it) or no FTS5 in this SQLite build.
+            db.session.rollback()
+    return _like_search(tokens, limit)
@@ -0,0 +1,435 @@
+"""D&D SFX App - Session list operations behind the API.
+
+routes_api.py (Flask) and async_api.py (ASGI) both call these, so the two serve the same
+JSON. Each takes the signed-in user's id plus the parsed request and returns
+(payload, status). They work through db.session; the async API binds that to its
+AsyncSession while they run.
+"""
+import os
+from datetime import datetime
+
+from flask import current_app
+
+from flask_app import db
+from flask_app import sprite
+from flask_app.list_order import ORDER_GAP, gap_exhausted, key_between, lock_list, rebalance, schedule_rebalance, write_sort_orders
+from flask_app.models import Sound, SoundVariant, SessionList, SessionListSound, playback_urls
+from flask_app.routes_audio import AUDIO_DIR
+
+NOT_FOUND = ({'error': 'Session list not found'}, 404)
+
+
+def _owned(user_id, list_id):
+    return SessionList.query.filter_by(id=list_id, user_id=user_id).first()
+
+
+def list_all(user_id):
+    lists = SessionList.query.filter_by(user_id=user_id).order_by(SessionList.updated_at.desc()).all()
+    # Entries of every list in one eager-loaded query instead of one per list.
+    entries = {lst.id: [] for lst in lists}
+    if lists:
+        q = SessionList.eager_entries(
+            SessionListSound.query.filter(SessionListSound.session_list_id.in_(entries))
+        ).order_by(SessionListSound.sort_order)
+        for entry in q:
+            entries[entry.session_list_id].append(entry)
+    return {'session_lists': [lst.to_dict(entries[lst.id]) for lst in lists]}, 200
+
+
+def summaries(user_id):
+    """Names and sound counts only (list pickers, profile, session index), in one aggregate query."""
+    rows = (
+        db.session.query(SessionList.id, SessionList.name, SessionList.updated_at, db.func.count(SessionListSound.id))
+        .outerjoin(SessionListSound, SessionListSound.session_list_id == SessionList.id)
+        .filter(SessionList.user_id == user_id)
+        .group_by(SessionList.id, SessionList.name, SessionList.updated_at)
+        .order_by(SessionList.updated_at.desc())
+        .all()
+    )
+    return {'session_lists': [
+        {
+            'id': list_id,
+            'name': name,
+            'updated_at': updated_at.isoformat() if updated_at else None,
+            'sound_count': sound_count,
+        }
+        for list_id, name, updated_at, sound_count in rows
+    ]}, 200
+
+
+def create(user_id, data):
+    name = (data.get('name') or '').strip()
+    if not name:
+        return {'error': 'List name is required'}, 400
+    lst = SessionList(user_id=user_id, name=name)
+    db.session.add(lst)
+    db.session.commit()
+    return lst.to_dict(), 201
+
+
+def get(user_id, list_id):
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    return lst.to_dict(), 200
+
+
+def _preload_item(audio, sound_id, variant_id, priority):
+    """Playback URL of a sound or variant with its byte size (rendition size, else the master on disk)."""
+    url, _, renditions = playback_urls(audio.file_path, audio.content_hash, audio.renditions)
+    size = next((r['size_bytes'] for r in renditions if r['url'] == url), None)
+    if size is None:
+        try:
+            size = os.path.getsize(os.path.join(AUDIO_DIR, audio.file_path))
+        except OSError:
+            pass
+    return {
+        'url': url,
+        'size_bytes': size,
+        'duration_seconds': audio.duration_seconds,
+        'sound_id': sound_id,
+        'variant_id': variant_id,
+        'priority': priority,
+    }
+
+
+def _playable(lst):
+    """(audio, preload item) for every file the list can play, one per URL.
+
+    Priority 0 is what a tap on a card plays (in list order); priority 1 is the other
+    variants of multi-variant sounds, reachable through the variant popover.
+    """
+    entries = (
+        lst.sounds
+        .options(db.selectinload(SessionListSound.sound), db.selectinload(SessionListSound.sound_variant))
+        .all()
+    )
+    items = []
+    extra = []
+    for entry in entries:
+        if entry.sound is None:
+            continue
+        if entry.sound_variant is not None:
+            items.append((entry.sound_variant, _preload_item(entry.sound_variant, entry.sound_id, entry.sound_variant_id, 0)))
+            continue
+        items.append((entry.sound, _preload_item(entry.sound, entry.sound_id, None, 0)))
+        if len(entry.sound.variants) > 1:
+            for v in sorted(entry.sound.variants, key=lambda v: (v.sort_order, v.id)):
+                extra.append((v, _preload_item(v, entry.sound_id, v.id, 1)))
+    # The same file can be reachable from several entries (a sound and its first variant).
+    unique = []
+    urls = set()
+    for audio, item in items + extra:
+        if item['url'] not in urls:
+            urls.add(item['url'])
+            unique.append((audio, item))
+    return unique
+
+
+def manifest(user_id, list_id):
+    """Every file the list can play, for session.js to preload ("arm")."""
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    items = [item for _, item in _playable(lst)]
+    return {
+        'id': lst.id,
+        'items': items,
+        'total_bytes': sum(item['size_bytes'] or 0 for item in items),
+    }, 200
+
+
+def sprite_map(user_id, list_id, fmt=None):
+    """The list's files packed into one audio sprite with its offset map (flask_app/sprite.py)."""
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    payload, status = sprite.pack(_playable(lst), fmt)
+    if status == 200:
+        payload['id'] = lst.id
+    return payload, status
+
+
+def update(user_id, list_id, data):
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    if data.get('name'):
+        lst.name = data['name'].strip()
+    db.session.commit()
+    return lst.to_dict(), 200
+
+
+def delete(user_id, list_id):
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    db.session.delete(lst)
+    db.session.commit()
+    return {'message': 'Deleted'}, 200
+
+
+def add_sound(user_id, list_id, data):
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    sound_id = data.get('sound_id')
+    if not sound_id:
+        return {'error': 'sound_id required'}, 400
+    if not Sound.query.get(sound_id):
+        return {'error': 'Sound not found'}, 404
+    sound_variant_id = data.get('sound_variant_id')
+    if sound_variant_id is not None:
+        v = SoundVariant.query.filter_by(id=sound_variant_id, sound_id=sound_id).first()
+        if not v:
+            return {'error': 'Variant not found for this sound'}, 400
+    else:
+        sound_variant_id = None
+    existing = SessionListSound.query.filter_by(
+        session_list_id=list_id, sound_id=sound_id, sound_variant_id=sound_variant_id
+    ).first()
+    if existing:
+        return {'error': 'This sound (or variant) is already in the list'}, 400
+    # Uses the (session_list_id, sort_order) index: a backwards index seek, not a scan.
+    last = db.session.query(db.func.max(SessionListSound.sort_order)).filter_by(session_list_id=list_id).scalar()
+    entry = SessionListSound(
+        session_list_id=list_id, sound_id=sound_id, sound_variant_id=sound_variant_id, sort_order=key_between(last, None)
+    )
+    db.session.add(entry)
+    db.session.commit()
+    return entry.to_dict(), 201
+
+
+def remove_sound(user_id, list_id, sound_id, sound_variant_id=None):
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    q = SessionListSound.query.filter_by(session_list_id=list_id, sound_id=sound_id)
+    if sound_variant_id is not None:
+        q = q.filter_by(sound_variant_id=sound_variant_id)
+    else:
+        q = q.filter_by(sound_variant_id=None)
+    entry = q.first()
+    if not entry:
+        q_any = SessionListSound.query.filter_by(session_list_id=list_id, sound_id=sound_id)
+        entry = q_any.first()
+    if not entry:
+        return {'error': 'Sound not in list'}, 404
+    db.session.delete(entry)
+    db.session.commit()
+    return {'message': 'Removed'}, 200
+
+
+def _entry_key(ref):
+    """(sound_id, sound_variant_id) from a request item, or None if malformed."""
+    if not isinstance(ref, dict):
+        return None
+    try:
+        sound_id = int(ref['sound_id'])
+        variant_id = ref.get('sound_variant_id')
+        return sound_id, (int(variant_id) if variant_id is not None else None)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _list_entries(list_id):
+    """Current entries as lightweight rows (id, sound_id, sound_variant_id, sort_order), in list order."""
+    return (
+        db.session.query(SessionListSound.id, SessionListSound.sound_id,
+                         SessionListSound.sound_variant_id, SessionListSound.sort_order)
+        .filter(SessionListSound.session_list_id == list_id)
+        .order_by(SessionListSound.sort_order, SessionListSound.id)
+        .all()
+    )
+
+
+def _validate_additions(keys):
+    """Split (sound_id, variant_id) keys into (valid, rejected) with one query per table."""
+    sound_ids = {sid for sid, _ in keys}
+    variant_ids = {vid for _, vid in keys if vid is not None}
+    known_sounds = {sid for (sid,) in db.session.query(Sound.id).filter(Sound.id.in_(sound_ids))} if sound_ids else set()
+    variant_owner = dict(
+        db.session.query(SoundVariant.id, SoundVariant.sound_id).filter(SoundVariant.id.in_(variant_ids))
+    ) if variant_ids else {}
+    valid, rejected = [], []
+    for sid, vid in keys:
+        ok = sid in known_sounds and (vid is None or variant_owner.get(vid) == sid)
+        (valid if ok else rejected).append((sid, vid))
+    return valid, rejected
+
+
+def _key(entry):
+    return entry.sound_id, entry.sound_variant_id
+
+
+def apply_list_changes(lst, add=(), remove=(), order=None, entries=None):
+    """Add, remove and reorder entries of lst in set-based statements (the caller commits).
+
+    Entries are addressed by (sound_id, sound_variant_id), unique within a list. add is appended
+    (skipping keys already present) after the last key, ORDER_GAP apart; order lists keys to put
+    first, the remaining entries keep their relative order after them, and the whole list is
+    renumbered to multiples of ORDER_GAP (single moves should use move()). entries may pass in a fresh _list_entries(lst.id).
+    Returns {'added': [entry ids], 'removed': [entry ids], 'order': [entries whose position changed]}.
+    """
+    if entries is None:
+        entries = _list_entries(lst.id)
+    remove = set(remove)
+    removed = [e for e in entries if _key(e) in remove]
+    if removed:
+        db.session.execute(
+            db.delete(SessionListSound).where(SessionListSound.id.in_([e.id for e in removed]))
+            .execution_options(synchronize_session=False)
+        )
+        entries = [e for e in entries if _key(e) not in remove]
+    present = {_key(e) for e in entries}
+    new_keys = []
+    for key in add:
+        if key not in present:
+            present.add(key)
+            new_keys.append(key)
+    if new_keys:
+        base = key_between(max((e.sort_order or 0 for e in entries), default=None), None)
+        now = datetime.utcnow()
+        db.session.execute(SessionListSound.__table__.insert(), [
+            {'session_list_id': lst.id, 'sound_id': sid, 'sound_variant_id': vid,
+             'sort_order': base + i * ORDER_GAP, 'added_at': now}
+            for i, (sid, vid) in enumerate(new_keys)
+        ])
+        entries = _list_entries(lst.id)
+
+    changes = {}
+    if order is not None:
+        by_key = {_key(e): e for e in entries}
+        first = [by_key[key] for key in dict.fromkeys(order) if key in by_key]
+        listed = {e.id for e in first}
+        final = first + [e for e in entries if e.id not in listed]
+        changes = {e.id: i * ORDER_GAP for i, e in enumerate(final) if e.sort_order != i * ORDER_GAP}
+    if changes:
+        write_sort_orders(changes)
+    if new_keys or removed or changes:
+        lst.updated_at = datetime.utcnow()
+    new_keys = set(new_keys)
+    return {
+        'added': [e.id for e in entries if _key(e) in new_keys],
+        'removed': [e.id for e in removed],
+        'order': [
+            {'id': e.id, 'sound_id': e.sound_id, 'sound_variant_id': e.sound_variant_id, 'sort_order': changes[e.id]}
+            for e in sorted((e for e in entries if e.id in changes), key=lambda e: changes[e.id])
+        ],
+    }
+
+
+def batch(user_id, list_id, data):
+    """Add, remove and reorder entries in one transaction.
+
+    Body: {"add": [refs], "remove": [refs], "order": [refs]} where a ref is
+    {"sound_id", "sound_variant_id"?} (no variant = the whole sound) or, for existing entries,
+    {"id": entry_id}. Returns added/removed entry ids and only the entries whose position changed.
+    """
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    if not isinstance(data, dict):
+        return {'error': 'Body must be a JSON object'}, 400
+    add, remove, order = data.get('add') or [], data.get('remove') or [], data.get('order')
+    if not isinstance(add, list) or not isinstance(remove, list) or not isinstance(order, (list, type(None))):
+        return {'error': 'add, remove and order must be arrays'}, 400
+    add_keys = [_entry_key(ref) for ref in add]
+    if None in add_keys:
+        return {'error': 'Each added item needs a sound_id'}, 400
+    valid, rejected = _validate_additions(add_keys)
+    if rejected:
+        return {'error': 'Sound or variant not found', 'rejected': [
+            {'sound_id': sid, 'sound_variant_id': vid} for sid, vid in rejected
+        ]}, 400
+
+    entries = _list_entries(list_id)
+    key_by_id = {e.id: _key(e) for e in entries}
+
+    def resolve(refs):
+        keys = []
+        for ref in refs:
+            key = key_by_id.get(ref.get('id')) if isinstance(ref, dict) and 'id' in ref else _entry_key(ref)
+            if key is not None:
+                keys.append(key)
+        return keys
+
+    result = apply_list_changes(
+        lst, add=valid, remove=resolve(remove), order=resolve(order) if order is not None else None, entries=entries,
+    )
+    db.session.commit()
+    return result, 200
+
+
+def reorder(user_id, list_id, data):
+    """Reorder by sound_ids (every entry of a sound, variants included, moves together) or by entry_ids."""
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    entry_ids = data.get('entry_ids')
+    if entry_ids is None:
+        order = data.get('sound_ids')
+        if not isinstance(order, list):
+            return {'error': 'sound_ids or entry_ids array required'}, 400
+        entries = _list_entries(list_id)
+        by_sound = {}
+        for e in entries:
+            by_sound.setdefault(e.sound_id, []).append(_key(e))
+        keys = [key for sound_id in order for key in by_sound.get(sound_id, ())]
+    elif not isinstance(entry_ids, list):
+        return {'error': 'entry_ids must be an array'}, 400
+    else:
+        entries = _list_entries(list_id)
+        key_by_id = {e.id: _key(e) for e in entries}
+        keys = [key_by_id[i] for i in entry_ids if i in key_by_id]
+    apply_list_changes(lst, order=keys, entries=entries)
+    db.session.commit()
+    return lst.to_dict(), 200
+
+
+def move(user_id, list_id, entry_id, data):
+    """Move one entry to just after after_id (null = to the top). Updates only that row.
+
+    Body: {"after_id": entry_id | null}. Returns the entry's new sort_order.
+    """
+    lst = _owned(user_id, list_id)
+    if not lst:
+        return NOT_FOUND
+    if 'after_id' not in data:
+        return {'error': 'after_id required (null moves to the top)'}, 400
+    after_id = data['after_id']
+    if after_id == entry_id:
+        return {'error': 'Cannot move an entry after itself'}, 400
+    lock_list(list_id)
+    in_list = SessionListSound.query.filter_by(session_list_id=list_id)
+    entry = in_list.filter_by(id=entry_id).first()
+    if not entry:
+        return {'error': 'Sound not in list'}, 404
+
+    def neighbours():
+        others = db.session.query(SessionListSound.sort_order).filter(
+            SessionListSound.session_list_id == list_id, SessionListSound.id != entry_id,
+        )
+        if after_id is None:
+            return None, others.order_by(SessionListSound.sort_order).limit(1).scalar()
+        lo = db.session.query(SessionListSound.sort_order).filter_by(session_list_id=list_id, id=after_id).scalar()
+        if lo is None:
+            return False, None
+        hi = others.filter(SessionListSound.sort_order > lo).order_by(SessionListSound.sort_order).limit(1).scalar()
+        return lo, hi
+
+    lo, hi = neighbours()
+    if lo is False:
+        return {'error': 'after_id is not in this list'}, 400
+    key = key_between(lo, hi)
+    if key is None:
+        # The background rebalance has not caught up: make room now.
+        rebalance(list_id)
+        lo, hi = neighbours()
+        key = key_between(lo, hi)
+    entry.sort_order = key
+    lst.updated_at = datetime.utcnow()
+    db.session.commit()
+    if gap_exhausted(lo, key, hi):
+        schedule_rebalance(current_app._get_current_object(), list_id)
+    return {'id': entry_id, 'sort_order': key}, 200
@@ -0,0 +1,270 @@
+"""D&D SFX App - "Sounds like this": spectral embeddings and a nearest-neighbour index.
+
+At sync time features() decodes each file once and summarizes it as EMBED_DIM floats:
+mean and standard deviation over time of MFCCs 1..19 (40 mel bands, 46 ms Hann frames at
+half overlap, silent frames skipped; c0, the level, is left out so loudness does not
+matter), mean frame-to-frame MFCC change and log duration. sync_sounds.py caches them in
+the manifest per content hash and writes the index: one row per playable file (each
+variant, or the sound's own file when it has none), features standardized across the
+library and L2-normalized, packed into a float32 matrix in INDEX_PATH (.npy, rows sorted
+by sound id).
+
+similar() is an exact search: one matrix-vector product for cosine similarity and an
+argpartition for the top rows. At 100k rows that is ~16 MB and a few milliseconds, so no
+approximate index is needed. Each worker loads the matrix once and reloads it when the
+file changes.
+
+numpy is optional: without it sync skips the stage and the endpoint answers 501.
+"""
+import math
+import os
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # similar() answers 501
+    np = None
+
+from flask_app.catalog import get_snapshot
+from flask_app.mixdown import open_native
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'similarity.npy')
+# Bump when features() changes; the manifest key carries it, so old features are recomputed.
+FEATURE_VERSION = 1
+MANIFEST_KEY = 'features_v%d' % FEATURE_VERSION
+
+BLOCK_FRAMES = 65536
+FRAME_SECONDS = 0.046
+MEL_BANDS = 40
+MEL_LOW_HZ = 30.0
+MEL_HIGH_HZ = 16000.0
+N_MFCC = 20
+SILENCE_DB = -60.0
+EMBED_DIM = 2 * (N_MFCC - 1) + 2
+DEFAULT_LIMIT = 12
+MAX_LIMIT = 50
+
+NO_INDEX = ({'error': 'No similarity index (run sync_sounds.py)'}, 404)
+
+
+# ---- Features (sync time) ----
+def _mel(hz):
+    return 2595.0 * np.log10(1 + hz / 700.0)
+
+
+def _hz(mel):
+    return 700.0 * (10 ** (mel / 2595.0) - 1)
+
+
+def mel_filterbank(rate, n_fft):
+    """(MEL_BANDS, n_fft // 2 + 1) triangular filters, evenly spaced on the mel scale."""
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / rate)
+    edges = _hz(np.linspace(_mel(MEL_LOW_HZ), _mel(min(MEL_HIGH_HZ, rate / 2)), MEL_BANDS + 2))
+    low, center, high = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - low) / (center - low)
+    falling = (high - freqs) / (high - center)
+    return np.maximum(0, np.minimum(rising, falling))
+
+
+def dct_matrix():
+    """Orthonormal DCT-II rows 0..N_MFCC-1 over the mel bands."""
+    k = np.arange(N_MFCC)[:, None]
+    n = np.arange(MEL_BANDS)[None, :]
+    m = np.cos(math.pi * k * (2 * n + 1) / (2 * MEL_BANDS)) * math.sqrt(2.0 / MEL_BANDS)
+    m[0] /= math.sqrt(2)
+    return m
+
+
+class FeatureAccumulator:
+    """Streaming MFCC statistics of mono float blocks at rate."""
+
+    def __init__(self, rate):
+        self.n_fft = 1 << max(8, round(math.log2(rate * FRAME_SECONDS)))
+        self.hop = self.n_fft // 2
+        self.window = np.hanning(self.n_fft)
+        self.transform = dct_matrix()[1:].T  # log mel energies -> MFCCs 1.., c0 dropped
+        self.filters = mel_filterbank(rate, self.n_fft).T
+        self.silence = 10 ** (SILENCE_DB / 10) * self.n_fft * (self.window ** 2).mean()
+        self.rate = rate
+        self.samples = 0
+        self.pending = np.zeros(0)
+        self.count = 0
+        self.total = np.zeros(N_MFCC - 1)
+        self.squares = np.zeros(N_MFCC - 1)
+        self.change = 0.0
+        self.previous = None
+
+    def feed(self, mono):
+        self.samples += len(mono)
+        buf = np.concatenate([self.pending, mono])
+        if len(buf) < self.n_fft:
+            self.pending = buf
+            return
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.n_fft)[::self.hop]
+        self._frames(frames)
+        self.pending = buf[len(frames) * self.hop:]
+
+    def _frames(self, frames):
+        power = np.square(np.abs(np.fft.rfft(frames * self.window, axis=1))) / self.n_fft
+        voiced = power.mean(axis=1) > self.silence
+        if not voiced.any():
+            return
+        mfcc = np.log(power[voiced] @ self.filters + 1e-10) @ self.transform
+        self.count += len(mfcc)
+        self.total += mfcc.sum(axis=0)
+        self.squares += np.square(mfcc).sum(axis=0)
+        if self.previous is not None:
+            mfcc = np.concatenate([self.previous[None], mfcc])
+        self.change += float(np.abs(np.diff(mfcc, axis=0)).mean(axis=1).sum())
+        self.previous = mfcc[-1]
+
+    def finish(self):
+        """The embedding as a list of floats, or [] for silence."""
+        if self.pending.size and (not self.count or len(self.pending) > self.hop):
+            frame = np.zeros(self.n_fft)
+            frame[:len(self.pending)] = self.pending
+            self._frames(frame[None])
+        if not self.count:
+            return []
+        mean = self.total / self.count
+        std = np.sqrt(np.maximum(self.squares / self.count - np.square(mean), 0))
+        change = self.change / max(self.count - 1, 1)
+        duration = math.log1p(self.samples / self.rate)
+        return [round(float(v), 4) for v in np.concatenate([mean, std, [change, duration]])]
+
+
+def features(path):
+    """Embedding of the file at path (see the module docstring).
+
+    Returns [] if it is silent or cannot be decoded, None if decoding it needs ffmpeg and it is
+    missing (so a later sync tries again).
+    """
+    try:
+        reader = open_native(path)
+    except OSError:
+        return []
+    if reader is None:
+        return None
+    try:
+        acc = FeatureAccumulator(reader.rate)
+        while True:
+            block = reader.read_native(BLOCK_FRAMES)
+            if not len(block):
+                break
+            acc.feed(block.mean(axis=1, dtype=np.float64))
+        return acc.finish()
+    except (OSError, ValueError):
+        return []
+    finally:
+        reader.close()
+
+
+def available():
+    return np is not None
+
+
+# ---- Index ----
+ROW_DTYPE = [('sound_id', '<i4'), ('variant_id', '<i4'), ('vector', '<f4', (EMBED_DIM,))]
+
+
+def write_index(rows, path=None):
+    """rows: (sound_id, variant_id or None, embedding). Standardizes, normalizes and writes
+    atomically (to INDEX_PATH by default). Returns the row count."""
+    path = path or INDEX_PATH
+    rows = sorted((r for r in rows if len(r[2]) == EMBED_DIM), key=lambda r: (r[0], r[1] or 0))
+    table = np.zeros(len(rows), ROW_DTYPE)
+    if rows:
+        vectors = np.array([r[2] for r in rows], np.float64)
+        vectors = (vectors - vectors.mean(axis=0)) / (vectors.std(axis=0) + 1e-9)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+        table['sound_id'] = [r[0] for r in rows]
+        table['variant_id'] = [r[1] if r[1] is not None else -1 for r in rows]
+        table['vector'] = vectors
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+class Index:
+    def __init__(self, table, stamp):
+        self.stamp = stamp
+        self.sound_ids = np.ascontiguousarray(table['sound_id'])
+        self.variant_ids = np.ascontiguousarray(table['variant_id'])
+        self.matrix = np.ascontiguousarray(table['vector'], np.float32)
+
+    def rows_for(self, sound_id, variant_id=None):
+        """Row numbers of a sound (all its files), or of one variant."""
+        lo, hi = np.searchsorted(self.sound_ids, [sound_id, sound_id + 1])
+        rows = np.arange(lo, hi)
+        if variant_id is not None:
+            rows = rows[self.variant_ids[lo:hi] == variant_id]
+        return rows
+
+    def nearest(self, query, exclude_sound, limit):
+        """[(sound_id, variant_id or None, score)], best file per sound, most similar first."""
+        scores = self.matrix @ query
+        k = min(len(scores), limit * 4 + 8)  # spare rows: several may belong to one sound
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        seen = {exclude_sound}
+        out = []
+        for row in top:
+            sound_id = int(self.sound_ids[row])
+            if sound_id in seen:
+                continue
+            seen.add(sound_id)
+            variant_id = int(self.variant_ids[row])
+            out.append((sound_id, variant_id if variant_id >= 0 else None, float(scores[row])))
+            if len(out) == limit:
+                break
+        return out
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_index():
+    """The index in INDEX_PATH, reloaded when sync rewrites it; None if there is none."""
+    global _index
+    try:
+        st = os.stat(INDEX_PATH)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        if _index is None or _index.stamp != stamp:
+            _index = Index(np.load(INDEX_PATH), stamp)
+        return _index
+
+
+# ---- Operation (payload, status) ----
+def similar(sound_id, variant_id=None, limit=None):
+    """Active sounds that sound most like a sound (all its variants) or one of its variants."""
+    if np is None:
+        return {'error': 'Similarity search needs numpy on the server'}, 501
+    snap = get_snapshot()
+    if sound_id not in snap.sounds_by_id:
+        return {'error': 'Sound not found'}, 404
+    index = get_index()
+    if index is None:
+        return NO_INDEX
+    rows = index.rows_for(sound_id, variant_id)
+    if not len(rows):
+        return NO_INDEX
+    query = index.matrix[rows].mean(axis=0)
+    query /= np.linalg.norm(query) or 1.0
+    limit = min(max(limit or DEFAULT_LIMIT, 1), MAX_LIMIT)
+    results = []
+    # Over-ask: the index may still hold sounds deactivated since it was written.
+    for other_id, other_variant, score in index.nearest(query, sound_id, limit * 2):
+        sound = snap.sounds_by_id.get(other_id)
+        if sound is None:
+            continue
+        results.append({'sound': sound, 'sound_variant_id': other_variant, 'score': round(score, 4)})
+        if len(results) == limit:
+            break
+    return {'sound_id': sound_id, 'sound_variant_id': variant_id, 'similar': results}, 200
@@ -0,0 +1,267 @@
+"""D&D SFX App - Audio sprites: every file a session list can play, packed into one file.
+
+pack() lays the files out one after another, GAP_SECONDS of silence apart, as 16-bit
+stereo at MIX_RATE (decoded and resampled by the mixdown readers), and encodes the result
+once into the default rendition format (WAV without ffmpeg). The answer maps each playback
+URL to its slice:
+    {"url": "/audio/sprite/ab/ab12....m4a", "format": "aac", "duration": 41.3,
+     "segments": [{"url": ..., "sound_id": 3, "variant_id": null, "start": 0.1, "duration": 1.52}, ...],
+     "skipped": [{"url": ..., "reason": "longer than 30 s"}]}
+so a client fetches and decodes one file and plays slices of it (session.js "Arm").
+
+Sprites are named by the hash of the set of files in them (content hashes, in a fixed
+order), so reordering a list, or another list with the same files, reuses the sprite. Each
+file's decoded PCM is cached under SEGMENTS_DIR by content hash: when entries change, only
+the new files are decoded before the sprite is re-encoded. Both caches drop their least
+recently used files beyond SPRITE_CACHE_MB.
+
+Long files (ambience beds) and anything past MAX_SPRITE_SECONDS are left out and listed in
+"skipped"; the client plays those from their own URLs.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+
+from flask import current_app
+
+try:
+    import numpy as np
+except ImportError:  # pack() answers 501
+    np = None
+
+from flask_app import metrics, transcode
+from flask_app.audio_probe import probe_file
+from flask_app.mixdown import (
+    BLOCK_FRAMES, CHANNELS, MIX_RATE, WAV_MIME, SceneError, Track, open_source, pcm16, prune, wav_header,
+)
+from flask_app.routes_audio import AUDIO_DIR, SPRITES_DIR
+
+SPRITES_URL = '/audio/sprite/'  # served by flask_app/routes_audio.py
+SEGMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'sprite_segments')
+
+FRAME_BYTES = 2 * CHANNELS
+# Silence before and between segments: room for encoder padding and frame overlap at the cuts.
+GAP_SECONDS = 0.1
+MAX_SEGMENT_SECONDS = 30
+# A decoded sprite costs ~384 KB per second in the browser (float32 stereo at 48 kHz).
+MAX_SPRITE_SECONDS = 120
+# Bump when a change to the packing would lay out the same files differently (part of the name).
+SPRITE_VERSION = 1
+
+
+class Sprite:
+    def __init__(self, identities, fmt, bitrate_kbps):
+        self.identities = sorted(identities)
+        self.format = fmt
+        self.bitrate_kbps = bitrate_kbps
+        if fmt == 'wav':
+            self.extension, self.mime_type = 'wav', WAV_MIME
+        else:
+            self.extension, self.mime_type = transcode.FORMATS[fmt][:2]
+        spec = {'v': SPRITE_VERSION, 'rate': MIX_RATE, 'gap': GAP_SECONDS, 'format': fmt, 'kbps': bitrate_kbps,
+                'files': self.identities}
+        self.key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    @property
+    def file_path(self):
+        """Path relative to SPRITES_DIR; the offset map sits next to it as .json."""
+        return '%s/%s.%s' % (self.key[:2], self.key, self.extension)
+
+    @property
+    def map_path(self):
+        return os.path.join(SPRITES_DIR, '%s/%s.json' % (self.key[:2], self.key))
+
+    @property
+    def url(self):
+        return SPRITES_URL + self.file_path
+
+
+# ---- Segments: one file's PCM, cached by content ----
+def segment_path(identity):
+    digest = hashlib.sha1(('%s:%d' % (identity, MIX_RATE)).encode()).hexdigest()
+    return os.path.join(SEGMENTS_DIR, digest[:2], digest + '.s16')
+
+
+def decode_segment(track):
+    """Path of the track's file as raw 16-bit stereo PCM at MIX_RATE, decoding it on a cache miss."""
+    dst = segment_path(track.identity)
+    hit = os.path.isfile(dst)
+    metrics.cache_lookup('sprite_segment', hit)
+    if hit:
+        os.utime(dst)  # recently used, for prune()
+        return dst
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            reader = open_source(os.path.join(AUDIO_DIR, track.file_path))
+            try:
+                while True:
+                    block = reader.read(BLOCK_FRAMES)
+                    if not len(block):
+                        break
+                    out.write(pcm16(block))
+            finally:
+                reader.close()
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return dst
+
+
+# ---- Packing ----
+def _chunks(segments):
+    """PCM of the sprite: leading gap, then each segment followed by a gap."""
+    gap = bytes(int(round(GAP_SECONDS * MIX_RATE)) * FRAME_BYTES)
+    yield gap
+    for path in segments:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(BLOCK_FRAMES * FRAME_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+        yield gap
+
+
+def _encode(sprite, segments, frames, dst):
+    """Write the sprite to dst. ffmpeg writes to a file, not a pipe, so the container records its
+    encoder delay (MP4 edit list, LAME header) and decoders trim it: offsets stay exact."""
+    if sprite.format == 'wav':
+        with open(dst, 'wb') as out:
+            out.write(wav_header(frames))
+            for chunk in _chunks(segments):
+                out.write(chunk)
+        return
+    _, _, muxer, codec_args = transcode.FORMATS[sprite.format]
+    cmd = [transcode.ffmpeg_binary(), '-nostdin', '-v', 'error', '-y', '-f', 's16le', '-ar', str(MIX_RATE),
+           '-ac', str(CHANNELS), '-i', '-', *codec_args, '-b:a', '%dk' % sprite.bitrate_kbps, '-f', muxer, dst]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for chunk in _chunks(segments):
+            proc.stdin.write(chunk)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    if proc.wait() != 0:
+        raise RuntimeError('sprite encode failed: ffmpeg exited with %d' % proc.returncode)
+
+
+def build(sprite, tracks):
+    """Decode what is not cached yet, encode the sprite and write its map. Returns the map."""
+    gap = int(round(GAP_SECONDS * MIX_RATE))
+    segments = []
+    offsets = {}
+    pos = gap
+    for track in sorted(tracks, key=lambda t: t.identity):
+        path = decode_segment(track)
+        frames = os.path.getsize(path) // FRAME_BYTES
+        offsets[track.identity] = [round(pos / MIX_RATE, 6), round(frames / MIX_RATE, 6)]
+        segments.append(path)
+        pos += frames + gap
+    dst = os.path.join(SPRITES_DIR, sprite.file_path)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix='.part')  # ffmpeg is told the muxer
+    os.close(fd)
+    try:
+        _encode(sprite, segments, pos, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    sprite_map = {'format': sprite.format, 'mime_type': sprite.mime_type, 'duration': round(pos / MIX_RATE, 4),
+                  'size_bytes': os.path.getsize(dst), 'segments': offsets}
+    # The map is written last: once it exists, so does the sprite.
+    tmp = sprite.map_path + '.part'
+    with open(tmp, 'w') as f:
+        json.dump(sprite_map, f)
+    os.replace(tmp, sprite.map_path)
+    return sprite_map
+
+
+def cached_map(sprite):
+    try:
+        with open(sprite.map_path) as f:
+            sprite_map = json.load(f)
+        os.utime(sprite.map_path)
+        os.utime(os.path.join(SPRITES_DIR, sprite.file_path))
+    except (OSError, ValueError):
+        metrics.cache_lookup('sprite', False)
+        return None
+    metrics.cache_lookup('sprite', True)
+    return sprite_map
+
+
+def _format(fmt):
+    config = current_app.config
+    fmt = (fmt or config['AUDIO_DEFAULT_RENDITION'] or 'wav').lower()
+    if fmt != 'wav' and fmt not in transcode.FORMATS:
+        raise SceneError('format must be wav or one of %s' % ', '.join(transcode.FORMATS))
+    if not transcode.ffmpeg_binary():
+        fmt = 'wav'  # nothing to encode with; WAV needs no encoder
+    bitrate = next((p.bitrate_kbps for p in transcode.parse_profiles(config['AUDIO_RENDITIONS']) if p.format == fmt), 96)
+    return fmt, bitrate
+
+
+# ---- Operation (payload, status) ----
+def pack(playable, fmt=None):
+    """The sprite of playable, [(sound or variant, preload item)] in priority order (see the
+    module docstring)."""
+    if np is None:
+        return {'error': 'Audio sprites need numpy: pip install numpy'}, 501
+    try:
+        fmt, bitrate = _format(fmt)
+    except SceneError as e:
+        return {'error': str(e)}, 400
+    tracks = {}
+    placed = []
+    skipped = []
+    total = 0.0
+    for audio, item in playable:
+        entry = {'url': item['url'], 'sound_id': item['sound_id'], 'variant_id': item['variant_id']}
+        path = os.path.join(AUDIO_DIR, audio.file_path)
+        if not os.path.isfile(path):
+            skipped.append(dict(entry, reason='file missing'))
+            continue
+        duration = audio.duration_seconds
+        if duration is None:
+            duration = probe_file(path).get('duration_seconds')
+        track = Track(audio.file_path, audio.content_hash, duration, 1.0, 0.0, False)
+        if track.identity not in tracks:
+            if duration is None or duration > MAX_SEGMENT_SECONDS:
+                skipped.append(dict(entry, reason='longer than %d s' % MAX_SEGMENT_SECONDS if duration else 'duration unknown'))
+                continue
+            if total + duration + GAP_SECONDS > MAX_SPRITE_SECONDS:
+                skipped.append(dict(entry, reason='sprite full'))
+                continue
+            tracks[track.identity] = track
+            total += duration + GAP_SECONDS
+        placed.append((track.identity, entry))
+    if not tracks:
+        return {'error': 'Nothing in this list fits in a sprite', 'skipped': skipped}, 404
+    sprite = Sprite(list(tracks), fmt, bitrate)
+    sprite_map = cached_map(sprite)
+    if sprite_map is None:
+        try:
+            sprite_map = build(sprite, tracks.values())
+        except SceneError as e:  # a file needs ffmpeg to decode
+            return {'error': str(e)}, 400
+        limit = current_app.config['SPRITE_CACHE_MB'] * 1024 * 1024
+        prune(limit, SPRITES_DIR)
+        prune(limit, SEGMENTS_DIR)
+    segments = []
+    for identity, entry in placed:
+        start, duration = sprite_map['segments'][identity]
+        segments.append(dict(entry, start=start, duration=duration))
+    return {
+        'url': sprite.url,
+        'format': sprite_map['format'],
+        'mime_type': sprite_map['mime_type'],
+        'duration': sprite_map['duration'],
+        'size_bytes': sprite_map['size_bytes'],
+        'segments': segments,
+        'skipped': skipped,
+    }, 200
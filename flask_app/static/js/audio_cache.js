@@ -0,0 +1,266 @@
+/** Decoded Web Audio buffers for instant playback ("arm" mode in session.js), with a memory budget and LRU eviction. */
+(function() {
+    var MB = 1024 * 1024;
+    var BYTES_PER_SAMPLE = 4; /* AudioBuffer channels are float32 */
+    var PRELOAD_CONCURRENCY = 3;
+
+    function defaultBudget() {
+        /* navigator.deviceMemory is in GB and capped at 8; spend at most 1/16 of it, 64–256 MB. */
+        var gb = navigator.deviceMemory || 4;
+        return Math.max(64, Math.min(256, gb * 1024 / 16)) * MB;
+    }
+
+    function AudioBufferCache(budgetBytes) {
+        this.budget = budgetBytes || defaultBudget();
+        this.used = 0;
+        this.entries = new Map(); /* url -> { buffer, bytes }; iteration order is least recently used first */
+        this.pending = {};
+        this.context = null;
+    }
+
+    AudioBufferCache.isSupported = function() {
+        return !!(window.AudioContext || window.webkitAudioContext);
+    };
+
+    AudioBufferCache.prototype.getContext = function() {
+        if (!this.context) {
+            var Ctx = window.AudioContext || window.webkitAudioContext;
+            this.context = new Ctx();
+        }
+        return this.context;
+    };
+
+    /** Call from a user gesture: browsers keep a new AudioContext suspended until then. */
+    AudioBufferCache.prototype.resume = function() {
+        var ctx = this.getContext();
+        return ctx.state === 'suspended' ? ctx.resume() : Promise.resolve();
+    };
+
+    AudioBufferCache.prototype.has = function(url) {
+        return this.entries.has(url);
+    };
+
+    AudioBufferCache.prototype.get = function(url) {
+        var entry = this.entries.get(url);
+        if (!entry) return null;
+        this.entries.delete(url);
+        this.entries.set(url, entry);
+        return entry.buffer;
+    };
+
+    AudioBufferCache.prototype.put = function(url, buffer) {
+        var bytes = buffer.length * buffer.numberOfChannels * BYTES_PER_SAMPLE;
+        if (bytes > this.budget) return false;
+        if (this.entries.has(url)) this.remove(url);
+        var it = this.entries.keys();
+        while (this.used + bytes > this.budget) this.remove(it.next().value);
+        this.entries.set(url, { buffer: buffer, bytes: bytes });
+        this.used += bytes;
+        return true;
+    };
+
+    AudioBufferCache.prototype.remove = function(url) {
+        var entry = this.entries.get(url);
+        if (!entry) return;
+        this.entries.delete(url);
+        this.used -= entry.bytes;
+    };
+
+    AudioBufferCache.prototype.clear = function() {
+        this.entries.clear();
+        this.used = 0;
+    };
+
+    /** Decoded size of a clip at the context's rate, for planning preloads from a manifest. */
+    AudioBufferCache.prototype.estimateBytes = function(durationSeconds, channels) {
+        if (!durationSeconds) return 0;
+        return Math.ceil(durationSeconds * this.getContext().sampleRate) * (channels || 2) * BYTES_PER_SAMPLE;
+    };
+
+    /** Fetch and decode url into the cache (once, even if requested concurrently). Resolves to the buffer. */
+    AudioBufferCache.prototype.load = function(url) {
+        var self = this;
+        var cached = this.get(url);
+        if (cached) return Promise.resolve(cached);
+        if (this.pending[url]) return this.pending[url];
+        var ctx = this.getContext();
+        var p = fetch(url, { credentials: 'same-origin' })
+            .then(function(r) {
+                if (!r.ok) throw new Error('HTTP ' + r.status);
+                return r.arrayBuffer();
+            })
+            .then(function(data) {
+                /* Callback form: older Safari has no promise-returning decodeAudioData. */
+                return new Promise(function(resolve, reject) { ctx.decodeAudioData(data, resolve, reject); });
+            })
+            .then(function(buffer) {
+                self.put(url, buffer);
+                return buffer;
+            });
+        this.pending[url] = p;
+        var done = function() { delete self.pending[url]; };
+        p.then(done, done);
+        return p;
+    };
+
+    /**
+     * Preload items ({ url, duration_seconds }) in order until the budget is spent, so low-priority
+     * items never evict higher ones. onProgress(done, total) after each file. Resolves to
+     * { loaded, failed, skipped }.
+     */
+    AudioBufferCache.prototype.preload = function(items, onProgress) {
+        var self = this;
+        var planned = 0;
+        var queue = [];
+        var skipped = 0;
+        items.forEach(function(item) {
+            if (self.has(item.url)) return;
+            var estimate = self.estimateBytes(item.duration_seconds);
+            if (self.used + planned + estimate > self.budget) { skipped++; return; }
+            planned += estimate;
+            queue.push(item.url);
+        });
+        var total = queue.length;
+        var finished = 0;
+        var failed = 0;
+        function next() {
+            var url = queue.shift();
+            if (url === undefined) return Promise.resolve();
+            return self.load(url)
+                .catch(function() { failed++; })
+                .then(function() {
+                    finished++;
+                    if (onProgress) onProgress(finished, total);
+                    return next();
+                });
+        }
+        var workers = [];
+        for (var i = 0; i < PRELOAD_CONCURRENCY; i++) workers.push(next());
+        return Promise.all(workers).then(function() {
+            return { loaded: total - failed, failed: failed, skipped: skipped };
+        });
+    };
+
+    /**
+     * Fill the cache from an audio sprite (flask_app/sprite.py): fetch and decode its one file, then
+     * copy each segment ({ url, start, duration }) out as the buffer for that url. Resolves to
+     * the number of segments cached.
+     */
+    AudioBufferCache.prototype.loadSprite = function(sprite) {
+        var self = this;
+        var ctx = this.getContext();
+        return fetch(sprite.url)
+            .then(function(r) {
+                if (!r.ok) throw new Error('HTTP ' + r.status);
+                return r.arrayBuffer();
+            })
+            .then(function(data) {
+                return new Promise(function(resolve, reject) { ctx.decodeAudioData(data, resolve, reject); });
+            })
+            .then(function(whole) {
+                var rate = whole.sampleRate;
+                var loaded = 0;
+                sprite.segments.forEach(function(segment) {
+                    if (self.has(segment.url)) return;
+                    var start = Math.round(segment.start * rate);
+                    var length = Math.min(Math.round(segment.duration * rate), whole.length - start);
+                    if (length <= 0) return;
+                    var buffer = ctx.createBuffer(whole.numberOfChannels, length, rate);
+                    for (var c = 0; c < whole.numberOfChannels; c++) {
+                        buffer.getChannelData(c).set(whole.getChannelData(c).subarray(start, start + length));
+                    }
+                    if (self.put(segment.url, buffer)) loaded++;
+                });
+                return loaded;
+            });
+    };
+
+    /** HTMLAudioElement-like player for a cached buffer (play, pause, currentTime, ended, events). */
+    AudioBufferCache.prototype.createPlayer = function(url) {
+        var buffer = this.get(url);
+        return buffer ? new BufferPlayer(this.getContext(), buffer) : null;
+    };
+
+    function BufferPlayer(ctx, buffer) {
+        this.ctx = ctx;
+        this.buffer = buffer;
+        this.paused = true;
+        this.ended = false;
+        this._offset = 0;
+        this._startedAt = 0;
+        this._source = null;
+        this._listeners = {};
+    }
+
+    BufferPlayer.prototype.addEventListener = function(type, fn) {
+        (this._listeners[type] = this._listeners[type] || []).push(fn);
+    };
+
+    BufferPlayer.prototype._emit = function(type) {
+        var self = this;
+        (this._listeners[type] || []).forEach(function(fn) { fn.call(self, { type: type, target: self }); });
+    };
+
+    BufferPlayer.prototype.play = function() {
+        if (this._offset >= this.buffer.duration) this._offset = 0;
+        return this._start(0, this._offset);
+    };
+
+    /** Start at AudioContext time `when` (broadcast.js); if that has passed, skip into the clip to stay in step. */
+    BufferPlayer.prototype.playAt = function(when) {
+        var late = this.ctx.currentTime - when;
+        if (late <= 0) return this._start(when, this._offset);
+        if (this._offset + late >= this.buffer.duration) return Promise.resolve();
+        return this._start(0, this._offset + late);
+    };
+
+    BufferPlayer.prototype._start = function(when, offset) {
+        if (!this.paused) return Promise.resolve();
+        var self = this;
+        var source = this.ctx.createBufferSource();
+        source.buffer = this.buffer;
+        source.connect(this.ctx.destination);
+        source.onended = function() {
+            if (self._source !== source) return;
+            self._source = null;
+            self._offset = 0;
+            self.paused = true;
+            self.ended = true;
+            self._emit('ended');
+        };
+        source.start(when, offset);
+        this._startedAt = Math.max(when, this.ctx.currentTime) - offset;
+        this._source = source;
+        this.paused = false;
+        this.ended = false;
+        this._emit('play');
+        return Promise.resolve();
+    };
+
+    BufferPlayer.prototype.pause = function() {
+        if (this.paused) return;
+        this._offset = Math.max(0, this.ctx.currentTime - this._startedAt);
+        var source = this._source;
+        this._source = null;
+        source.stop();
+        this.paused = true;
+        this._emit('pause');
+    };
+
+    Object.defineProperty(BufferPlayer.prototype, 'currentTime', {
+        get: function() { return this.paused ? this._offset : Math.max(0, this.ctx.currentTime - this._startedAt); },
+        set: function(t) {
+            var playing = !this.paused;
+            if (playing) {
+                this._source.onended = null;
+                this._source.stop();
+                this._source = null;
+                this.paused = true;
+            }
+            this._offset = t;
+            if (playing) this.play();
+        }
+    });
+
+    window.AudioBufferCache = AudioBufferCache;
+})();
@@ -0,0 +1,173 @@
+/**
+ * Live broadcast (flask_app/broadcast.py). window.BroadcastClock estimates the offset to the server
+ * clock and starts players at a server time; session.js uses it on the DM's side. On /listen/<token>
+ * (#broadcast-listen) this also runs the player page: preload the list, follow the room's event
+ * stream and play each trigger at its play_at.
+ */
+(function() {
+    var SAMPLES = 8;
+    var RESYNC_MS = 60 * 1000;
+    var RETRY_MS = 3000;  /* after the server turned the stream away */
+
+    /* Local clock: performance.now() is monotonic, unlike Date.now() which NTP or the user can step. */
+    function localNow() { return performance.now(); }
+
+    function BroadcastClock() {
+        this.offset = null; /* server ms - local ms */
+        this.rtt = null;
+        this._timer = null;
+    }
+
+    BroadcastClock.prototype.sample = function() {
+        var t0 = localNow();
+        return fetch('/api/broadcast/time', { cache: 'no-store' })
+            .then(function(r) { return r.json(); })
+            .then(function(d) {
+                var t1 = localNow();
+                return { offset: d.now - (t0 + t1) / 2, rtt: t1 - t0 };
+            });
+    };
+
+    /** NTP-style: sequential samples, keep the fastest round trip (least queueing, least asymmetry). */
+    BroadcastClock.prototype.sync = function() {
+        var self = this;
+        var best = null;
+        var n = 0;
+        function next() {
+            if (n++ >= SAMPLES) {
+                if (best) {
+                    self.offset = best.offset;
+                    self.rtt = best.rtt;
+                }
+                return self;
+            }
+            return self.sample()
+                .then(function(s) { if (!best || s.rtt < best.rtt) best = s; }, function() {})
+                .then(next);
+        }
+        return next();
+    };
+
+    /** Sync now and every minute (clocks drift, and a better sample may come along). */
+    BroadcastClock.prototype.start = function() {
+        var self = this;
+        if (!this._timer) this._timer = setInterval(function() { self.sync(); }, RESYNC_MS);
+        return this.sync();
+    };
+
+    BroadcastClock.prototype.stop = function() {
+        clearInterval(this._timer);
+        this._timer = null;
+    };
+
+    /** AudioContext time at which output reaches the speaker at local time localMs. */
+    function contextTime(ctx, localMs) {
+        var ts = ctx.getOutputTimestamp && ctx.getOutputTimestamp();
+        if (ts && ts.performanceTime) return ts.contextTime + (localMs - ts.performanceTime) / 1000;
+        return ctx.currentTime + (localMs - localNow()) / 1000 - (ctx.outputLatency || ctx.baseLatency || 0);
+    }
+
+    /**
+     * Play player at serverMs on the server clock: sample-accurate for audio_cache.js BufferPlayers,
+     * a timer for <audio> elements. A start that has already passed skips into the clip.
+     */
+    BroadcastClock.prototype.playAt = function(player, serverMs) {
+        var localMs = serverMs - (this.offset || 0);
+        if (player.playAt) return player.playAt(contextTime(player.ctx, localMs));
+        var delay = localMs - localNow();
+        if (delay <= 0) return player.play();
+        return new Promise(function(resolve) {
+            setTimeout(function() { resolve(player.play()); }, delay);
+        });
+    };
+
+    window.BroadcastClock = BroadcastClock;
+
+    var root = document.getElementById('broadcast-listen');
+    if (!root) return;
+    var token = root.getAttribute('data-token');
+    var titleEl = document.getElementById('broadcast-title');
+    var statusEl = document.getElementById('broadcast-status');
+    var joinBtn = document.getElementById('broadcast-join');
+    var nowEl = document.getElementById('broadcast-now');
+    var clock = new BroadcastClock();
+    var cache = window.AudioBufferCache && window.AudioBufferCache.isSupported() ? new window.AudioBufferCache() : null;
+    var items = [];
+    var current = null;
+    var source = null;
+
+    function setStatus(text) { statusEl.textContent = text; }
+
+    function listeningStatus() {
+        var precision = clock.rtt != null ? ' · clock ±' + Math.ceil(clock.rtt / 2) + ' ms' : '';
+        setStatus('Listening' + precision);
+    }
+
+    function stopCurrent() {
+        if (!current) return;
+        current.pause();
+        current = null;
+    }
+
+    function play(event) {
+        stopCurrent();
+        nowEl.textContent = event.name || '';
+        var ready = cache
+            ? cache.load(event.url).then(function() { return cache.createPlayer(event.url); })
+            : Promise.reject(new Error('no Web Audio'));
+        ready
+            .catch(function() { return new Audio(event.url); })
+            .then(function(player) {
+                current = player;
+                return clock.playAt(player, event.play_at);
+            })
+            .catch(function() {});
+    }
+
+    function connect() {
+        source = new EventSource('/api/broadcast/' + encodeURIComponent(token) + '/events');
+        source.addEventListener('open', listeningStatus);
+        source.addEventListener('play', function(e) { play(JSON.parse(e.data)); });
+        source.addEventListener('stop', function() {
+            stopCurrent();
+            nowEl.textContent = '';
+            setStatus('The DM stopped broadcasting. Stay on this page for the next one.');
+        });
+        /* EventSource reconnects by itself, sending Last-Event-ID so triggers not yet due are replayed.
+           It gives up on an error status (503: the server process is full), so retry that ourselves. */
+        source.addEventListener('error', function() {
+            setStatus('Reconnecting…');
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, RETRY_MS);
+        });
+    }
+
+    fetch('/api/broadcast/' + encodeURIComponent(token), { cache: 'no-store' })
+        .then(function(r) {
+            if (!r.ok) throw new Error('not found');
+            return r.json();
+        })
+        .then(function(room) {
+            items = room.items || [];
+            titleEl.textContent = room.name;
+            joinBtn.hidden = false;
+            setStatus('Tap Join to hear the DM\'s sounds on this device.');
+        })
+        .catch(function() {
+            setStatus('This broadcast link is not valid.');
+        });
+
+    joinBtn.addEventListener('click', function() {
+        joinBtn.hidden = true;
+        /* Audio may only start after a gesture: resume the context now, while we have one. */
+        if (cache) cache.resume();
+        setStatus('Syncing clock…');
+        clock.start().then(function() {
+            connect();
+            if (!cache) return;
+            cache.preload(items.filter(function(i) { return i.priority === 0; }), function(done, total) {
+                if (done < total) setStatus('Loading sounds… ' + done + '/' + total);
+                else listeningStatus();
+            });
+        });
+    });
+})();
@@ -30,11 +30,62 @@
     var variantPopoverOutsideListener = null;
     var variantPopoverScrollListener = null;
 
-    function fetchCategories() {
-        return fetch('/api/categories', { credentials: 'same-origin' })
-            .then(function(r) { return r.json(); })
-            .then(function(data) {
-                categories = data.categories || [];
+    var CATALOG_STORAGE_KEY = 'dnd_catalog';
+    var catalogSounds = [];
+
+    /* Catalog is fetched once and cached in localStorage with its ETag; later loads revalidate (304) and filter locally. */
+    function readCachedCatalog() {
+        try {
+            var raw = localStorage.getItem(CATALOG_STORAGE_KEY);
+            return raw ? JSON.parse(raw) : null;
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function writeCachedCatalog(etag, doc) {
+        try {
+            localStorage.setItem(CATALOG_STORAGE_KEY, JSON.stringify({ etag: etag, doc: doc }));
+        } catch (e) { /* quota exceeded or storage disabled: keep working from memory */ }
+    }
+
+    function expandCatalog(doc) {
+        var names = {};
+        (doc.categories || []).forEach(function(c) { names[c.id] = c.name; });
+        return (doc.sounds || []).map(function(row) {
+            var s = { is_active: true };
+            doc.fields.forEach(function(f, i) { s[f] = row[i]; });
+            s.category_name = names[s.category_id] || null;
+            s.variants = row[doc.fields.length].map(function(vrow) {
+                var v = {};
+                doc.variant_fields.forEach(function(f, i) { v[f] = vrow[i]; });
+                return v;
+            });
+            return s;
+        });
+    }
+
+    function loadCatalog() {
+        var cached = readCachedCatalog();
+        var headers = {};
+        if (cached && cached.etag) headers['If-None-Match'] = cached.etag;
+        return fetch('/api/catalog', { credentials: 'same-origin', cache: 'no-store', headers: headers })
+            .then(function(r) {
+                if (r.status === 304 && cached) return cached.doc;
+                if (!r.ok) throw new Error('Catalog unavailable');
+                var etag = r.headers.get('ETag');
+                return r.json().then(function(doc) {
+                    if (etag) writeCachedCatalog(etag, doc);
+                    return doc;
+                });
+            })
+            .catch(function(e) {
+                if (cached) return cached.doc;
+                throw e;
+            })
+            .then(function(doc) {
+                categories = doc.categories || [];
+                catalogSounds = expandCatalog(doc);
                 categoryFilter.innerHTML = '<option value="">All categories</option>';
                 categories.forEach(function(c) {
                     var opt = document.createElement('option');
@@ -45,16 +96,34 @@
             });
     }
 
-    function fetchSounds() {
-        var params = new URLSearchParams();
-        if (categoryFilter.value) params.set('category_id', categoryFilter.value);
-        if (searchInput.value.trim()) params.set('q', searchInput.value.trim());
-        return fetch('/api/sounds?' + params.toString(), { credentials: 'same-origin' })
-            .then(function(r) { return r.json(); })
-            .then(function(data) {
-                sounds = data.sounds || [];
-                renderSounds();
+    /* Same matching as /api/sounds?q=: every query token must prefix a word in the name, a variant label, the category or a file path.
+       Text without tokens (only punctuation) matches as a substring of the name. */
+    function searchTokens(text) {
+        return text.normalize('NFD').replace(/\p{M}/gu, '').toLowerCase().split(/[^\p{L}\p{N}]+/u).filter(Boolean);
+    }
+
+    function searchWords(s) {
+        if (!s._words) {
+            s._words = searchTokens([s.name, s.category_name, s.file_path].concat((s.variants || []).map(function(v) {
+                return (v.label || '') + ' ' + (v.file_path || '');
+            })).join(' '));
+        }
+        return s._words;
+    }
+
+    function applyFilters() {
+        var categoryId = categoryFilter.value ? parseInt(categoryFilter.value, 10) : null;
+        var tokens = searchTokens(searchInput.value);
+        var needle = searchInput.value.trim().toLowerCase();
+        sounds = catalogSounds.filter(function(s) {
+            if (categoryId && s.category_id !== categoryId) return false;
+            if (!tokens.length) return !needle || s.name.toLowerCase().indexOf(needle) !== -1;
+            var words = searchWords(s);
+            return tokens.every(function(t) {
+                return words.some(function(w) { return w.indexOf(t) === 0; });
             });
+        });
+        renderSounds();
     }
 
     function renderSounds() {
@@ -101,6 +170,7 @@
                     }
                 });
             }
+            if (window.Waveform) window.Waveform.attach(card, s.id, null);
             grid.appendChild(card);
         });
     }
@@ -447,7 +517,7 @@
         addModal.setAttribute('aria-hidden', 'false');
         addSelect.innerHTML = '';
         if (window.__user) {
-            fetch('/api/session-lists', { credentials: 'same-origin' })
+            fetch('/api/session-lists/summary', { credentials: 'same-origin' })
                 .then(function(r) {
                     if (!r.ok) { addModal.hidden = true; return; }
                     return r.json();
@@ -518,8 +588,8 @@
         });
     });
 
-    categoryFilter.addEventListener('change', fetchSounds);
-    searchInput.addEventListener('input', debounce(fetchSounds, 300));
+    categoryFilter.addEventListener('change', applyFilters);
+    searchInput.addEventListener('input', debounce(applyFilters, 100));
 
     function debounce(fn, ms) {
         var t;
@@ -532,8 +602,8 @@
     fetch('/auth/me', { credentials: 'same-origin' })
         .then(function(r) { return r.json(); })
         .then(function(data) { window.__user = data.user; })
-        .then(fetchCategories)
-        .then(fetchSounds)
+        .then(loadCatalog)
+        .then(applyFilters)
         .then(function() {
             if (addToListId) loadListSidebar();
         });
@@ -212,7 +212,7 @@
     });
 
     function loadSessionLists() {
-        fetch('/api/session-lists', { credentials: 'same-origin' })
+        fetch('/api/session-lists/summary', { credentials: 'same-origin' })
             .then(function(r) { return r.json(); })
             .then(function(data) {
                 var lists = data.session_lists || [];
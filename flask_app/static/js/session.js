@@ -9,6 +9,10 @@
     var currentSoundId = null;
     var currentVariantId = null;
     var isGuestList = listId && String(listId).indexOf('guest-') === 0;
+    /* Decoded buffers for "Arm" mode (audio_cache.js); taps on cached sounds skip fetch + decode. */
+    var bufferCache = window.AudioBufferCache && window.AudioBufferCache.isSupported() ? new window.AudioBufferCache() : null;
+    /* Set while broadcasting (broadcast.js): taps then play on every player's device too, all at the server's play_at. */
+    var broadcastClock = null;
 
     if (!listId || listId === 'None' || listId === '') {
         window.location.href = '/session';
@@ -101,6 +105,8 @@
             });
         });
         var soundEntries = (list.sounds || []).map(function(s) { return { sound: s }; });
+        setupArmButton(function() { return Promise.resolve(guestPreloadItems(list.sounds || [])); });
+        setupOfflineButton(function() { return Promise.resolve(guestPreloadItems(list.sounds || [])); }, []);
         renderSounds(soundEntries);
         emptyEl.hidden = soundEntries.length > 0;
         var emptyLink = document.getElementById('session-empty-add-link');
@@ -125,6 +131,10 @@
                     '<button type="button" class="btn btn-ghost" id="delete-list-btn">Delete</button>';
                 document.getElementById('rename-list-btn').addEventListener('click', function() { renameList(list); });
                 document.getElementById('delete-list-btn').addEventListener('click', function() { deleteList(); });
+                setupArmButton(fetchPreloadManifest, loadListSprite);
+                setupBroadcastButton();
+                setupMixButton();
+                setupOfflineButton(fetchPreloadManifest, ['/api/session-lists/' + listId, '/api/session-lists/' + listId + '/manifest']);
                 renderSounds(list.sounds || []);
                 emptyEl.hidden = (list.sounds && list.sounds.length > 0);
                 var emptyLink = document.getElementById('session-empty-add-link');
@@ -148,6 +158,255 @@
             });
     }
 
+    function preferredFormat() {
+        var probe = document.createElement('audio');
+        return probe.canPlayType('audio/ogg; codecs=opus') ? 'opus' : 'aac';
+    }
+
+    /* Owned lists arm from one sprite (flask_app/sprite.py): one fetch and one decode for every short sound; the rest load one by one. */
+    function loadListSprite() {
+        return fetch('/api/session-lists/' + listId + '/sprite?format=' + preferredFormat(), { credentials: 'same-origin' })
+            .then(function(r) { return r.ok ? r.json() : null; })
+            .then(function(sprite) { return sprite ? bufferCache.loadSprite(sprite) : 0; })
+            .catch(function() { return 0; });
+    }
+
+    function setupArmButton(getItems, loadFirst) {
+        if (!bufferCache) return;
+        var btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = 'btn btn-ghost';
+        btn.id = 'arm-list-btn';
+        btn.textContent = 'Arm';
+        btn.title = 'Preload every sound in this list so taps play instantly';
+        actionsEl.appendChild(btn);
+        btn.addEventListener('click', function() {
+            if (btn.classList.contains('armed')) {
+                bufferCache.clear();
+                btn.classList.remove('armed');
+                btn.textContent = 'Arm';
+                return;
+            }
+            bufferCache.resume();
+            btn.disabled = true;
+            btn.textContent = 'Arming…';
+            (loadFirst ? loadFirst() : Promise.resolve())
+                .then(getItems)
+                .then(function(items) {
+                    return bufferCache.preload(items, function(done, total) {
+                        btn.textContent = 'Arming… ' + done + '/' + total;
+                    });
+                })
+                .then(function(result) {
+                    btn.disabled = false;
+                    btn.classList.add('armed');
+                    btn.textContent = 'Armed (' + Math.round(bufferCache.used / (1024 * 1024)) + ' MB)';
+                    var missed = result.failed + result.skipped;
+                    btn.title = missed ? missed + ' sounds not preloaded (memory budget or load errors). Click to disarm.' : 'Click to disarm';
+                })
+                .catch(function() {
+                    btn.disabled = false;
+                    btn.textContent = 'Arm';
+                });
+        });
+    }
+
+    function setupBroadcastButton() {
+        if (!window.BroadcastClock) return;
+        var btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = 'btn btn-ghost';
+        btn.id = 'broadcast-list-btn';
+        btn.textContent = 'Broadcast';
+        btn.title = 'Play your taps on the players\' devices too (they open a link)';
+        actionsEl.appendChild(btn);
+        btn.addEventListener('click', function() {
+            var url = '/api/session-lists/' + listId + '/broadcast';
+            if (broadcastClock) {
+                broadcastClock.stop();
+                broadcastClock = null;
+                fetch(url, { method: 'DELETE', credentials: 'same-origin' });
+                btn.classList.remove('armed');
+                btn.textContent = 'Broadcast';
+                return;
+            }
+            if (bufferCache) bufferCache.resume();
+            btn.disabled = true;
+            btn.textContent = 'Starting…';
+            var clock = new window.BroadcastClock();
+            Promise.all([
+                fetch(url, { credentials: 'same-origin' }).then(function(r) {
+                    if (!r.ok) throw new Error('HTTP ' + r.status);
+                    return r.json();
+                }),
+                clock.start()
+            ])
+                .then(function(results) {
+                    var room = results[0];
+                    broadcastClock = clock;
+                    btn.disabled = false;
+                    btn.classList.add('armed');
+                    showListeners(room.listeners);
+                    var link = window.location.origin + room.listen_url;
+                    if (navigator.clipboard) navigator.clipboard.writeText(link).catch(function() {});
+                    window.appPrompt({ title: 'Player link: open it on each device', value: link });
+                })
+                .catch(function() {
+                    clock.stop();
+                    btn.disabled = false;
+                    btn.textContent = 'Broadcast';
+                });
+        });
+    }
+
+    /* "Play mix": the whole list rendered server-side into one stream (flask_app/mixdown.py), ambience looped, so a phone decodes one file instead of several. */
+    function setupMixButton() {
+        var btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = 'btn btn-ghost';
+        btn.id = 'mix-list-btn';
+        btn.textContent = 'Play mix';
+        btn.title = 'Play every sound in this list layered as one track';
+        actionsEl.appendChild(btn);
+        var mix = null;
+        btn.addEventListener('click', function() {
+            if (mix) {
+                mix.pause();
+                mix = null;
+                btn.classList.remove('armed');
+                btn.textContent = 'Play mix';
+                return;
+            }
+            mix = new Audio('/api/session-lists/' + listId + '/mixdown?format=' + preferredFormat());
+            mix.addEventListener('ended', function() {
+                mix = null;
+                btn.classList.remove('armed');
+                btn.textContent = 'Play mix';
+            });
+            btn.classList.add('armed');
+            btn.textContent = 'Stop mix';
+            mix.play().catch(function() {
+                mix = null;
+                btn.classList.remove('armed');
+                btn.textContent = 'Play mix';
+            });
+        });
+    }
+
+    function showListeners(n) {
+        var btn = document.getElementById('broadcast-list-btn');
+        if (btn && broadcastClock) btn.textContent = 'Broadcasting · ' + n + ' listening';
+    }
+
+    /* Fire the sound in the room and start our own copy at the same play_at as everyone else's. */
+    function broadcastPlay(audio, soundId, variantId) {
+        var clock = broadcastClock;
+        fetch('/api/session-lists/' + listId + '/broadcast/play', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            credentials: 'same-origin',
+            body: JSON.stringify({ sound_id: soundId, sound_variant_id: variantId })
+        })
+            .then(function(r) {
+                if (!r.ok) throw new Error('HTTP ' + r.status);
+                return r.json();
+            })
+            .then(function(event) {
+                showListeners(event.listeners);
+                if (currentAudio === audio) return clock.playAt(audio, event.play_at);
+            })
+            .catch(function() {
+                if (currentAudio === audio) audio.play().catch(function() {});
+            });
+    }
+
+    function formatBytes(n) {
+        if (n >= 1024 * 1024 * 1024) return (n / (1024 * 1024 * 1024)).toFixed(1) + ' GB';
+        return Math.round(n / (1024 * 1024)) + ' MB';
+    }
+
+    /* "Download for offline": puts this page, its API payloads and every audio file into the caches the service worker (sw.js) serves offline. */
+    function setupOfflineButton(getItems, apiUrls) {
+        if (!window.caches || !('serviceWorker' in navigator)) return;
+        var version = window.DND_CATALOG_VERSION || 0;
+        var btn = document.createElement('button');
+        btn.type = 'button';
+        btn.className = 'btn btn-ghost';
+        btn.id = 'offline-list-btn';
+        btn.textContent = 'Download for offline';
+        actionsEl.appendChild(btn);
+        btn.addEventListener('click', function() {
+            btn.disabled = true;
+            btn.textContent = 'Downloading…';
+            if (navigator.storage && navigator.storage.persist) navigator.storage.persist();
+            var pages = caches.open('dnd-shell-v' + version).then(function(cache) { return cache.add(window.location.pathname); });
+            var api = caches.open('dnd-api-v' + version).then(function(cache) { return cache.addAll(apiUrls); });
+            var failed = 0;
+            Promise.all([pages, api, getItems(), caches.open('dnd-audio')])
+                .then(function(results) {
+                    var urls = results[2].map(function(item) { return item.url; });
+                    var audioCache = results[3];
+                    var done = 0;
+                    /* One at a time: these are large and the table Wi-Fi is the bottleneck anyway. */
+                    return urls.reduce(function(chain, url) {
+                        return chain.then(function() {
+                            return audioCache.match(url).then(function(hit) {
+                                return hit || audioCache.add(url);
+                            }).catch(function() { failed++; }).then(function() {
+                                done++;
+                                btn.textContent = 'Downloading… ' + done + '/' + urls.length;
+                            });
+                        });
+                    }, Promise.resolve());
+                })
+                .then(function() {
+                    return navigator.storage && navigator.storage.estimate ? navigator.storage.estimate() : null;
+                })
+                .then(function(estimate) {
+                    btn.disabled = false;
+                    btn.textContent = failed ? 'Offline (' + failed + ' failed)' : 'Available offline';
+                    if (estimate) {
+                        btn.textContent += ' · ' + formatBytes(estimate.usage || 0) + ' used';
+                        btn.title = formatBytes(estimate.usage || 0) + ' of ' + formatBytes(estimate.quota || 0) + ' browser storage used. Click to refresh.';
+                    }
+                })
+                .catch(function() {
+                    btn.disabled = false;
+                    btn.textContent = 'Download failed – retry';
+                });
+        });
+    }
+
+    function fetchPreloadManifest() {
+        return fetch('/api/session-lists/' + listId + '/manifest', { credentials: 'same-origin' })
+            .then(function(r) {
+                if (!r.ok) throw new Error('Manifest failed');
+                return r.json();
+            })
+            .then(function(manifest) { return manifest.items; });
+    }
+
+    /* Same order as the server manifest: what each card plays first, then popover variants. */
+    function guestPreloadItems(sounds) {
+        var first = [];
+        var rest = [];
+        sounds.forEach(function(s) {
+            var url = s.variant_url || s.url;
+            if (url) first.push({ url: url, duration_seconds: s.duration_seconds });
+            if (s.sound_variant_id == null && hasMultipleVariants(s)) {
+                s.variants.forEach(function(v) {
+                    if (v.url) rest.push({ url: v.url, duration_seconds: v.duration_seconds });
+                });
+            }
+        });
+        var seen = {};
+        return first.concat(rest).filter(function(item) {
+            if (seen[item.url]) return false;
+            seen[item.url] = true;
+            return true;
+        });
+    }
+
     function updatePlayPauseUI(soundId, state, variantId) {
         var variantKey = (variantId == null || variantId === '') ? '' : String(variantId);
         var sel = '.sound-card[data-sound-id="' + soundId + '"][data-variant-id="' + variantKey + '"]';
@@ -221,6 +480,7 @@
                     }
                 });
             }
+            if (window.Waveform) window.Waveform.attach(card, s.id, variantId);
             soundsContainer.appendChild(card);
         });
     }
@@ -254,7 +514,7 @@
             btn.textContent = v.label || ('Option ' + (i + 1));
             btn.addEventListener('click', function(e) {
                 e.stopPropagation();
-                playSound(sound, v.url);
+                playSound(sound, v.url, null, v.id);
                 closeVariantPopover();
             });
             inner.appendChild(btn);
@@ -295,14 +555,15 @@
         }
     }
 
-    function playSound(sound, sourceUrl, variantId) {
+    /* playedVariantId: the variant actually played when it differs from the card's (variant popover). */
+    function playSound(sound, sourceUrl, variantId, playedVariantId) {
         if (currentAudio) {
             currentAudio.pause();
             currentAudio.currentTime = 0;
         }
         clearAllPlayingState();
         var url = sourceUrl || sound.url || ('/static/audio/' + (sound.file_path || ''));
-        var audio = new Audio(url);
+        var audio = (bufferCache && bufferCache.createPlayer(url)) || new Audio(url);
         var vid = variantId == null ? null : variantId;
         audio.addEventListener('play', function() {
             currentSoundId = sound.id;
@@ -334,7 +595,8 @@
         currentSoundId = sound.id;
         currentVariantId = vid;
         updatePlayPauseUI(sound.id, 'playing', vid);
-        audio.play().catch(function() {});
+        if (broadcastClock) broadcastPlay(audio, sound.id, playedVariantId != null ? playedVariantId : vid);
+        else audio.play().catch(function() {});
     }
 
     function renameList(list) {
@@ -9,7 +9,7 @@
             .then(function(r) { return r.json(); })
             .then(function(data) {
                 if (data.user) {
-                    return fetch('/api/session-lists', { credentials: 'same-origin' })
+                    return fetch('/api/session-lists/summary', { credentials: 'same-origin' })
                         .then(function(r) { return r.json(); })
                         .then(function(api) { return (api.session_lists || []).map(function(l) { return { id: String(l.id), name: l.name, isGuest: false }; }); });
                 }
@@ -0,0 +1,154 @@
+/**
+ * Service worker: offline session lists. Served at /sw.js?v=<catalog version> (see routes.py), so a
+ * catalog change installs a new worker whose shell/API caches replace the old ones on activate.
+ *
+ * - Pages and static assets: network first, cached copy offline (app shell precached on install).
+ * - /api/catalog, /api/categories, /api/session-lists/...: network first, cached copy offline.
+ * - Audio (/audio/..., content-hashed and immutable): cache first. Only files saved by
+ *   "Download for offline" (session.js) are in the cache; Range requests are answered from it.
+ */
+var VERSION = new URL(self.location.href).searchParams.get('v') || '0';
+/* Cache names are shared with session.js (downloadForOffline) and the logout handler in base.html. */
+var SHELL_CACHE = 'dnd-shell-v' + VERSION;
+var API_CACHE = 'dnd-api-v' + VERSION;
+var AUDIO_CACHE = 'dnd-audio';
+
+var SHELL_URLS = [
+    '/',
+    '/browse',
+    '/session',
+    '/static/css/main.css',
+    '/static/js/guest_lists.js',
+    '/static/js/audio_cache.js',
+    '/static/js/broadcast.js',
+    '/static/js/browse.js',
+    '/static/js/session.js',
+    '/static/js/session_index.js',
+    '/static/js/waveform.js'
+];
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(function(cache) { return cache.addAll(SHELL_URLS); })
+            .then(function() { return self.skipWaiting(); })
+    );
+});
+
+/**
+ * Move entries of a previous version's cache into the current one, refetched when online so
+ * nothing stale survives; offline the old copy is kept so downloaded lists stay playable.
+ */
+function carryOver(oldName, newName) {
+    return Promise.all([caches.open(oldName), caches.open(newName)]).then(function(pair) {
+        var oldCache = pair[0];
+        var newCache = pair[1];
+        return oldCache.keys().then(function(requests) {
+            return Promise.all(requests.map(function(request) {
+                return newCache.match(request).then(function(have) {
+                    if (have) return;
+                    return fetch(request)
+                        .then(function(response) {
+                            if (!response.ok) throw new Error('HTTP ' + response.status);
+                            return newCache.put(request, response);
+                        })
+                        .catch(function() {
+                            return oldCache.match(request).then(function(old) { return old && newCache.put(request, old); });
+                        });
+                });
+            }));
+        });
+    }).then(function() { return caches.delete(oldName); });
+}
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(
+        caches.keys()
+            .then(function(names) {
+                return Promise.all(names.map(function(name) {
+                    if (name === SHELL_CACHE || name === API_CACHE || name === AUDIO_CACHE) return null;
+                    if (name.indexOf('dnd-api-v') === 0) return carryOver(name, API_CACHE);
+                    if (name.indexOf('dnd-shell-v') === 0) return carryOver(name, SHELL_CACHE);
+                    return name.indexOf('dnd-') === 0 ? caches.delete(name) : null;
+                }));
+            })
+            .then(function() { return self.clients.claim(); })
+    );
+});
+
+function isAudio(url) {
+    return url.pathname.indexOf('/audio/') === 0 || url.pathname.indexOf('/static/audio/') === 0;
+}
+
+function isCachedApi(url) {
+    /* Not .../broadcast (live listener count) or .../mixdown (audio; the finished mix has its own URL). */
+    return url.pathname === '/api/catalog' || url.pathname === '/api/categories' ||
+        (url.pathname.indexOf('/api/session-lists') === 0 && !/\/(broadcast|mixdown)$/.test(url.pathname));
+}
+
+function networkFirst(request, cacheName, fallbackUrl) {
+    return fetch(request)
+        .then(function(response) {
+            if (response.ok && response.type === 'basic') {
+                var copy = response.clone();
+                caches.open(cacheName).then(function(cache) { cache.put(request, copy); });
+            }
+            return response;
+        })
+        .catch(function() {
+            return caches.match(request).then(function(cached) {
+                if (cached || !fallbackUrl) return cached || Response.error();
+                return caches.match(fallbackUrl).then(function(fallback) { return fallback || Response.error(); });
+            });
+        });
+}
+
+/** 206 slice of a cached full response for "Range: bytes=start-end" (what <audio> sends). */
+function rangeResponse(cached, rangeHeader) {
+    var m = /^bytes=(\d*)-(\d*)$/.exec(rangeHeader.trim());
+    if (!m) return cached;
+    return cached.blob().then(function(blob) {
+        var size = blob.size;
+        var start = m[1] === '' ? Math.max(0, size - Number(m[2])) : Number(m[1]);
+        var end = m[1] !== '' && m[2] !== '' ? Math.min(Number(m[2]), size - 1) : size - 1;
+        if (start >= size || start > end) {
+            return new Response(null, { status: 416, headers: { 'Content-Range': 'bytes */' + size } });
+        }
+        return new Response(blob.slice(start, end + 1), {
+            status: 206,
+            headers: {
+                'Content-Type': cached.headers.get('Content-Type') || 'application/octet-stream',
+                'Content-Range': 'bytes ' + start + '-' + end + '/' + size,
+                'Content-Length': String(end - start + 1),
+                'Accept-Ranges': 'bytes'
+            }
+        });
+    });
+}
+
+function audioCacheFirst(request) {
+    return caches.open(AUDIO_CACHE)
+        .then(function(cache) { return cache.match(request.url); })
+        .then(function(cached) {
+            if (!cached) return fetch(request);
+            var range = request.headers.get('Range');
+            return range ? rangeResponse(cached, range) : cached;
+        });
+}
+
+self.addEventListener('fetch', function(event) {
+    var request = event.request;
+    if (request.method !== 'GET') return;
+    var url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+    if (isAudio(url)) {
+        event.respondWith(audioCacheFirst(request));
+    } else if (isCachedApi(url)) {
+        event.respondWith(networkFirst(request, API_CACHE));
+    } else if (request.mode === 'navigate') {
+        var fallback = url.pathname.indexOf('/session') === 0 ? '/session' : '/';
+        event.respondWith(networkFirst(request, SHELL_CACHE, fallback));
+    } else if (url.pathname.indexOf('/static/') === 0) {
+        event.respondWith(networkFirst(request, SHELL_CACHE));
+    }
+});
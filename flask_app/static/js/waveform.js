@@ -0,0 +1,87 @@
+/**
+ * Waveform thumbnails (flask_app/peaks.py). Waveform.attach(card, soundId, variantId) adds a canvas
+ * to a sound card and, once it scrolls near the viewport, draws the min/max pairs from
+ * /api/sounds/<id>/peaks: a few hundred bytes per card instead of the audio. A sound without
+ * peaks (not synced yet, or offline) just loses the canvas.
+ */
+(function() {
+    var HEADER_BYTES = 20;
+    var MAGIC = 0x5045414B; /* 'PEAK' */
+    var observer = 'IntersectionObserver' in window
+        ? new IntersectionObserver(onVisible, { rootMargin: '200px' })
+        : null;
+
+    function pixelWidth(canvas) {
+        return Math.max(1, Math.round(canvas.clientWidth * (window.devicePixelRatio || 1)));
+    }
+
+    function peaksUrl(canvas) {
+        var variantId = canvas.getAttribute('data-variant-id');
+        return '/api/sounds/' + encodeURIComponent(canvas.getAttribute('data-sound-id')) + '/peaks' +
+            '?points=' + pixelWidth(canvas) + (variantId ? '&variant=' + encodeURIComponent(variantId) : '');
+    }
+
+    /** Int8Array of (min, max) pairs, or null if buffer is not a peaks response. */
+    function parse(buffer) {
+        if (!buffer || buffer.byteLength <= HEADER_BYTES) return null;
+        if (new DataView(buffer).getUint32(0) !== MAGIC) return null;
+        return new Int8Array(buffer, HEADER_BYTES);
+    }
+
+    /** One column per device pixel, each spanning the extremes of the points under it. */
+    function draw(canvas, pairs) {
+        var width = pixelWidth(canvas);
+        var height = Math.max(1, Math.round(canvas.clientHeight * (window.devicePixelRatio || 1)));
+        canvas.width = width;
+        canvas.height = height;
+        var ctx = canvas.getContext('2d');
+        ctx.fillStyle = getComputedStyle(canvas).color;
+        var points = pairs.length / 2;
+        var mid = height / 2;
+        var scale = mid / 127;
+        for (var x = 0; x < width; x++) {
+            var from = Math.floor(x * points / width);
+            var to = Math.max(from + 1, Math.floor((x + 1) * points / width));
+            var lo = 127;
+            var hi = -127;
+            for (var i = from; i < to && i < points; i++) {
+                if (pairs[2 * i] < lo) lo = pairs[2 * i];
+                if (pairs[2 * i + 1] > hi) hi = pairs[2 * i + 1];
+            }
+            if (hi < lo) continue;
+            ctx.fillRect(x, mid - hi * scale, 1, Math.max(1, (hi - lo) * scale));
+        }
+    }
+
+    function load(canvas) {
+        fetch(peaksUrl(canvas))
+            .then(function(r) { return r.ok ? r.arrayBuffer() : null; })
+            .then(function(buffer) {
+                var pairs = parse(buffer);
+                if (pairs && pairs.length) draw(canvas, pairs);
+                else canvas.remove();
+            })
+            .catch(function() { canvas.remove(); });
+    }
+
+    function onVisible(entries) {
+        entries.forEach(function(entry) {
+            if (!entry.isIntersecting) return;
+            observer.unobserve(entry.target);
+            load(entry.target);
+        });
+    }
+
+    function attach(card, soundId, variantId) {
+        var canvas = document.createElement('canvas');
+        canvas.className = 'sound-waveform';
+        canvas.setAttribute('aria-hidden', 'true');
+        canvas.setAttribute('data-sound-id', soundId);
+        canvas.setAttribute('data-variant-id', variantId != null ? variantId : '');
+        card.appendChild(canvas);
+        if (observer) observer.observe(canvas);
+        else load(canvas);
+    }
+
+    window.Waveform = { attach: attach };
+})();
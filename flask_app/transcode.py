@@ -0,0 +1,92 @@
+"""D&D SFX App - Compressed delivery renditions of the audio masters.
+
+sync_sounds.py --transcode encodes each uncompressed master under static/audio into the
+formats listed in AUDIO_RENDITIONS (e.g. "aac:96,opus:64") with ffmpeg, in a process pool.
+Outputs are named after the master's content hash, so unchanged or duplicated files are
+never encoded twice, and are recorded in the sound_renditions table. The masters stay
+untouched; Sound/SoundVariant.to_dict() point "url" at the default rendition.
+"""
+import os
+import shutil
+import subprocess
+
+RENDITIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'renditions')
+RENDITIONS_URL = '/audio/r/'  # served by flask_app/routes_audio.py
+
+# format -> (file extension, MIME type, ffmpeg muxer, ffmpeg codec args)
+FORMATS = {
+    'aac': ('m4a', 'audio/mp4', 'ipod', ['-c:a', 'aac']),
+    'opus': ('opus', 'audio/ogg; codecs=opus', 'ogg', ['-c:a', 'libopus', '-vbr', 'on']),
+    'vorbis': ('ogg', 'audio/ogg; codecs=vorbis', 'ogg', ['-c:a', 'libvorbis']),
+    'mp3': ('mp3', 'audio/mpeg', 'mp3', ['-c:a', 'libmp3lame']),
+}
+
+# Masters already at or below this multiple of a rendition's bitrate are not worth re-encoding.
+MIN_SAVING_FACTOR = 2
+
+
+class RenditionProfile:
+    """One target rendition: a format at a bitrate (kbps)."""
+
+    def __init__(self, fmt, bitrate_kbps):
+        if fmt not in FORMATS:
+            raise ValueError('Unknown rendition format %r (expected one of %s)' % (fmt, ', '.join(FORMATS)))
+        self.format = fmt
+        self.bitrate_kbps = bitrate_kbps
+        self.extension, self.mime_type, self.muxer, self.codec_args = FORMATS[fmt]
+
+    @property
+    def key(self):
+        return '%s%d' % (self.format, self.bitrate_kbps)
+
+    def output_path(self, sha1):
+        """Path relative to RENDITIONS_DIR for the master with this content hash."""
+        return '%s/%s-%s.%s' % (sha1[:2], sha1, self.key, self.extension)
+
+    def worth_encoding(self, meta):
+        """Skip masters that are already compressed to roughly this size."""
+        bit_rate = (meta or {}).get('bit_rate')
+        return not bit_rate or bit_rate > self.bitrate_kbps * 1000 * MIN_SAVING_FACTOR
+
+
+def parse_profiles(spec):
+    """'aac:96,opus:64' -> [RenditionProfile('aac', 96), RenditionProfile('opus', 64)]."""
+    profiles = []
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        fmt, _, kbps = part.partition(':')
+        profiles.append(RenditionProfile(fmt.strip().lower(), int(kbps or 96)))
+    return profiles
+
+
+def ffmpeg_binary():
+    return os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+
+
+def encode(job):
+    """Encode one master. job = (ffmpeg, src, dst, muxer, codec_args, bitrate_kbps).
+
+    Writes to a temporary file and renames it into place, so an interrupted run never
+    leaves a truncated rendition behind. Returns (size_bytes, None) or (None, error).
+    """
+    ffmpeg, src, dst, muxer, codec_args, bitrate_kbps = job
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + '.part'
+    cmd = [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', src, '-vn', '-map_metadata', '-1',
+           *codec_args, '-b:a', '%dk' % bitrate_kbps, '-f', muxer, tmp]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        return None, str(e)
+    if proc.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None, (proc.stderr or 'ffmpeg exited with %d' % proc.returncode).strip().splitlines()[-1]
+    os.replace(tmp, dst)
+    return os.path.getsize(dst), None
+
+
+def rendition_url(file_path):
+    return RENDITIONS_URL + file_path
@@ -6,6 +6,9 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from flask_app import app, db
+from flask_app import migrations
+from flask_app.catalog import bump_version
+from flask_app.search import rebuild_index
 from flask_app.models import User, Category, Sound, SoundVariant
 
 
@@ -18,6 +21,8 @@ def init_database():
     with app.app_context():
         db.create_all()
         print('Database tables created.')
+        # New tables come straight from the models; this catches up tables that already existed.
+        migrations.upgrade()
 
         # Seed categories
         categories_data = [
@@ -72,6 +77,10 @@ def init_database():
             db.session.commit()
             print('Added 2 variants for "Sword Slash" (multi-audio demo).')
 
+        rebuild_index()
+        bump_version()
+        db.session.commit()
+
         print('Done. Add real .mp3/.ogg files under flask_app/static/audio/<category>/<name>.mp3 if desired.')
 
 
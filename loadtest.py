@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Load-test a running server: requests/s and latency percentiles for /api/sounds and the audio routes.
+
+Run: python loadtest.py --url http://127.0.0.1:8000 [--clients 1 8 32] [--seconds 10]
+     python loadtest.py --workers 3 --threads 4
+         (no --url: starts `serve.py` on a free local port with those settings, tests it, stops it)
+
+Each client is its own process holding one keep-alive HTTP/1.1 connection (like a browser
+tab) and sends requests back to back. Targets:
+  sounds  GET /api/sounds, cycling through every category filter and the unfiltered list
+  audio   GET of the catalog's playback URLs (/audio/m/..., /audio/r/... or /static/audio/...)
+Audio URLs are taken from /api/sounds; files missing on disk are skipped.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+
+def connect(base):
+    parts = urlsplit(base)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return cls(parts.hostname, parts.port, timeout=30)
+
+
+def fetch(conn, path):
+    conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+    resp = conn.getresponse()
+    body = resp.read()
+    return resp.status, body
+
+
+def target_paths(base):
+    """{'sounds': [...], 'audio': [...]} request paths."""
+    conn = connect(base)
+    status, body = fetch(conn, '/api/categories')
+    if status != 200:
+        sys.exit('GET /api/categories -> %d; is the server up and the database initialized?' % status)
+    categories = json.loads(body)['categories']
+    sounds_paths = ['/api/sounds'] + ['/api/sounds?category_id=%d' % c['id'] for c in categories]
+    conn.request('GET', '/api/sounds')
+    sounds = json.loads(conn.getresponse().read())['sounds']
+    audio_paths = []
+    for sound in sounds:
+        for url in [sound.get('url')] + [v.get('url') for v in sound.get('variants') or []]:
+            if not url:
+                continue
+            url = quote(url, safe='/%?=&:')
+            conn.request('HEAD', url)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status == 200:
+                audio_paths.append(url)
+    conn.close()
+    return {'sounds': sounds_paths, 'audio': audio_paths}
+
+
+def client(base, paths, deadline, seed, results):
+    rng = random.Random(seed)
+    paths = paths[:]
+    rng.shuffle(paths)
+    conn = connect(base)
+    latencies, failed, received = [], 0, 0
+    i = 0
+    while time.time() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            status, body = fetch(conn, path)
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = connect(base)
+            continue
+        if status != 200:
+            failed += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+        received += len(body)
+    conn.close()
+    results.put((latencies, failed, received))
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def run_target(base, name, paths, client_counts, seconds):
+    ctx = multiprocessing.get_context('fork')
+    print('\n%s (%d distinct URLs)' % (name, len(paths)))
+    print('%8s %10s %9s %9s %9s %10s %8s' % ('clients', 'req/s', 'p50', 'p99', 'max', 'MB/s', 'failed'))
+    for n in client_counts:
+        results = ctx.Queue()
+        deadline = time.time() + seconds
+        procs = [ctx.Process(target=client, args=(base, paths, deadline, i, results)) for i in range(n)]
+        for p in procs:
+            p.start()
+        outcome = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        latencies = sorted(s for lat, _, _ in outcome for s in lat)
+        failed = sum(f for _, f, _ in outcome)
+        received = sum(r for _, _, r in outcome)
+        print('%8d %10.0f %7.1fms %7.1fms %7.1fms %10.1f %8d' % (
+            n, len(latencies) / seconds, percentile(latencies, 0.5), percentile(latencies, 0.99),
+            percentile(latencies, 1.0), received / seconds / 1e6, failed))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, threads):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+           '--bind', '127.0.0.1:%d' % port, '--workers', str(workers), '--threads', str(threads)]
+    proc = subprocess.Popen(cmd)
+    base = 'http://127.0.0.1:%d' % port
+    for _ in range(300):
+        if proc.poll() is not None:
+            sys.exit('serve.py exited with status %d' % proc.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc, base
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    sys.exit('serve.py did not start listening on port %d' % port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server (default: start serve.py)')
+    parser.add_argument('--targets', nargs='+', choices=('sounds', 'audio'), default=['sounds', 'audio'])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1,
+                        help='serve.py workers when no --url is given')
+    parser.add_argument('--threads', type=int, default=4, help='serve.py threads per worker when no --url is given')
+    args = parser.parse_args()
+
+    proc = None
+    base = args.url.rstrip('/') if args.url else None
+    if base is None:
+        proc, base = start_server(args.workers, args.threads)
+        print('serve.py: %d workers x %d threads at %s' % (args.workers, args.threads, base))
+    try:
+        paths = target_paths(base)
+        for name in args.targets:
+            if not paths[name]:
+                print('\n%s: no URLs to request, skipped' % name)
+                continue
+            run_target(base, name, paths[name], args.clients, args.seconds)
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGINT)  # quick shutdown; TERM would wait out keep-alive connections
+            proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations (flask_app/migrations/NNNN_*.py) to the configured database.
+
+Run: python migrate.py          apply everything not yet recorded in schema_migrations
+     python migrate.py --list   show each migration and whether it has been applied
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask_app import app
+from flask_app import migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations.')
+    parser.add_argument('--list', action='store_true', help='list migrations and their status')
+    args = parser.parse_args()
+    with app.app_context():
+        if args.list:
+            done = migrations.applied_revisions()
+            for m in migrations.discover():
+                print('%s %s_%s  %s' % ('[x]' if m.revision in done else '[ ]', m.revision, m.name, m.description))
+            return
+        ran = migrations.upgrade()
+        print('Applied %d migration(s).' % len(ran) if ran else 'Database is up to date.')
+
+
+if __name__ == '__main__':
+    main()
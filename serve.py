@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Run the D&D SFX App under gunicorn (production). run.py is the development server.
+
+Run: python serve.py [--bind 0.0.0.0:8000] [--workers N] [--threads N] [--keepalive S]
+     (defaults from WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_KEEPALIVE, WEB_TIMEOUT,
+      WEB_GRACEFUL_TIMEOUT, WEB_MAX_REQUESTS)
+     python serve.py --asgi [--workers N] ...
+         (hypercorn instead, serving flask_app/asgi.py: /api/... on the async API, one event
+          loop per worker; --threads, --timeout and --max-requests do not apply. HUP restarts
+          the workers, which re-import the code.)
+
+- Workers are forked from a master that has already imported the app and built the catalog
+  snapshot, so imports and warmup happen once and the snapshot pages are shared copy-on-write.
+  Database connections opened for the warmup are dropped before forking; each worker opens
+  its own.
+- Each worker is a gthread worker: --threads request threads plus keep-alive connections
+  held open --keepalive seconds (raise it when a proxy in front reuses connections).
+- Graceful reload: `kill -HUP $(cat <pidfile>)` starts fresh workers and lets the old ones
+  finish their requests (up to --graceful-timeout). The app code is preloaded, so to pick up
+  new code send USR2 (starts a new master alongside the old) and then QUIT to the old master.
+- --max-requests recycles each worker after that many requests (with jitter) to bound leaks.
+- Live broadcast listeners each hold a request thread here, so a worker accepts at most half
+  its --threads of them (BROADCAST_MAX_STREAMS) and the rest retry; rooms span workers through
+  the database (flask_app/broadcast.py). For big rooms use --asgi.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+_project_root = os.path.dirname(os.path.abspath(__file__))
+_env_path = os.path.join(_project_root, '.env')
+if os.path.isfile(_env_path):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(_env_path, override=True)
+    except (PermissionError, OSError) as e:
+        print(f"Warning: Could not load .env: {e}")
+
+os.environ.setdefault('FLASK_SKIP_DOTENV', '1')
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # e.g. on Windows; --asgi still works
+    BaseApplication = object
+
+
+def default_workers():
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def warm_up(app):
+    """Build the catalog snapshot in the master, then close its database connections before fork."""
+    from flask_app import db
+    from flask_app.catalog import get_snapshot
+
+    with app.app_context():
+        try:
+            snap = get_snapshot()
+            app.logger.info('Catalog version %s warmed up (%d sounds)', snap.version, len(snap.sounds))
+        except Exception:
+            # Missing tables etc.: workers build the snapshot on their first request instead.
+            app.logger.exception('Catalog warmup failed')
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
+def post_fork(server, worker):
+    from flask_app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # never reuse a connection inherited from the master
+
+
+def worker_exit(server, worker):
+    from flask_app import metrics
+
+    metrics.registry.flush(force=True)  # counts since the last flush (flask_app/metrics.py)
+
+
+class SFXServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from flask_app import app
+        warm_up(app)
+        return app
+
+
+def serve_asgi(args):
+    try:
+        from hypercorn.config import Config
+        from hypercorn.run import run
+    except ImportError:
+        sys.exit('--asgi needs quart, aiosqlite and hypercorn: pip install quart aiosqlite (or pipenv install).')
+    config = Config()
+    config.application_path = 'flask_app.asgi:app'
+    config.bind = [args.bind]
+    config.workers = args.workers
+    config.keep_alive_timeout = args.keepalive
+    config.graceful_timeout = args.graceful_timeout
+    config.pid_path = args.pid
+    config.accesslog = args.access_log
+    config.backlog = 2048  # hundreds of clients connecting at once
+    sys.exit(run(config))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=os.getenv('WEB_BIND', '0.0.0.0:8000'))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', '0')) or default_workers())
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '4')))
+    parser.add_argument('--keepalive', type=int, default=int(os.getenv('WEB_KEEPALIVE', '5')),
+                        help='seconds to hold an idle keep-alive connection open')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', '30')),
+                        help='seconds before a silent worker is killed and replaced')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30')),
+                        help='seconds old workers get to finish requests on reload/shutdown')
+    parser.add_argument('--max-requests', type=int, default=int(os.getenv('WEB_MAX_REQUESTS', '0')),
+                        help='recycle a worker after this many requests (0 = never)')
+    parser.add_argument('--pid', default=os.getenv('WEB_PIDFILE'), help='write the master pid here (for HUP/USR2)')
+    parser.add_argument('--access-log', default=os.getenv('WEB_ACCESS_LOG'), help="file, or '-' for stdout")
+    parser.add_argument('--asgi', action='store_true', default=os.getenv('WEB_ASGI', '').lower() in ('1', 'true', 'yes'),
+                        help='serve with hypercorn and the async API (flask_app/asgi.py)')
+    args = parser.parse_args()
+
+    if args.asgi:
+        serve_asgi(args)
+        return
+    if BaseApplication is object:
+        sys.exit('gunicorn is not installed: pip install gunicorn (or pipenv install). run.py is the development server.')
+    # Read by flask_app/__init__.py, which is imported (in load) after this.
+    os.environ.setdefault('BROADCAST_MAX_STREAMS', str(max(1, args.threads // 2)))
+    print('Broadcast listeners: up to %s per worker (each holds a thread); use --asgi for big rooms.'
+          % os.environ['BROADCAST_MAX_STREAMS'])
+    SFXServer({
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'pidfile': args.pid,
+        'accesslog': args.access_log,
+        'proc_name': 'dnd-sfx',
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
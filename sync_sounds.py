@@ -20,18 +20,62 @@ Examples:
   ambience/Zombie Attack.mp3              → one sound "Zombie Attack"
   ambience/FemaleSpectralBreath/a.mp3    → sound "Female Spectral Breath"
   ambience/FemaleSpectralBreath/b.mp3      with two variants (a, b)
+
+Syncs are incremental: instance/sound_manifest.json remembers each file's size, mtime
+and content hash, and only categories with added or removed files are reconciled
+against the database. Use --full to reconcile everything (the manifest is still used
+to avoid re-hashing unchanged files).
+
+New or changed files are probed for duration, sample rate, channels, codec and bit rate
+(header parsing only, in a process pool); results are cached in the manifest and copied
+onto the matching Sound / SoundVariant rows, along with a prefix of the content hash that
+goes into the cache-forever /audio/m/<hash>/ URLs.
+
+Files are then measured for loudness (integrated LUFS, true peak, RMS; flask_app/loudness.py
+decodes every sample, in a process pool). Results are cached in the manifest by content hash,
+so a copy of an already-measured file is not decoded again; --no-loudness skips the stage.
+Waveform peaks (flask_app/peaks.py) are built the same way into flask_app/static/peaks/, one
+file per content hash, for /api/sounds/<id>/peaks; --no-peaks skips them. Spectral features
+(flask_app/similarity.py) are cached like loudness and packed into instance/similarity.npy,
+the nearest-neighbour index behind /api/sounds/<id>/similar; --no-similarity skips them.
+
+Duplicates: identical files are found by content hash, re-encoded or trimmed copies by
+fingerprint (flask_app/fingerprint.py, cached like the above). A summary is printed when
+there are any, --dedup-report lists them (and rows sharing one file), and
+--collapse-duplicates replaces identical copies with hard links to one file.
+
+With --transcode (or AUDIO_TRANSCODE_ON_SYNC=true) every master is also encoded with
+ffmpeg into the AUDIO_RENDITIONS formats under flask_app/static/renditions/; only files
+without an up-to-date rendition are encoded, and the app then serves the smaller copies.
 """
+import argparse
 import os
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from flask_app import app, db
-from flask_app.models import Category, Sound, SoundVariant
+from flask_app.audio_probe import probe_file
+from flask_app import fingerprint, loudness, metrics, peaks, similarity
+from flask_app.catalog import bump_version, current_version
+from flask_app.manifest import SoundManifest
+from flask_app.models import Category, Sound, SoundRendition, SoundVariant
+from flask_app.search import index_exists, rebuild_index
+from flask_app.transcode import RENDITIONS_DIR, encode, ffmpeg_binary, parse_profiles
 
 AUDIO_DIR = os.path.join(os.path.dirname(__file__), 'flask_app', 'static', 'audio')
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'sound_manifest.json')
 ALLOWED_EXT = ('.mp3', '.ogg', '.wav', '.m4a')
+# Max bound parameters per IN (...) batch (SQLite's default limit is 999 on older builds).
+IN_BATCH = 500
+# Below this many files, probing inline is faster than starting a process pool.
+POOL_MIN_FILES = 32
+METADATA_FIELDS = ('duration_seconds', 'sample_rate', 'channels', 'codec', 'bit_rate', 'content_hash')
+CONTENT_HASH_LEN = 16
+LOUDNESS_FIELDS = ('loudness_lufs', 'true_peak_dbtp', 'rms_dbfs')
 
 
 def slug_to_name(slug):
@@ -50,149 +94,679 @@ def norm_slug(s):
     return re.sub(r'[^a-z0-9\-]', '', s) or 'uncategorized'
 
 
-def sync():
+def _scandir_sorted(path):
+    try:
+        with os.scandir(path) as it:
+            return sorted((e for e in it if not e.name.startswith('.')), key=lambda e: e.name)
+    except OSError:
+        return []
+
+
+def _is_audio(entry):
+    return entry.name.lower().endswith(ALLOWED_EXT) and entry.is_file()
+
+
+def scan_audio_dir(audio_dir):
+    """Walk the audio tree once.
+
+    Returns (groups, stats): groups maps a category folder name (None for files directly
+    under audio/) to {'files': [rel_path, ...], 'folders': {folder_name: [rel_path, ...]}},
+    and stats maps every audio rel_path to (size, mtime_ns).
+    """
+    groups = {}
+    stats = {}
+
+    def record(entry, rel_path):
+        st = entry.stat()
+        stats[rel_path] = (st.st_size, st.st_mtime_ns)
+        return rel_path
+
+    for top in _scandir_sorted(audio_dir):
+        if top.is_file():
+            if _is_audio(top):
+                groups.setdefault(None, {'files': [], 'folders': {}})['files'].append(record(top, top.name))
+            continue
+        if not top.is_dir():
+            continue
+        group = groups.setdefault(top.name, {'files': [], 'folders': {}})
+        for entry in _scandir_sorted(top.path):
+            rel_entry = top.name + '/' + entry.name
+            if _is_audio(entry):
+                group['files'].append(record(entry, rel_entry))
+            elif entry.is_dir():
+                subfiles = [record(f, rel_entry + '/' + f.name) for f in _scandir_sorted(entry.path) if _is_audio(f)]
+                if subfiles:
+                    group['folders'][entry.name] = subfiles
+    return groups, stats
+
+
+def _category_dirs(paths):
+    """Category folder names (None for files directly under audio/) of rel paths."""
+    return {p.split('/', 1)[0] if '/' in p else None for p in paths}
+
+
+def _sync_variants(sound, subfiles):
+    """Make sound.variants match the folder's files, keeping rows for files that are still there.
+
+    Variant ids are referenced by session lists, so unchanged files keep their row.
+    Returns True if anything changed.
+    """
+    wanted = {path: i for i, path in enumerate(subfiles)}
+    changed = False
+    for v in list(sound.variants):
+        if v.file_path not in wanted:
+            sound.variants.remove(v)
+            changed = True
+    have = {v.file_path: v for v in sound.variants}
+    for path, i in wanted.items():
+        label = filename_to_name(os.path.splitext(os.path.basename(path))[0])
+        v = have.get(path)
+        if v is None:
+            sound.variants.append(SoundVariant(file_path=path, label=label, sort_order=i))
+            changed = True
+        elif v.sort_order != i:
+            v.sort_order = i
+            changed = True
+    if sound.file_path != subfiles[0]:
+        sound.file_path = subfiles[0]
+        changed = True
+    return changed
+
+
+def sync_category(cat, dir_name, group):
+    """Reconcile one category folder against its sounds (loaded in batches). Returns (added, updated).
+
+    Single files are matched by path in any category, so a row seeded or moved elsewhere is
+    moved back here rather than duplicated.
+    """
+    added = 0
+    updated = 0
+    sounds = Sound.query.filter_by(category_id=cat.id).all()
+    by_path = {s.file_path: s for s in sounds}
+    by_name = {s.name: s for s in sounds}
+    by_path.update(_sounds_by_path([p for p in group['files'] if p not in by_path]))
+
+    for rel_path in group['files']:
+        existing = by_path.get(rel_path)
+        if existing:
+            if existing.category_id != cat.id:
+                existing.category_id = cat.id
+                updated += 1
+                print('  >', rel_path, '->', cat.name)
+            if not existing.is_active:
+                existing.is_active = True
+                updated += 1
+                print('  ^', rel_path, '(reactivated)')
+            continue
+        name = filename_to_name(os.path.basename(rel_path))
+        s = Sound(name=name, category_id=cat.id, file_path=rel_path, is_active=True)
+        db.session.add(s)
+        by_path[rel_path] = s
+        added += 1
+        print('  +', rel_path, '->', s.name)
+
+    for folder, subfiles in group['folders'].items():
+        # Folder = one sound with multiple variants
+        sound_name = slug_to_name(folder.replace('-', ' ').replace('_', ' '))
+        rel_folder = (dir_name + '/' + folder) if dir_name else folder
+        existing = by_name.get(sound_name)
+        if existing:
+            changed = _sync_variants(existing, subfiles)
+            if not existing.is_active:
+                existing.is_active = True
+                changed = True
+            if changed:
+                updated += 1
+                print('  ~', rel_folder + '/', '->', existing.name, '(%d variants)' % len(subfiles))
+            continue
+        s = Sound(name=sound_name, category_id=cat.id, file_path=subfiles[0], is_active=True)
+        db.session.add(s)
+        _sync_variants(s, subfiles)
+        by_name[sound_name] = s
+        added += 1
+        print('  +', rel_folder + '/', '->', s.name, '(%d variants)' % len(subfiles))
+    return added, updated
+
+
+def _sounds_by_path(paths):
+    """{file_path: Sound} for sounds whose own file is in paths, in any category (batched IN queries)."""
+    paths = sorted(paths)
+    found = {}
+    for i in range(0, len(paths), IN_BATCH):
+        for s in Sound.query.filter(Sound.file_path.in_(paths[i:i + IN_BATCH])):
+            found.setdefault(s.file_path, s)
+    return found
+
+
+def _sounds_referencing(paths):
+    """Active sounds whose own file or any variant file is in paths (batched IN queries)."""
+    paths = sorted(paths)
+    found = {}
+    for i in range(0, len(paths), IN_BATCH):
+        batch = paths[i:i + IN_BATCH]
+        q = Sound.query.filter(Sound.is_active == True).filter(db.or_(
+            Sound.file_path.in_(batch),
+            Sound.variants.any(SoundVariant.file_path.in_(batch)),
+        ))
+        for s in q:
+            found[s.id] = s
+    return list(found.values())
+
+
+def deactivate_missing(stats, candidates):
+    """Deactivate sounds none of whose files exist any more. Returns the count."""
+    deactivated = 0
+    for s in candidates:
+        paths_to_check = [s.file_path] + [v.file_path for v in s.variants]
+        if any(p in stats for p in paths_to_check):
+            continue
+        # Paths outside the scanned layout (e.g. seeded by init_db.py) may still exist on disk.
+        if any(os.path.isfile(os.path.join(AUDIO_DIR, p)) for p in paths_to_check):
+            continue
+        s.is_active = False
+        deactivated += 1
+        print('  (deactivated, missing:', s.file_path, ')')
+    return deactivated
+
+
+def run_pool(fn, items, workers=None, min_items=POOL_MIN_FILES, chunksize=64):
+    """fn over items, in a process pool unless the batch is small."""
+    if len(items) < min_items:
+        return [fn(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, items, chunksize=chunksize))
+
+
+def probe_new_files(manifest, workers=None):
+    """Probe every manifest entry without cached metadata. Returns the probed rel paths."""
+    todo = sorted(p for p, entry in manifest.files.items() if 'probe' not in entry)
+    if not todo:
+        return set()
+    started = time.perf_counter()
+    results = run_pool(probe_file, [os.path.join(AUDIO_DIR, p) for p in todo], workers)
+    for rel_path, meta in zip(todo, results):
+        manifest.files[rel_path]['probe'] = meta
+    print('Probed %d files in %.2fs.' % (len(todo), time.perf_counter() - started))
+    return set(todo)
+
+
+def analyze_new_files(manifest, key, analyze, label, workers=None):
+    """Store analyze(path) as entry[key] for every manifest entry without it. Returns the rel paths done.
+
+    Entries sharing a sha1 share one result. analyze returns None when the file needs ffmpeg
+    and it is missing; those stay without a result and are retried next sync.
+    """
+    by_sha1 = {e['sha1']: e[key] for e in manifest.files.values() if key in e}
+    done = set()
+    todo = {}  # sha1 -> rel paths
+    for rel_path, entry in sorted(manifest.files.items()):
+        if key in entry:
+            continue
+        if entry['sha1'] in by_sha1:
+            entry[key] = by_sha1[entry['sha1']]
+            done.add(rel_path)
+        else:
+            todo.setdefault(entry['sha1'], []).append(rel_path)
+    if todo:
+        started = time.perf_counter()
+        first = [paths[0] for paths in todo.values()]
+        # Decoding is the slow part, so hand out one file at a time.
+        results = run_pool(analyze, [os.path.join(AUDIO_DIR, p) for p in first], workers, min_items=2, chunksize=1)
+        skipped = 0
+        for paths, result in zip(todo.values(), results):
+            if result is None:
+                skipped += len(paths)
+                continue
+            for rel_path in paths:
+                manifest.files[rel_path][key] = result
+                done.add(rel_path)
+        if skipped < len(todo):
+            print('Analyzed %s of %d files in %.2fs.' % (label, len(todo) - skipped, time.perf_counter() - started))
+        if skipped:
+            print('ffmpeg not found (set FFMPEG_BINARY); %d files without %s.' % (skipped, label))
+    return done
+
+
+def measure_new_files(manifest, workers=None):
+    """Loudness of new files (flask_app/loudness.py). Returns the measured rel paths."""
+    if not loudness.available():
+        print('numpy not installed; skipping loudness analysis.')
+        return set()
+    return analyze_new_files(manifest, 'loudness', loudness.analyze_file, 'loudness', workers)
+
+
+def embed_new_files(manifest, workers=None):
+    """Spectral features of new files (flask_app/similarity.py). Returns the rel paths done."""
+    if not similarity.available():
+        print('numpy not installed; skipping similarity features.')
+        return set()
+    return analyze_new_files(manifest, similarity.MANIFEST_KEY, similarity.features, 'similarity features', workers)
+
+
+def write_similarity_index(manifest):
+    """One index row per playable file of every active sound. Returns the row count."""
+    rows = []
+    for sound in Sound.query.filter_by(is_active=True):
+        files = [(v.id, v.file_path) for v in sound.variants] or [(None, sound.file_path)]
+        for variant_id, path in files:
+            embedding = manifest.files.get(path, {}).get(similarity.MANIFEST_KEY)
+            if embedding:
+                rows.append((sound.id, variant_id, embedding))
+    return similarity.write_index(rows)
+
+
+def fingerprint_new_files(manifest, workers=None):
+    """Fingerprints of new files for near-duplicate detection (flask_app/fingerprint.py)."""
+    if not fingerprint.available():
+        print('numpy not installed; skipping near-duplicate detection.')
+        return set()
+    return analyze_new_files(manifest, fingerprint.MANIFEST_KEY, fingerprint.fingerprint, 'fingerprints', workers)
+
+
+def exact_duplicates(manifest):
+    """[(sha1, [rel_path, ...])] for content stored under more than one path."""
+    by_sha1 = {}
+    for rel_path, entry in sorted(manifest.files.items()):
+        by_sha1.setdefault(entry['sha1'], []).append(rel_path)
+    return [(sha1, paths) for sha1, paths in sorted(by_sha1.items()) if len(paths) > 1]
+
+
+def _inode(rel_path):
+    st = os.stat(os.path.join(AUDIO_DIR, rel_path))
+    return st.st_dev, st.st_ino
+
+
+def near_duplicates(manifest):
+    """[(rel_path, rel_path, bit error rate, offset seconds)], one path per distinct content."""
+    first = {}
+    for rel_path, entry in sorted(manifest.files.items()):
+        if entry.get(fingerprint.MANIFEST_KEY) and entry['sha1'] not in first:
+            first[entry['sha1']] = rel_path
+    paths = list(first.values())
+    prints = [fingerprint.decode(manifest.files[p][fingerprint.MANIFEST_KEY]) for p in paths]
+    return [(paths[i], paths[j], rate, offset * fingerprint.HOP_SECONDS)
+            for i, j, rate, offset in fingerprint.near_duplicates(prints)]
+
+
+def collapse_duplicates(manifest):
+    """Hard-link every copy of a file to its first path, so the bytes are stored (and sit in the
+    page cache) once. Rows keep their paths. Returns (files linked, bytes freed)."""
+    linked = freed = 0
+    for sha1, paths in exact_duplicates(manifest):
+        keep = os.path.join(AUDIO_DIR, paths[0])
+        for rel_path in paths[1:]:
+            path = os.path.join(AUDIO_DIR, rel_path)
+            if os.path.samefile(keep, path):
+                continue
+            tmp = path + '.dedup'
+            try:
+                os.link(keep, tmp)
+                os.replace(tmp, path)
+            except OSError as e:
+                print('  ! cannot link', rel_path, '-', e)
+                continue
+            st = os.stat(path)
+            manifest.files[rel_path].update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            linked += 1
+            freed += st.st_size
+    return linked, freed
+
+
+def _row_labels():
+    """rel_path -> ['Sound', 'Sound / Variant', ...] for active rows."""
+    labels = {}
+    for s in Sound.query.filter_by(is_active=True):
+        if s.variants:
+            for v in s.variants:
+                labels.setdefault(v.file_path, []).append('%s / %s' % (s.name, v.label))
+        else:
+            labels.setdefault(s.file_path, []).append(s.name)
+    return labels
+
+
+def report_duplicates(manifest, detailed=False):
+    """Print a one-line summary of duplicate audio, or the full report when detailed."""
+    exact = exact_duplicates(manifest)
+    near = near_duplicates(manifest) if fingerprint.available() else []
+    labels = _row_labels()
+    shared = sorted((p, names) for p, names in labels.items() if len(names) > 1)
+    reclaimable = sum(manifest.files[paths[0]]['size'] * (len({_inode(p) for p in paths}) - 1) for _, paths in exact)
+    if reclaimable or near or detailed:
+        print('Duplicates: %d groups of identical files (%.1f MB reclaimable with --collapse-duplicates), '
+              '%d near-duplicate pairs.' % (len(exact), reclaimable / 1e6, len(near)))
+    if not detailed:
+        return
+
+    def named(rel_path):
+        return rel_path + (' (%s)' % ', '.join(labels[rel_path]) if rel_path in labels else '')
+
+    for sha1, paths in exact:
+        linked = len({_inode(p) for p in paths}) == 1
+        print('  = %s  %.1f MB x%d%s' % (sha1[:12], manifest.files[paths[0]]['size'] / 1e6, len(paths),
+                                         '  [stored once]' if linked else ''))
+        for rel_path in paths:
+            print('      ' + named(rel_path))
+    for a, b, rate, offset in sorted(near, key=lambda n: n[2]):
+        print('  ~ %s\n    %s\n      %.0f%% bit errors, offset %+.2fs' % (named(a), named(b), rate * 100, offset))
+    for rel_path, names in shared:
+        print('  & %s is used by %d rows: %s' % (rel_path, len(names), ', '.join(names)))
+
+
+def build_missing_peaks(manifest, workers=None):
+    """Write a peaks file for every content hash without one. Returns the number written.
+
+    A file that cannot be decoded is marked in the manifest and not retried until it changes;
+    files that need ffmpeg are retried next sync while it is missing.
+    """
+    if not peaks.available():
+        print('numpy not installed; skipping waveform peaks.')
+        return 0
+    todo = {}  # dst -> manifest entries
+    for rel_path, entry in sorted(manifest.files.items()):
+        dst = os.path.join(peaks.PEAKS_DIR, peaks.peaks_path(entry['sha1'][:CONTENT_HASH_LEN]))
+        if entry.get('peaks') is False or (entry.get('peaks') and os.path.isfile(dst)):
+            continue
+        if os.path.isfile(dst):
+            entry['peaks'] = True
+            continue
+        todo.setdefault(dst, []).append((rel_path, entry))
+    if not todo:
+        return 0
+    started = time.perf_counter()
+    jobs = [(os.path.join(AUDIO_DIR, entries[0][0]), dst) for dst, entries in todo.items()]
+    results = run_pool(peaks.build_file, jobs, workers, min_items=2, chunksize=1)
+    written = skipped = 0
+    for entries, result in zip(todo.values(), results):
+        if result is None:
+            skipped += 1
+            continue
+        written += bool(result)
+        for rel_path, entry in entries:
+            entry['peaks'] = result
+            if not result:
+                print('  ! no waveform:', rel_path, '(cannot decode)')
+    if written:
+        print('Built waveform peaks for %d files in %.2fs.' % (written, time.perf_counter() - started))
+    if skipped:
+        print('ffmpeg not found (set FFMPEG_BINARY); %d files without waveform peaks.' % skipped)
+    return written
+
+
+def prune_peaks(manifest):
+    """Delete peaks files of content hashes no manifest entry has any more. Returns the count."""
+    referenced = {peaks.peaks_path(e['sha1'][:CONTENT_HASH_LEN]) for e in manifest.files.values()}
+    removed = 0
+    for shard in _scandir_sorted(peaks.PEAKS_DIR):
+        for f in _scandir_sorted(shard.path) if shard.is_dir() else []:
+            if shard.name + '/' + f.name not in referenced:
+                os.remove(f.path)
+                removed += 1
+    return removed
+
+
+def apply_file_metadata(model, manifest, paths, key, fields):
+    """Bulk-update model rows whose file is in paths (or every row if paths is None) from the manifest.
+
+    key(entry) picks the cached dict for a manifest entry. Rows already holding the same
+    values are skipped. Returns the number of rows updated.
+    """
+    columns = [getattr(model, f) for f in fields]
+    mappings = []
+    for row in db.session.query(model.id, model.file_path, *columns):
+        if paths is not None and row.file_path not in paths:
+            continue
+        entry = manifest.files.get(row.file_path)
+        meta = key(entry) if entry else None
+        if not meta:
+            continue
+        values = {f: meta.get(f) for f in fields}
+        if all(getattr(row, f) == values[f] for f in fields):
+            continue
+        mappings.append(dict(values, id=row.id))
+    if mappings:
+        db.session.execute(db.update(model), mappings)
+    return len(mappings)
+
+
+def transcode_masters(manifest, profiles, workers=None):
+    """Encode masters missing a rendition for any profile; results are cached in the manifest.
+
+    Outputs are named by content hash, so a file already encoded under another path (or by an
+    earlier interrupted run) is reused instead of re-encoded. Returns False if ffmpeg is missing.
+    """
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        print('ffmpeg not found (set FFMPEG_BINARY); skipping transcode.')
+        return False
+    jobs = {}
+    pending = []
+    for rel_path, entry in sorted(manifest.files.items()):
+        renditions = entry.setdefault('renditions', {})
+        for profile in profiles:
+            if not profile.worth_encoding(entry.get('probe')):
+                renditions.pop(profile.key, None)
+                continue
+            out = profile.output_path(entry['sha1'])
+            dst = os.path.join(RENDITIONS_DIR, out)
+            cached = renditions.get(profile.key)
+            if cached and cached['file_path'] == out and os.path.isfile(dst):
+                continue
+            renditions.pop(profile.key, None)
+            if dst not in jobs:
+                if os.path.isfile(dst):
+                    jobs[dst] = None
+                else:
+                    jobs[dst] = (ffmpeg, os.path.join(AUDIO_DIR, rel_path), dst, profile.muxer, profile.codec_args, profile.bitrate_kbps)
+            pending.append((renditions, profile.key, out, dst))
+    todo = [dst for dst, job in jobs.items() if job is not None]
+    if todo:
+        started = time.perf_counter()
+        # ffmpeg is the slow part, so hand out one file at a time.
+        results = dict(zip(todo, run_pool(encode, [jobs[d] for d in todo], workers, min_items=2, chunksize=1)))
+        failed = [(d, err) for d, (size, err) in results.items() if err]
+        for dst, err in failed:
+            print('  ! transcode failed:', os.path.relpath(jobs[dst][1], AUDIO_DIR), '-', err)
+        print('Encoded %d renditions in %.2fs (%d failed).' % (len(todo) - len(failed), time.perf_counter() - started, len(failed)))
+    for renditions, key, out, dst in pending:
+        if os.path.isfile(dst):
+            renditions[key] = {'file_path': out, 'size_bytes': os.path.getsize(dst)}
+    return True
+
+
+def prune_renditions(manifest):
+    """Delete rendition files no manifest entry refers to any more. Returns the count."""
+    referenced = {r['file_path'] for entry in manifest.files.values() for r in entry.get('renditions', {}).values()}
+    removed = 0
+    for shard in _scandir_sorted(RENDITIONS_DIR):
+        for f in _scandir_sorted(shard.path) if shard.is_dir() else []:
+            if shard.name + '/' + f.name not in referenced:
+                os.remove(f.path)
+                removed += 1
+    return removed
+
+
+def sync_renditions(manifest, profiles):
+    """Make sound_renditions match the renditions recorded in the manifest. Returns rows changed."""
+    wanted = {}
+    for rel_path, entry in manifest.files.items():
+        for profile in profiles:
+            r = entry.get('renditions', {}).get(profile.key)
+            if r:
+                wanted[(rel_path, profile.format, profile.bitrate_kbps)] = (entry['sha1'], profile, r)
+    changed = 0
+    for row in SoundRendition.query.all():
+        key = (row.source_path, row.format, row.bitrate_kbps)
+        item = wanted.pop(key, None)
+        if item is None:
+            db.session.delete(row)
+            changed += 1
+        elif row.file_path != item[2]['file_path'] or row.source_sha1 != item[0]:
+            row.source_sha1 = item[0]
+            row.file_path = item[2]['file_path']
+            row.size_bytes = item[2]['size_bytes']
+            changed += 1
+    if wanted:
+        db.session.execute(SoundRendition.__table__.insert(), [
+            {'source_path': path, 'source_sha1': sha1, 'format': fmt, 'bitrate_kbps': kbps,
+             'mime_type': profile.mime_type, 'file_path': r['file_path'], 'size_bytes': r['size_bytes']}
+            for (path, fmt, kbps), (sha1, profile, r) in wanted.items()
+        ])
+        changed += len(wanted)
+    return changed
+
+
+def _timed(stages, stage, fn, *args):
+    """fn(*args), its wall time added to stages[stage] (written for /metrics at the end of a run)."""
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+def sync(full=False, transcode=False, measure=True, waveforms=True, similar=True, dedup=True,
+         dedup_report=False, collapse=False):
     if not os.path.isdir(AUDIO_DIR):
         print('Audio directory not found:', AUDIO_DIR)
         return
 
+    started = time.perf_counter()
+    stages = {}
+    groups, stats = scan_audio_dir(AUDIO_DIR)
+    manifest = SoundManifest.load(MANIFEST_PATH)
+    changes = manifest.refresh(stats, AUDIO_DIR)
+    stages['scan'] = time.perf_counter() - started
+    print('Scanned %d files in %.2fs (%r).' % (len(stats), stages['scan'], changes))
+    probed = _timed(stages, 'probe', probe_new_files, manifest)
+    measured = _timed(stages, 'loudness', measure_new_files, manifest) if measure else set()
+    embedded = _timed(stages, 'similarity', embed_new_files, manifest) if similar else set()
+    if dedup:
+        _timed(stages, 'fingerprints', fingerprint_new_files, manifest)
+    if collapse:
+        linked, freed = _timed(stages, 'collapse', collapse_duplicates, manifest)
+        if linked:
+            print('Collapsed %d duplicate files into hard links (%.1f MB freed).' % (linked, freed / 1e6))
+    if waveforms:
+        _timed(stages, 'peaks', build_missing_peaks, manifest)
+        pruned = _timed(stages, 'peaks', prune_peaks, manifest)
+        if pruned:
+            print('Removed %d stale waveform files.' % pruned)
+    profiles = parse_profiles(app.config['AUDIO_RENDITIONS']) if transcode else []
+    if profiles and not _timed(stages, 'renditions', transcode_masters, manifest, profiles):
+        profiles = []
+    if profiles:
+        pruned = _timed(stages, 'renditions', prune_renditions, manifest)
+        if pruned:
+            print('Removed %d stale rendition files.' % pruned)
+
+    database_started = time.perf_counter()
     with app.app_context():
         # Create any missing tables (e.g. sound_variants if DB was created before variants were added)
         db.create_all()
 
-        uncat = Category.query.filter_by(slug='uncategorized').first()
-        if not uncat:
+        # A manifest written against another database (or before rows were edited elsewhere,
+        # which bumps the catalog version) cannot be trusted to describe it: reconcile everything.
+        if manifest.catalog_version is None or manifest.catalog_version != current_version():
+            full = True
+
+        categories = {c.slug: c for c in Category.query.all()}
+        if 'uncategorized' not in categories:
             uncat = Category(name='Uncategorized', slug='uncategorized', sort_order=999)
             db.session.add(uncat)
             db.session.flush()
+            categories['uncategorized'] = uncat
             print('Created category: Uncategorized')
 
         added = 0
         updated = 0
-        seen_paths = set()
+        # Categories with an added or removed file; a removed variant leaves its folder sound
+        # in place, so its category is reconciled to drop the variant row.
+        touched = _category_dirs(changes.added | changes.removed)
 
-        # Top-level entries under audio/
-        try:
-            top_names = os.listdir(AUDIO_DIR)
-        except OSError:
-            top_names = []
-
-        for name in sorted(top_names):
-            path = os.path.join(AUDIO_DIR, name)
-            if name.startswith('.'):
-                continue
-            if os.path.isfile(path):
-                if not name.lower().endswith(ALLOWED_EXT):
-                    continue
-                rel_path = name.replace('\\', '/')
-                seen_paths.add(rel_path)
-                cat = Category.query.filter_by(slug='uncategorized').first()
-                if not cat:
-                    cat = uncat
-                existing = Sound.query.filter_by(file_path=rel_path).first()
-                if existing:
-                    if existing.category_id != cat.id:
-                        existing.category_id = cat.id
-                        updated += 1
-                    continue
-                s = Sound(name=filename_to_name(name), category_id=cat.id, file_path=rel_path, is_active=True)
-                db.session.add(s)
-                added += 1
-                print('  +', rel_path, '->', s.name)
-                continue
-
-            if not os.path.isdir(path):
-                continue
-
-            category_slug = norm_slug(name)
-            cat = Category.query.filter_by(slug=category_slug).first()
+        for dir_name, group in groups.items():
+            category_slug = 'uncategorized' if dir_name is None else norm_slug(dir_name)
+            cat = categories.get(category_slug)
             if not cat:
-                cat = Category(name=slug_to_name(name), slug=category_slug, sort_order=Category.query.count())
+                cat = Category(name=slug_to_name(dir_name), slug=category_slug, sort_order=len(categories))
                 db.session.add(cat)
                 db.session.flush()
+                categories[category_slug] = cat
                 print('Created category:', cat.name)
-
-            # List contents of category folder (files and subdirs)
-            try:
-                entries = os.listdir(path)
-            except OSError:
-                entries = []
-
-            for entry in sorted(entries):
-                entry_path = os.path.join(path, entry)
-                rel_entry = os.path.join(name, entry).replace('\\', '/')
-
-                if os.path.isfile(entry_path):
-                    if not entry.lower().endswith(ALLOWED_EXT):
-                        continue
-                    seen_paths.add(rel_entry)
-                    existing = Sound.query.filter_by(file_path=rel_entry).first()
-                    if existing:
-                        if existing.category_id != cat.id:
-                            existing.category_id = cat.id
-                            updated += 1
-                        continue
-                    s = Sound(
-                        name=filename_to_name(os.path.splitext(entry)[0]),
-                        category_id=cat.id,
-                        file_path=rel_entry,
-                        is_active=True,
-                    )
-                    db.session.add(s)
-                    added += 1
-                    print('  +', rel_entry, '->', s.name)
-                    continue
-
-                if os.path.isdir(entry_path):
-                    # Folder = one sound with multiple variants
-                    try:
-                        subfiles = [f for f in os.listdir(entry_path) if f.lower().endswith(ALLOWED_EXT)]
-                    except OSError:
-                        subfiles = []
-                    subfiles.sort()
-                    if not subfiles:
-                        continue
-                    sound_name = slug_to_name(entry.replace('-', ' ').replace('_', ' '))
-                    first_path = os.path.join(name, entry, subfiles[0]).replace('\\', '/')
-                    for f in subfiles:
-                        seen_paths.add(os.path.join(name, entry, f).replace('\\', '/'))
-
-                    existing = Sound.query.filter_by(category_id=cat.id, name=sound_name).first()
-                    if existing:
-                        # Update variants to match folder contents
-                        for v in list(existing.variants):
-                            db.session.delete(v)
-                        existing.file_path = first_path
-                        for i, f in enumerate(subfiles):
-                            vpath = os.path.join(name, entry, f).replace('\\', '/')
-                            label = filename_to_name(os.path.splitext(f)[0])
-                            db.session.add(SoundVariant(sound_id=existing.id, file_path=vpath, label=label, sort_order=i))
-                        updated += 1
-                        print('  ~', rel_entry + '/', '->', existing.name, '(%d variants)' % len(subfiles))
-                    else:
-                        s = Sound(name=sound_name, category_id=cat.id, file_path=first_path, is_active=True)
-                        db.session.add(s)
-                        db.session.flush()
-                        for i, f in enumerate(subfiles):
-                            vpath = os.path.join(name, entry, f).replace('\\', '/')
-                            label = filename_to_name(os.path.splitext(f)[0])
-                            db.session.add(SoundVariant(sound_id=s.id, file_path=vpath, label=label, sort_order=i))
-                        added += 1
-                        print('  +', rel_entry + '/', '->', s.name, '(%d variants)' % len(subfiles))
+            elif not full and dir_name not in touched:
+                continue
+            a, u = sync_category(cat, dir_name, group)
+            added += a
+            updated += u
 
         # Deactivate sounds whose files are missing
-        for s in Sound.query.filter_by(is_active=True).all():
-            paths_to_check = [s.file_path]
-            for v in s.variants:
-                paths_to_check.append(v.file_path)
-            any_seen = any(p in seen_paths for p in paths_to_check)
-            any_exists = any(os.path.isfile(os.path.join(AUDIO_DIR, p)) for p in paths_to_check)
-            if not any_seen and not any_exists:
-                s.is_active = False
-                print('  (deactivated, missing:', s.file_path, ')')
-
+        if full:
+            candidates = Sound.query.filter_by(is_active=True).all()
+        else:
+            candidates = _sounds_referencing(changes.removed) if changes.removed else []
+        deactivated = deactivate_missing(stats, candidates)
+
+        # Header metadata and content hash (which versions the audio URL) for probed files and
+        # any rows created this run (all rows on --full).
+        targets = None if full else (probed | changes.added)
+        probe_meta = lambda entry: dict(entry.get('probe') or {}, content_hash=entry['sha1'][:CONTENT_HASH_LEN])
+        with_metadata = 0
+        if targets is None or targets:
+            for model in (Sound, SoundVariant):
+                with_metadata += apply_file_metadata(model, manifest, targets, probe_meta, METADATA_FIELDS)
+        if with_metadata:
+            print('Metadata updated on %d rows.' % with_metadata)
+
+        # Loudness for files measured this run (all measured files on --full).
+        loudness_targets = None if full else (measured | changes.added)
+        with_loudness = 0
+        if measure and (loudness_targets is None or loudness_targets):
+            for model in (Sound, SoundVariant):
+                with_loudness += apply_file_metadata(model, manifest, loudness_targets,
+                                                     lambda entry: entry.get('loudness'), LOUDNESS_FIELDS)
+        if with_loudness:
+            print('Loudness updated on %d rows.' % with_loudness)
+
+        renditions_changed = sync_renditions(manifest, profiles) if profiles else 0
+        if renditions_changed:
+            print('Renditions updated: %d rows.' % renditions_changed)
+
+        if added or updated or deactivated or not index_exists():
+            if rebuild_index():
+                print('Search index rebuilt.')
+        if similar and similarity.available() and (
+                full or added or updated or deactivated or embedded or not os.path.isfile(similarity.INDEX_PATH)):
+            print('Similarity index: %d files.' % write_similarity_index(manifest))
+        if dedup or dedup_report:
+            report_duplicates(manifest, detailed=dedup_report)
+        if added or updated or deactivated or with_metadata or with_loudness or renditions_changed:
+            # Tells every app worker to drop its cached catalog on the next request.
+            print('Catalog version:', bump_version())
         db.session.commit()
-        print('Done. Added:', added, 'Updated:', updated)
+        manifest.catalog_version = current_version()
+    stages['database'] = time.perf_counter() - database_started
+    manifest.save()
+    stages['total'] = time.perf_counter() - started
+    metrics.write_sync_stats(stages, {'added': added, 'updated': updated, 'deactivated': deactivated})
+    print('Done in %.2fs. Added: %d Updated: %d Deactivated: %d' % (stages['total'], added, updated, deactivated))
 
 
 if __name__ == '__main__':
-    sync()
+    parser = argparse.ArgumentParser(description='Sync flask_app/static/audio into the database.')
+    parser.add_argument('--full', action='store_true', help='reconcile every category, not just changed ones')
+    parser.add_argument('--transcode', action='store_true', default=app.config['AUDIO_TRANSCODE_ON_SYNC'],
+                        help='encode compressed renditions (AUDIO_RENDITIONS) with ffmpeg')
+    parser.add_argument('--no-loudness', dest='measure', action='store_false',
+                        help='skip loudness analysis of new files')
+    parser.add_argument('--no-peaks', dest='waveforms', action='store_false',
+                        help='skip building waveform peaks of new files')
+    parser.add_argument('--no-similarity', dest='similar', action='store_false',
+                        help='skip similarity features and index')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='skip duplicate detection (fingerprints)')
+    parser.add_argument('--dedup-report', action='store_true',
+                        help='list identical files, near-duplicates and rows sharing a file')
+    parser.add_argument('--collapse-duplicates', dest='collapse', action='store_true',
+                        help='hard-link identical files to one copy on disk')
+    args = parser.parse_args()
+    sync(full=args.full, transcode=args.transcode, measure=args.measure, waveforms=args.waveforms,
+         similar=args.similar, dedup=args.dedup, dedup_report=args.dedup_report, collapse=args.collapse)
@@ -0,0 +1,122 @@
+"""Shared fixtures: the app on a throwaway SQLite database, seeded rows and a statement log.
+
+DATABASE_URL is set before flask_app is imported (the engine is configured at import), and
+files the app writes under instance/ go to the same temporary directory.
+"""
+import math
+import os
+import sys
+import tempfile
+import wave
+from array import array
+
+_tmp = tempfile.mkdtemp(prefix='dnd_sfx_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+
+from flask_app import app as flask_app, catalog, db, metrics, migrations
+from flask_app.models import Category, SchemaMigration, Sound, SoundVariant, User
+
+metrics.METRICS_DIR = os.path.join(_tmp, 'metrics')
+metrics.SYNC_STATS_PATH = os.path.join(_tmp, 'sync_stats.json')
+
+PASSWORD = 'Test-password-1'
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, MAIL_SERVER='')
+    with flask_app.app_context():
+        db.create_all()
+        migrations.upgrade(verbose=False)
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def _empty_tables(app):
+    """Every test starts from empty tables and no cached catalog."""
+    yield
+    with app.app_context():
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name != SchemaMigration.__tablename__:
+                db.session.execute(table.delete())
+        db.session.commit()
+    catalog.invalidate()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    """SQL statements run on the app's engine while the test runs (clear() before the part measured)."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def seed_catalog(categories=1, sounds=3, variants=2):
+    """categories x sounds active sounds, each with variants variant rows. Returns the sound ids.
+    Call inside an app context; commits."""
+    ids = []
+    for c in range(categories):
+        cat = Category(name='Category %d' % c, slug='category-%d' % c, sort_order=c)
+        db.session.add(cat)
+        db.session.flush()
+        for i in range(sounds):
+            sound = Sound(name='Sound %d-%d' % (c, i), category_id=cat.id,
+                          file_path='category-%d/%d.wav' % (c, i), is_active=True)
+            db.session.add(sound)
+            db.session.flush()
+            for v in range(variants):
+                db.session.add(SoundVariant(sound_id=sound.id, label='V%d' % v, sort_order=v,
+                                            file_path='category-%d/%d/%d.wav' % (c, i, v)))
+            ids.append(sound.id)
+    catalog.bump_version()
+    db.session.commit()
+    return ids
+
+
+def write_wav(path, seconds=0.5, freq=440.0, rate=48000, channels=2, amplitude=0.5, phase=0.0):
+    """A 16-bit PCM sine tone at path (directories created). Returns path."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frames = array('h')
+    for n in range(int(seconds * rate)):
+        sample = int(round(amplitude * 32767 * math.sin(2 * math.pi * freq * n / rate + phase)))
+        frames.extend([sample] * channels)
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(frames.tobytes())
+    return path
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        u = User(email='dm@example.com', first_name='Dungeon', last_name='Master')
+        u.set_password(PASSWORD)
+        db.session.add(u)
+        db.session.commit()
+        return u.id
+
+
+@pytest.fixture
+def logged_in(client, user):
+    r = client.post('/auth/login', json={'email': 'dm@example.com', 'password': PASSWORD})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return client
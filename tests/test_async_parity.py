@@ -0,0 +1,86 @@
+"""The async API (flask_app/async_api.py) mirrors the Flask API route by route: same requests,
+same statuses and bodies."""
+import asyncio
+import json
+
+import pytest
+
+from flask_app import db
+from flask_app.models import SessionList, SessionListSound
+from tests.conftest import seed_catalog
+
+pytest.importorskip('quart')
+
+from flask_app.async_api import async_app  # noqa: E402
+
+# (name, method, url, signed in, body, expected status)
+CASES = [
+    ('sounds', 'GET', '/api/sounds', False, None, 200),
+    ('sounds filtered', 'GET', '/api/sounds?q=sound&category_id={category}', False, None, 200),
+    ('sound', 'GET', '/api/sounds/{sound}', False, None, 200),
+    ('sound missing', 'GET', '/api/sounds/999999', False, None, 404),
+    ('categories', 'GET', '/api/categories', False, None, 200),
+    ('catalog', 'GET', '/api/catalog', False, None, 200),
+    ('lists anonymous', 'GET', '/api/session-lists', False, None, 401),
+    ('list anonymous', 'GET', '/api/session-lists/{list}', False, None, 401),
+    ('lists', 'GET', '/api/session-lists', True, None, 200),
+    ('list', 'GET', '/api/session-lists/{list}', True, None, 200),
+    ('list summary', 'GET', '/api/session-lists/summary', True, None, 200),
+    ('list missing', 'GET', '/api/session-lists/999999', True, None, 404),
+    ('batch not an object', 'POST', '/api/session-lists/{list}/sounds/batch', True, [1], 400),
+]
+
+
+@pytest.fixture
+def ids(app, user):
+    with app.app_context():
+        sound_ids = seed_catalog(categories=2, sounds=3)
+        lst = SessionList(user_id=user, name='Ambush')
+        db.session.add(lst)
+        db.session.flush()
+        db.session.add_all([SessionListSound(session_list_id=lst.id, sound_id=sid, sort_order=i * 1024)
+                            for i, sid in enumerate(sound_ids[:3])])
+        db.session.commit()
+        return {'sound': sound_ids[0], 'category': 1, 'list': lst.id}
+
+
+def _quart(method, url, cookie=None, **kwargs):
+    """(status, headers, body) from the async app; cookie is the Flask session cookie it reads."""
+    async def run():
+        client = async_app.test_client()
+        if cookie:
+            client.set_cookie('localhost', 'session', cookie)
+        resp = await client.open(url, method=method, **kwargs)
+        return resp.status_code, resp.headers, await resp.get_data()
+
+    return asyncio.run(run())
+
+
+def _body(headers, data):
+    if headers.get('Content-Type', '').startswith('application/json'):
+        return json.loads(data) if data else None
+    return data
+
+
+@pytest.mark.parametrize('name, method, url, signed_in, body, expected', CASES, ids=[c[0] for c in CASES])
+def test_same_response(client, logged_in, ids, name, method, url, signed_in, body, expected):
+    url = url.format(**ids)
+    kwargs = {'json': body} if body is not None else {}
+    cookie = client.get_cookie('session').value if signed_in else None
+    if not signed_in:
+        client.delete_cookie('session')
+    flask_resp = client.open(url, method=method, **kwargs)
+    status, headers, data = _quart(method, url, cookie, **kwargs)
+    assert flask_resp.status_code == status == expected
+    assert _body(headers, data) == _body(flask_resp.headers, flask_resp.data)
+    assert headers.get('ETag') == flask_resp.headers.get('ETag')
+
+
+@pytest.mark.parametrize('url', ['/api/catalog', '/api/sounds?category_id=2'])
+def test_same_etag_revalidation(client, ids, url):
+    etag = client.get(url).headers['ETag']
+    for value in (etag, 'W/' + etag):
+        assert client.get(url, headers={'If-None-Match': value}).status_code == 304
+        status, headers, data = _quart('GET', url, headers={'If-None-Match': value})
+        assert (status, headers['ETag'], data) == (304, etag, b'')
+    assert _quart('GET', url, headers={'If-None-Match': '"stale"'})[0] == 200
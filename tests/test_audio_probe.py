@@ -0,0 +1,85 @@
+"""Header probing (flask_app/audio_probe.py) of minimal files built in memory, one per format."""
+import struct
+
+import pytest
+
+from flask_app.audio_probe import probe_file
+from tests.conftest import write_wav
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _ogg_page(granule, packet, header_type=0):
+    return (b'OggS' + bytes([0, header_type]) + struct.pack('<qIII', granule, 1, 0, 0)
+            + bytes([1, len(packet)]) + packet)
+
+
+def _atom(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def test_wav(tmp_path):
+    result = probe_file(write_wav(str(tmp_path / 'tone.wav'), seconds=0.5, rate=44100, channels=1))
+    assert result == {'duration_seconds': 0.5, 'sample_rate': 44100, 'channels': 1, 'codec': 'pcm_s16le',
+                      'bit_rate': 44100 * 16}
+
+
+def test_ogg_vorbis(tmp_path):
+    ident = b'\x01vorbis' + struct.pack('<IBIiIiBB', 0, 2, 44100, 0, 160000, 0, 0xB8, 1)
+    data = _ogg_page(0, ident, header_type=2) + _ogg_page(88200, b'\0' * 40, header_type=4)
+    result = probe_file(_write(tmp_path, 'rain.ogg', data))
+    assert result == {'duration_seconds': 2.0, 'sample_rate': 44100, 'channels': 2, 'codec': 'vorbis',
+                      'bit_rate': 160000}
+
+
+def test_ogg_opus(tmp_path):
+    head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, 312, 24000, 0, 0)
+    # Opus granule positions count 48 kHz samples, whatever the input rate, and include pre-skip.
+    data = _ogg_page(0, head, header_type=2) + _ogg_page(312 + 72000, b'\0' * 40, header_type=4)
+    result = probe_file(_write(tmp_path, 'wind.opus', data))
+    assert (result['duration_seconds'], result['sample_rate'], result['channels'], result['codec']) == \
+        (1.5, 24000, 1, 'opus')
+    assert result['bit_rate'] == int(len(data) * 8 / 1.5)
+
+
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\0' * 413  # MPEG-1 layer III, 128 kbps, 44.1 kHz, stereo: 417 bytes
+
+
+def test_mp3_cbr_after_id3v2(tmp_path):
+    tag = b'ID3\x03\x00\x00' + bytes([0, 0, 0, 20]) + b'\0' * 20
+    result = probe_file(_write(tmp_path, 'hit.mp3', tag + MP3_FRAME * 10))
+    assert result == {'duration_seconds': round(10 * 417 * 8 / 128000, 3), 'sample_rate': 44100, 'channels': 2,
+                      'codec': 'mp3', 'bit_rate': 128000}
+
+
+def test_mp3_xing_frame_count(tmp_path):
+    first = bytearray(MP3_FRAME)
+    first[4 + 32:4 + 32 + 12] = b'Xing' + struct.pack('>II', 1, 100)  # after stereo MPEG-1 side info
+    result = probe_file(_write(tmp_path, 'vbr.mp3', bytes(first) + MP3_FRAME * 3))
+    assert result['duration_seconds'] == round(100 * 1152 / 44100, 3)
+
+
+def test_m4a(tmp_path):
+    mvhd = _atom(b'mvhd', struct.pack('>IIIII', 0, 0, 0, 1000, 2500) + b'\0' * 80)
+    entry = b'mp4a' + b'\0' * 6 + struct.pack('>H', 1) + b'\0' * 8 + struct.pack('>HHHHI', 2, 16, 0, 0, 48000 << 16)
+    stsd = _atom(b'stsd', struct.pack('>II', 0, 1) + struct.pack('>I', 4 + len(entry)) + entry)
+    trak = _atom(b'trak', _atom(b'mdia', _atom(b'minf', _atom(b'stbl', stsd))))
+    data = _atom(b'ftyp', b'M4A \0\0\0\0') + _atom(b'moov', mvhd + trak) + _atom(b'mdat', b'\0' * 1000)
+    result = probe_file(_write(tmp_path, 'door.m4a', data))
+    assert result == {'duration_seconds': 2.5, 'sample_rate': 48000, 'channels': 2, 'codec': 'aac',
+                      'bit_rate': int(len(data) * 8 / 2.5)}
+
+
+@pytest.mark.parametrize('name, data', [
+    ('cut.wav', b'RIFF\x24\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00'),
+    ('cut.ogg', b'OggS\x00\x02' + b'\0' * 10),
+    ('cut.mp3', b'ID3\x03\x00\x00\x00\x00\x00\x14' + b'\0' * 20 + b'\xff\xfb'),
+    ('cut.m4a', _atom(b'ftyp', b'M4A \0\0\0\0') + b'\0\0\0\x40moov'),
+    ('notes.txt', b'not audio'),
+])
+def test_truncated_or_unknown_is_empty(tmp_path, name, data):
+    assert probe_file(_write(tmp_path, name, data)) == {}
@@ -0,0 +1,124 @@
+"""Broadcast rooms across worker processes (flask_app/broadcast.py).
+
+Another worker is simulated by writing rows with a different origin, as its publish() and
+presence refresh would.
+"""
+import json
+import queue
+import time
+
+import pytest
+
+from flask_app import broadcast, db
+from flask_app.models import BroadcastEvent, BroadcastListener
+
+LIST_ID = 7
+OTHER_WORKER = 'f' * 32
+
+
+@pytest.fixture
+def unordered_ids(monkeypatch):
+    """As on databases where rows do not commit in id order (set before the poller starts)."""
+    monkeypatch.setattr(broadcast, 'commits_in_id_order', lambda: False)
+
+
+@pytest.fixture
+def room(app, monkeypatch):
+    """Subscribe a threaded listener to LIST_ID; unsubscribe and wait for the poller to stop afterwards."""
+    monkeypatch.setitem(app.config, 'BROADCAST_POLL_MS', 20)
+    broker = broadcast.broker
+    sub = broker.subscribe(LIST_ID)
+    yield sub
+    broker.unsubscribe(sub)
+    poller = broker._poller
+    if poller is not None:
+        poller.join(5)
+
+
+def _frame(sub, timeout=2):
+    frame = sub.queue.get(timeout=timeout).decode()
+    lines = dict(line.split(': ', 1) for line in frame.strip().split('\n'))
+    return int(lines['id']), lines['event'], json.loads(lines['data'])
+
+
+def test_event_from_another_worker_reaches_local_listener(app, room):
+    time.sleep(0.1)  # the poller has started reading from the current last event
+    with app.app_context():
+        db.session.add(BroadcastEvent(session_list_id=LIST_ID, event_type='stop', data='{}', origin=OTHER_WORKER))
+        db.session.add(BroadcastEvent(session_list_id=LIST_ID + 1, event_type='stop', data='{}', origin=OTHER_WORKER))
+        db.session.commit()
+        expected = BroadcastEvent.query.filter_by(session_list_id=LIST_ID).one().id
+    assert _frame(room) == (expected, 'stop', {'id': expected})
+    with pytest.raises(queue.Empty):  # the other room's event is not delivered here
+        room.queue.get(timeout=0.2)
+
+
+def test_own_publish_is_delivered_once(app, room):
+    with app.app_context():
+        seq, listeners = broadcast.broker.publish(LIST_ID, 'play', {'name': 'Thunder'}, play_at=1.0)
+    assert listeners == 1
+    assert _frame(room) == (seq, 'play', {'name': 'Thunder', 'id': seq})
+    with pytest.raises(queue.Empty):  # the poller skips events this process published
+        room.queue.get(timeout=0.3)
+
+
+def test_listeners_include_other_workers(app, room):
+    now = broadcast.now_ms()
+    with app.app_context():
+        db.session.add_all([
+            BroadcastListener(session_list_id=LIST_ID, worker=OTHER_WORKER, count=3, seen_at=now),
+            BroadcastListener(session_list_id=LIST_ID, worker='e' * 32, count=5,
+                              seen_at=now - broadcast.PRESENCE_TTL_MS - 1000),
+        ])
+        db.session.commit()
+        assert broadcast.broker.listeners(LIST_ID) == 1 + 3  # the stale worker is ignored
+
+
+def test_replay_sends_only_events_not_yet_due(app):
+    now = broadcast.now_ms()
+    with app.app_context():
+        past, _ = broadcast.broker.publish(LIST_ID, 'play', {'name': 'past'}, play_at=now - 1000)
+        due, _ = broadcast.broker.publish(LIST_ID, 'play', {'name': 'soon'}, play_at=now + 60000)
+        broadcast.broker.publish(LIST_ID + 1, 'play', {'name': 'elsewhere'}, play_at=now + 60000)
+        assert broadcast.replay(LIST_ID, None) == []
+        frames = broadcast.replay(LIST_ID, past - 1)
+    assert len(frames) == 1
+    assert frames[0].startswith(b'id: %d\nevent: play\n' % due)
+
+
+def test_full_worker_turns_listeners_away(app, client, monkeypatch, room):
+    monkeypatch.setitem(app.config, 'BROADCAST_MAX_STREAMS', 1)
+    with app.app_context():
+        token = broadcast.room_token(LIST_ID)
+    resp = client.get('/api/broadcast/%s/events' % token)
+    assert resp.status_code == 503
+    assert 'error' in resp.get_json()
+
+
+def test_late_commit_of_a_lower_id_is_delivered(app, unordered_ids, room):
+    time.sleep(0.1)
+    with app.app_context():
+        top = (db.session.query(db.func.max(BroadcastEvent.id)).scalar() or 0) + 10
+        db.session.add(BroadcastEvent(id=top, session_list_id=LIST_ID, event_type='stop', data='{}',
+                                      origin=OTHER_WORKER))
+        db.session.commit()
+        assert _frame(room)[0] == top
+        db.session.add(BroadcastEvent(id=top - 5, session_list_id=LIST_ID, event_type='stop', data='{}',
+                                      origin=OTHER_WORKER))
+        db.session.commit()
+    assert _frame(room)[0] == top - 5
+
+
+def test_poller_failure_is_logged(app, room, monkeypatch, caplog):
+    def broken(row):
+        raise RuntimeError('cannot encode')
+
+    monkeypatch.setattr(broadcast, '_event_frame', broken)
+    time.sleep(0.1)
+    with app.app_context():
+        db.session.add(BroadcastEvent(session_list_id=LIST_ID, event_type='stop', data='{}', origin=OTHER_WORKER))
+        db.session.commit()
+    poller = broadcast.broker._poller
+    poller.join(5)
+    assert not poller.is_alive() and broadcast.broker._poller is None
+    assert 'Broadcast poller stopped' in caplog.text
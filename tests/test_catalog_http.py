@@ -0,0 +1,85 @@
+"""Catalog HTTP caching (flask_app/catalog.py): ETags, 304s and the compact document."""
+import gzip
+
+import pytest
+
+from flask_app import catalog, db
+from tests.conftest import seed_catalog
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        return seed_catalog(categories=2, sounds=3)
+
+
+def _get(client, url, etag=None):
+    return client.get(url, headers={'If-None-Match': etag} if etag else {})
+
+
+@pytest.mark.parametrize('url', ['/api/sounds', '/api/categories', '/api/sounds?q=sound&category_id=1'])
+def test_matching_etag_is_304(client, seeded, url):
+    first = _get(client, url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = _get(client, url, etag)
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag and not again.data
+    # A proxy that re-compressed the body sends the weak form; it still matches (RFC 7232 3.2).
+    assert _get(client, url, 'W/' + etag).status_code == 304
+    assert _get(client, url, '"other", ' + etag).status_code == 304
+    assert _get(client, url, '"other"').status_code == 200
+
+
+def test_new_version_is_a_new_etag(app, client, seeded):
+    etag = _get(client, '/api/sounds').headers['ETag']
+    with app.app_context():
+        catalog.bump_version()
+        db.session.commit()
+    resp = _get(client, '/api/sounds', etag)
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_filters_have_their_own_etags(client, seeded):
+    urls = ['/api/sounds', '/api/sounds?category_id=1', '/api/sounds?category_id=2',
+            '/api/sounds?q=sound', '/api/sounds?q=sound&category_id=1']
+    etags = [_get(client, url).headers['ETag'] for url in urls]
+    assert len(set(etags)) == len(urls)
+    # The ETag of one filter does not validate another.
+    assert _get(client, '/api/sounds?category_id=2', etags[1]).status_code == 200
+
+
+def _document(client, encoding):
+    resp = client.get('/api/catalog', headers={'Accept-Encoding': encoding})
+    assert resp.status_code == 200
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert resp.headers['ETag']
+    return resp
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_compressed_document_matches_the_plain_one(client, seeded, encoding):
+    decompress = pytest.importorskip('brotli').decompress if encoding == 'br' else gzip.decompress
+    plain = _document(client, 'identity')
+    assert 'Content-Encoding' not in plain.headers
+    packed = _document(client, encoding)
+    assert packed.headers['Content-Encoding'] == encoding
+    assert decompress(packed.data) == plain.data
+    assert packed.headers['ETag'] != plain.headers['ETag']  # one ETag per encoding
+    assert _get(client, '/api/catalog', packed.headers['ETag']).status_code == 200  # identity requested
+    resp = client.get('/api/catalog', headers={'Accept-Encoding': encoding, 'If-None-Match': packed.headers['ETag']})
+    assert resp.status_code == 304
+
+
+def test_document_rows_rebuild_the_sounds(client, seeded):
+    doc = _document(client, 'identity').get_json()
+    sounds = client.get('/api/sounds').get_json()['sounds']
+    assert doc['categories'] == client.get('/api/categories').get_json()['categories']
+    assert len(doc['sounds']) == len(sounds)
+    for row, sound in zip(doc['sounds'], sounds):
+        assert dict(zip(doc['fields'], row)) == {k: sound[k] for k in doc['fields']}
+        assert not set(catalog.COMPACT_OMIT_FIELDS) & set(doc['fields'])
+        variants = [dict(zip(doc['variant_fields'], v)) for v in row[-1]]
+        assert variants == [{k: v[k] for k in doc['variant_fields']} for v in sound['variants']]
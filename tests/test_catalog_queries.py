@@ -0,0 +1,29 @@
+"""The catalog endpoints cost a fixed number of queries, however many sounds there are."""
+import pytest
+
+from tests.conftest import seed_catalog
+
+# Catalog version, sounds per category, categories, sounds (with their category), then one
+# SELECT each for variants, sound renditions and variant renditions.
+SNAPSHOT_QUERIES = 7
+
+
+@pytest.mark.parametrize('sounds', [1, 40])
+def test_sounds_query_count_is_fixed(app, client, queries, sounds):
+    with app.app_context():
+        seed_catalog(categories=2, sounds=sounds, variants=2)
+    queries.clear()
+    r = client.get('/api/sounds')
+    assert r.status_code == 200
+    assert len(r.get_json()['sounds']) == 2 * sounds
+    assert len(queries) == SNAPSHOT_QUERIES
+
+
+def test_cached_snapshot_costs_one_query(app, client, queries):
+    with app.app_context():
+        seed_catalog(sounds=5)
+    client.get('/api/sounds')
+    queries.clear()
+    for url in ('/api/sounds', '/api/sounds?category_id=1', '/api/categories'):
+        assert client.get(url).status_code == 200
+    assert len(queries) == 3  # the catalog version, once per request
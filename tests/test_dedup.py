@@ -0,0 +1,72 @@
+"""Duplicate audio: fingerprints (flask_app/fingerprint.py) and sync_sounds.py --collapse-duplicates."""
+import os
+
+import pytest
+
+import sync_sounds
+from flask_app.models import Sound
+from tests.conftest import write_wav
+
+np = pytest.importorskip('numpy')
+
+from flask_app import fingerprint  # noqa: E402
+
+# At this rate a hop is a whole number of samples (290), so a copy trimmed by whole hops hashes the same words.
+RATE = 12500
+HOP = int(RATE * fingerprint.HOP_SECONDS)
+
+
+def _noise(seed, seconds=6):
+    """Band-limited noise with a changing envelope: every frame hashes differently."""
+    rng = np.random.default_rng(seed)
+    signal = np.convolve(rng.standard_normal(int(seconds * RATE)), np.ones(4) / 4, 'same')
+    return signal * (1.2 + np.sin(np.linspace(0, 9 * np.pi, len(signal))))
+
+
+def test_quieter_trimmed_copy_is_a_near_duplicate():
+    original = _noise(1)
+    copy = 0.5 * original[40 * HOP:]
+    other = _noise(2)
+    prints = [fingerprint.words(s, RATE) for s in (original, copy, other)]
+    found = fingerprint.near_duplicates(prints)
+    assert [(i, j) for i, j, _, _ in found] == [(0, 1)]
+    _, _, rate, offset = found[0]
+    assert rate < 0.05
+    assert offset == -40  # copy[k] lines up with original[k + 40]
+
+
+def test_short_excerpt_is_not_a_duplicate():
+    original = _noise(1)
+    excerpt = original[:len(original) // 3]
+    assert fingerprint.near_duplicates([fingerprint.words(s, RATE) for s in (original, excerpt)]) == []
+
+
+def test_fingerprint_of_a_file(tmp_path):
+    result = fingerprint.fingerprint(write_wav(str(tmp_path / 'tone.wav'), seconds=2))
+    assert result['seconds'] == 2.0
+    # One word per hop, between consecutive whole frames.
+    assert len(fingerprint.decode(result)) == int((2.0 - fingerprint.FRAME_SECONDS) / fingerprint.HOP_SECONDS)
+    assert fingerprint.fingerprint(write_wav(str(tmp_path / 'silence.wav'), amplitude=0.0)) == {}
+
+
+def test_collapse_hard_links_identical_files(app, tmp_path, monkeypatch, capsys):
+    audio = tmp_path / 'audio'
+    monkeypatch.setattr(sync_sounds, 'AUDIO_DIR', str(audio))
+    monkeypatch.setattr(sync_sounds, 'MANIFEST_PATH', str(tmp_path / 'manifest.json'))
+    first = write_wav(str(audio / 'combat' / 'hit.wav'))
+    copy = write_wav(str(audio / 'magic' / 'hit-copy.wav'))
+    other = write_wav(str(audio / 'magic' / 'zap.wav'), freq=880)
+    assert not os.path.samefile(first, copy)
+
+    sync_sounds.sync(measure=False, waveforms=False, similar=False, collapse=True)
+    assert 'Collapsed 1 duplicate files' in capsys.readouterr().out
+    assert os.path.samefile(first, copy)
+    assert os.stat(first).st_nlink == 2
+    assert os.stat(other).st_nlink == 1
+    with app.app_context():  # rows keep their own paths
+        assert sorted(s.file_path for s in Sound.query) == ['combat/hit.wav', 'magic/hit-copy.wav', 'magic/zap.wav']
+
+    sync_sounds.sync(measure=False, waveforms=False, similar=False, collapse=True)
+    out = capsys.readouterr().out
+    assert 'Collapsed' not in out  # already linked
+    assert 'Added: 0 Updated: 0' in out  # relinking did not look like a change to the files
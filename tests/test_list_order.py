@@ -0,0 +1,110 @@
+"""Gap-based sort keys (flask_app/list_order.py) and single-entry moves."""
+import threading
+import time
+
+import pytest
+
+from flask_app import db
+from flask_app.list_order import ORDER_GAP, gap_exhausted, key_between, lock_list, rebalance
+from flask_app.models import SessionList, SessionListSound
+from tests.conftest import seed_catalog
+
+
+def test_key_between():
+    assert key_between(None, None) == 0
+    assert key_between(None, 0) == -ORDER_GAP
+    assert key_between(2048, None) == 2048 + ORDER_GAP
+    assert key_between(0, 1024) == 512
+    assert key_between(0, 2) == 1
+    assert key_between(0, 1) is None
+    assert gap_exhausted(0, 1, 2)
+    assert not gap_exhausted(0, 512, 1024)
+    assert not gap_exhausted(None, -ORDER_GAP, 0)
+
+
+@pytest.fixture
+def entries(app, user):
+    """A list of four entries ORDER_GAP apart. Returns the list id and the entry ids in order."""
+    with app.app_context():
+        sound_ids = seed_catalog(sounds=4, variants=0)
+        lst = SessionList(user_id=user, name='Ambush')
+        db.session.add(lst)
+        db.session.flush()
+        rows = [SessionListSound(session_list_id=lst.id, sound_id=sid, sort_order=i * ORDER_GAP)
+                for i, sid in enumerate(sound_ids)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return lst.id, [row.id for row in rows]
+
+
+def _set_keys(app, keys):
+    with app.app_context():
+        for entry_id, key in keys.items():
+            db.session.get(SessionListSound, entry_id).sort_order = key
+        db.session.commit()
+
+
+def _order(app, list_id):
+    with app.app_context():
+        return [(e.id, e.sort_order) for e in
+                SessionListSound.query.filter_by(session_list_id=list_id).order_by(SessionListSound.sort_order)]
+
+
+def _move(client, list_id, entry_id, after_id):
+    r = client.put('/api/session-lists/%d/sounds/%d/position' % (list_id, entry_id), json={'after_id': after_id})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return r.get_json()['sort_order']
+
+
+def test_move_takes_the_midpoint(app, logged_in, entries):
+    list_id, (a, b, c, d) = entries
+    assert _move(logged_in, list_id, d, a) == 512
+    assert _move(logged_in, list_id, c, None) == -ORDER_GAP
+    assert [e for e, _ in _order(app, list_id)] == [c, a, d, b]
+
+
+def test_rebalance_keeps_order(app, entries):
+    list_id, (a, b, c, d) = entries
+    _set_keys(app, {a: 5, b: 3, c: 3, d: -7})
+    with app.app_context():
+        assert rebalance(list_id) == 4
+        db.session.commit()
+    # Ties keep id order.
+    assert _order(app, list_id) == [(d, 0), (b, ORDER_GAP), (c, 2 * ORDER_GAP), (a, 3 * ORDER_GAP)]
+
+
+def test_exhausted_gap_rebalances_inline(app, logged_in, entries):
+    list_id, (a, b, c, d) = entries
+    _set_keys(app, {a: 0, b: 1, c: 2, d: 3})
+    # No integer between a and b: the list is renumbered first, then the move takes the midpoint.
+    assert _move(logged_in, list_id, d, a) == ORDER_GAP // 2
+    assert [e for e, _ in _order(app, list_id)] == [a, d, b, c]
+
+
+def test_last_gap_used_schedules_a_rebalance(app, logged_in, entries):
+    list_id, (a, b, c, d) = entries
+    _set_keys(app, {a: 0, b: 2, c: 4, d: 6})
+    assert _move(logged_in, list_id, d, a) == 1
+    for thread in threading.enumerate():
+        if thread.name.startswith('rebalance-list-'):
+            thread.join(5)
+    assert _order(app, list_id) == [(a, 0), (d, ORDER_GAP), (b, 2 * ORDER_GAP), (c, 3 * ORDER_GAP)]
+
+
+def test_concurrent_moves_do_not_share_a_key(app, logged_in, entries):
+    list_id, (a, b, c, d) = entries
+    result = {}
+    with app.app_context():
+        # Another request moving d after a, still uncommitted when the second move starts.
+        lock_list(list_id)
+        db.session.get(SessionListSound, d).sort_order = key_between(0, ORDER_GAP)
+        db.session.flush()
+        mover = threading.Thread(target=lambda: result.setdefault('key', _move(logged_in, list_id, c, a)))
+        mover.start()
+        time.sleep(0.3)  # the second move now waits for the list's lock
+        db.session.commit()
+    mover.join(10)
+    assert result['key'] == 256  # between a and d, read after the first move committed
+    keys = [key for _, key in _order(app, list_id)]
+    assert len(set(keys)) == len(keys)
+    assert [e for e, _ in _order(app, list_id)] == [a, c, d, b]
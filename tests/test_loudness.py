@@ -0,0 +1,44 @@
+"""Loudness measurement (flask_app/loudness.py) against BS.1770 / EBU Tech 3341 reference tones."""
+import math
+import os
+
+import pytest
+
+from tests.conftest import write_wav
+
+pytest.importorskip('numpy')
+
+from flask_app import loudness  # noqa: E402
+
+
+def _measure(tmp_path, **tone):
+    return loudness.analyze_file(write_wav(os.path.join(str(tmp_path), 'tone.wav'), **tone))
+
+
+def test_stereo_1khz_sine_reads_its_level_in_lufs(tmp_path):
+    # EBU Tech 3341 case 1: a -20 dBFS 1 kHz sine on both channels is -20 LUFS.
+    result = _measure(tmp_path, seconds=3, freq=1000, amplitude=0.1)
+    assert result['loudness_lufs'] == pytest.approx(-20.0, abs=0.1)
+    assert result['rms_dbfs'] == pytest.approx(-23.01, abs=0.05)
+    assert result['true_peak_dbtp'] == pytest.approx(-20.0, abs=0.1)
+
+
+def test_mono_counts_one_channel(tmp_path):
+    result = _measure(tmp_path, seconds=3, freq=1000, amplitude=0.1, channels=1)
+    assert result['loudness_lufs'] == pytest.approx(-23.01, abs=0.1)
+
+
+def test_true_peak_finds_the_peak_between_samples(tmp_path):
+    # fs/4 at 45 degrees: every sample sits at 0.707 of the waveform's real peak.
+    result = _measure(tmp_path, seconds=1, freq=12000, amplitude=0.5, phase=math.pi / 4)
+    assert result['true_peak_dbtp'] == pytest.approx(20 * math.log10(0.5), abs=0.2)
+    assert result['rms_dbfs'] == pytest.approx(-9.03, abs=0.05)
+
+
+def test_clip_shorter_than_a_gating_block(tmp_path):
+    result = _measure(tmp_path, seconds=0.2, freq=1000, amplitude=0.1)
+    assert result['loudness_lufs'] == pytest.approx(-20.0, abs=0.3)
+
+
+def test_silence_has_no_level(tmp_path):
+    assert _measure(tmp_path, amplitude=0.0) == {'loudness_lufs': None, 'true_peak_dbtp': None, 'rms_dbfs': None}
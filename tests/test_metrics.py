@@ -0,0 +1,98 @@
+"""/metrics: per-request counts, the slow log, and totals kept across worker processes."""
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from flask_app import metrics
+from tests.conftest import seed_catalog
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A fresh registry writing to a scratch METRICS_DIR."""
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path / 'metrics'))
+    fresh = metrics.Registry()
+    monkeypatch.setattr(metrics, 'registry', fresh)
+    return fresh
+
+
+def _samples(text):
+    """{'name{labels}': value} of the non-comment lines."""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if not line.startswith('#')}
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def _write(name, counters=(), histograms=()):
+    os.makedirs(metrics.METRICS_DIR, exist_ok=True)
+    with open(os.path.join(metrics.METRICS_DIR, name), 'w') as f:
+        json.dump({'counters': list(counters), 'histograms': list(histograms)}, f)
+
+
+def test_requests_and_queries_are_counted(app, client, registry):
+    with app.app_context():
+        seed_catalog(sounds=3)
+    for _ in range(2):
+        assert client.get('/api/sounds').status_code == 200
+    r = client.get('/metrics')
+    assert r.headers['Content-Type'] == metrics.CONTENT_TYPE
+    samples = _samples(r.get_data(as_text=True))
+    assert samples['dnd_http_requests_total{endpoint="api_bp.list_sounds",method="GET",status="200"}'] == 2
+    assert samples['dnd_http_request_duration_seconds_count{endpoint="api_bp.list_sounds",method="GET"}'] == 2
+    # First request builds the snapshot (7 statements), the second only checks the version.
+    assert samples['dnd_db_queries_per_request_sum{endpoint="api_bp.list_sounds"}'] == 8
+    assert samples['dnd_db_queries_per_request_bucket{endpoint="api_bp.list_sounds",le="1"}'] == 1
+    assert samples['dnd_cache_lookups_total{cache="catalog_snapshot",result="miss"}'] == 1
+
+
+def test_slow_requests_are_logged_with_their_sql(app, client, registry, caplog):
+    app.config['SLOW_REQUEST_MS'] = 0.001
+    try:
+        with caplog.at_level(logging.WARNING, logger='flask_app.slow_requests'):
+            client.get('/api/categories')
+    finally:
+        app.config['SLOW_REQUEST_MS'] = 500
+    (record,) = caplog.records
+    assert 'GET /api/categories -> 200' in record.getMessage()
+    assert 'FROM catalog_state' in record.getMessage()
+
+
+def test_totals_cover_every_process_and_survive_exits(registry):
+    registry.inc('dnd_audio_bytes_sent_total', {'kind': 'm'}, 100)
+    labels = json.dumps([['kind', 'm']])
+    _write('%d-live.json' % os.getppid(), counters=[['dnd_audio_bytes_sent_total', labels, 20]])
+    dead = '%d-gone.json' % _dead_pid()
+    _write(dead, counters=[['dnd_audio_bytes_sent_total', labels, 3]],
+           histograms=[['dnd_db_queries_per_request', json.dumps([['endpoint', 'x']]), [1] * 12, 4.0]])
+
+    first = _samples(metrics.render())
+    assert first['dnd_audio_bytes_sent_total{kind="m"}'] == 123
+    assert first['dnd_db_queries_per_request_count{endpoint="x"}'] == 12
+    # The exited process's file was folded into the archive, not dropped.
+    names = os.listdir(metrics.METRICS_DIR)
+    assert dead not in names and metrics.ARCHIVE_NAME in names
+
+    registry.inc('dnd_audio_bytes_sent_total', {'kind': 'm'}, 1)
+    second = _samples(metrics.render())
+    assert second['dnd_audio_bytes_sent_total{kind="m"}'] == 124
+    assert second['dnd_db_queries_per_request_count{endpoint="x"}'] == 12
+
+
+def test_counts_are_flushed_when_a_process_exits(tmp_path):
+    code = ('from flask_app import metrics; metrics.METRICS_DIR = %r; '
+            'metrics.registry.flush(force=True); '
+            'metrics.registry.inc("dnd_audio_bytes_sent_total", {"kind": "r"}, 7)') % str(tmp_path)
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(tmp_path / 'exit.db'))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', code], cwd=root, env=env, check=True)
+    (name,) = [n for n in os.listdir(tmp_path) if n.endswith('.json')]
+    with open(tmp_path / name) as f:
+        assert json.load(f)['counters'] == [['dnd_audio_bytes_sent_total', '[["kind", "r"]]', 7]]
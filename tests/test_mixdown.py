@@ -0,0 +1,87 @@
+"""Scene mixdown: access, the rendered mix and its cache."""
+import asyncio
+import io
+import wave
+
+import pytest
+
+from flask_app import db, mixdown, routes_audio
+from flask_app.models import Category, Sound
+from tests.conftest import write_wav
+
+
+@pytest.fixture
+def scene_sounds(app, tmp_path, monkeypatch):
+    """Two one-second tones in a scratch audio dir; mixes go to another. Returns their sound ids."""
+    audio, mixes = tmp_path / 'audio', tmp_path / 'mixdowns'
+    for module in (mixdown, routes_audio):
+        monkeypatch.setattr(module, 'AUDIO_DIR', str(audio))
+        monkeypatch.setattr(module, 'MIXDOWN_DIR', str(mixes))
+    write_wav(str(audio / 'fx' / 'low.wav'), seconds=1.0, freq=220, amplitude=0.25)
+    write_wav(str(audio / 'fx' / 'high.wav'), seconds=1.0, freq=880, rate=44100, amplitude=0.25)
+    with app.app_context():
+        cat = Category(name='FX', slug='fx')
+        db.session.add(cat)
+        db.session.flush()
+        sounds = [Sound(name=name, category_id=cat.id, file_path='fx/%s.wav' % name.lower(), is_active=True)
+                  for name in ('Low', 'High')]
+        db.session.add_all(sounds)
+        db.session.commit()
+        return [s.id for s in sounds]
+
+
+def _scene(sound_ids):
+    return {'tracks': [{'sound_id': sound_ids[0]}, {'sound_id': sound_ids[1], 'offset': 0.5, 'gain': 2}],
+            'duration': 1.5, 'format': 'wav'}
+
+
+def test_anonymous_render_is_refused(client, scene_sounds):
+    assert client.post('/api/mixdown', json=_scene(scene_sounds)).status_code == 401
+
+
+def test_anonymous_render_is_refused_async(scene_sounds):
+    pytest.importorskip('quart')
+    from flask_app.async_api import async_app
+
+    async def post():
+        return await async_app.test_client().post('/api/mixdown', json=_scene(scene_sounds))
+
+    assert asyncio.run(post()).status_code == 401
+
+
+def test_render_mixes_and_caches(logged_in, scene_sounds):
+    np = pytest.importorskip('numpy')
+    r = logged_in.post('/api/mixdown', json=_scene(scene_sounds))
+    assert r.status_code == 200
+    assert r.headers['Content-Length'] == str(len(r.data))
+    with wave.open(io.BytesIO(r.data)) as w:
+        assert (w.getframerate(), w.getnchannels()) == (mixdown.MIX_RATE, 2)
+        pcm = np.frombuffer(w.readframes(w.getnframes()), '<i2').reshape(-1, 2) / 32768.0
+    assert len(pcm) == int(1.5 * mixdown.MIX_RATE)
+    half = mixdown.MIX_RATE // 2
+    # 0-0.5 s: the low tone alone; 0.5-1 s: both, the high one resampled from 44.1 kHz at gain 2;
+    # 1-1.5 s: the high one alone.
+    assert abs(pcm[:half].max() - 0.25) < 0.01
+    assert abs(pcm[half:2 * half].max() - 0.75) < 0.02
+    assert abs(pcm[2 * half:].max() - 0.5) < 0.01
+
+    again = logged_in.post('/api/mixdown', json=_scene(scene_sounds))
+    assert again.status_code == 303
+    assert again.headers['Location'] == r.headers['X-Mixdown-Url']
+    assert logged_in.get(again.headers['Location']).data == r.data
+
+
+def test_bad_scene_is_a_400(logged_in, scene_sounds):
+    pytest.importorskip('numpy')
+    r = logged_in.post('/api/mixdown', json={'tracks': [{'sound_id': scene_sounds[0], 'gain': 99}]})
+    assert r.status_code == 400
+    assert 'gain' in r.get_json()['error']
+
+
+def test_soft_clip_stays_within_full_scale():
+    np = pytest.importorskip('numpy')
+    block = np.array([[0.5, -0.5], [0.9, -2.0], [4.0, 1.0]], np.float32)
+    clipped = mixdown.soft_clip(block.copy())
+    assert clipped[0].tolist() == [0.5, -0.5]  # below the knee: untouched
+    assert np.all(np.abs(clipped) <= 1.0)
+    assert clipped[1, 0] > mixdown.KNEE and clipped[2, 0] > clipped[1, 0]  # still monotonic
@@ -0,0 +1,54 @@
+"""Waveform peaks (flask_app/peaks.py): built at sync, served by /api/sounds/<id>/peaks."""
+import os
+
+import pytest
+
+from flask_app import db
+from flask_app.models import Sound
+from tests.conftest import seed_catalog, write_wav
+
+pytest.importorskip('numpy')
+
+from flask_app import peaks  # noqa: E402
+
+CONTENT_HASH = '0123456789abcdef'
+
+
+@pytest.fixture
+def sound_id(app, tmp_path, monkeypatch):
+    """A sound whose 1 s, half-scale sine has its peaks file built."""
+    monkeypatch.setattr(peaks, 'PEAKS_DIR', str(tmp_path / 'peaks'))
+    src = write_wav(str(tmp_path / 'tone.wav'), seconds=1, amplitude=0.5)
+    assert peaks.build_file((src, os.path.join(peaks.PEAKS_DIR, peaks.peaks_path(CONTENT_HASH)))) is True
+    with app.app_context():
+        sound_id = seed_catalog(sounds=2, variants=0)[0]
+        db.session.get(Sound, sound_id).content_hash = CONTENT_HASH
+        db.session.commit()
+    return sound_id
+
+
+def test_peaks_level_and_etag(client, sound_id):
+    resp = client.get('/api/sounds/%d/peaks?points=64' % sound_id)
+    assert resp.status_code == 200
+    body = resp.data
+    magic, version, bits, _, rate, span, frames = peaks.RESPONSE_HEADER.unpack_from(body)
+    assert (magic, version, bits, rate, frames) == (peaks.MAGIC, peaks.VERSION, 8, 48000, 48000)
+    pairs = body[peaks.RESPONSE_HEADER.size:]
+    points = len(pairs) // 2
+    assert 64 <= points < 128  # the coarsest level with enough points
+    assert points * span >= frames
+    lows = {int.from_bytes(pairs[i:i + 1], 'little', signed=True) for i in range(0, len(pairs), 2)}
+    highs = {int.from_bytes(pairs[i + 1:i + 2], 'little', signed=True) for i in range(0, len(pairs), 2)}
+    assert lows == {-64} and highs == {64}  # rounded outwards from +-0.5 * 127
+
+    again = client.get('/api/sounds/%d/peaks?points=64' % sound_id, headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == resp.headers['ETag']
+    other = client.get('/api/sounds/%d/peaks?points=256' % sound_id, headers={'If-None-Match': resp.headers['ETag']})
+    assert other.status_code == 200  # another level is another ETag
+
+
+def test_missing_peaks_are_404(client, sound_id):
+    assert client.get('/api/sounds/%d/peaks' % (sound_id + 1)).status_code == 404  # never hashed
+    assert client.get('/api/sounds/999999/peaks').status_code == 404
+    assert client.get('/api/sounds/%d/peaks?variant=999999' % sound_id).status_code == 404
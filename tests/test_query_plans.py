@@ -0,0 +1,126 @@
+"""EXPLAIN QUERY PLAN on every statement behind the hot API endpoints: none may scan a whole table.
+
+Statements are recorded from before the first request, so the catalog snapshot build is
+checked too. No ANALYZE: with statistics for a seed this small SQLite would (rightly)
+prefer scans.
+"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+from flask_app import db
+from flask_app.models import Category, SoundVariant
+from flask_app.search import rebuild_index
+from tests.conftest import PASSWORD, seed_catalog
+
+# Tiny tables that are read whole on purpose.
+ALLOWED_SCANS = {'categories', 'catalog_state', 'schema_migrations'}
+# "SCAN t" without an index; FTS5 lookups show as "SCAN t VIRTUAL TABLE INDEX ...".
+SCAN_RE = re.compile(r'\bSCAN (\w+)\b(?! USING| VIRTUAL TABLE INDEX)')
+
+
+@pytest.fixture
+def catalog_ids(app):
+    """Seed 3 categories of 20 sounds with 2 variants each and build the search index.
+    Returns (category ids, {sound id: variant ids}, whether the FTS5 index was built)."""
+    with app.app_context():
+        seed_catalog(categories=3, sounds=20, variants=2)
+        fts = rebuild_index()
+        db.session.commit()
+        variants = {}
+        for v in SoundVariant.query.order_by(SoundVariant.sort_order):
+            variants.setdefault(v.sound_id, []).append(v.id)
+        return [c.id for c in Category.query.order_by(Category.sort_order)], variants, fts
+
+
+@pytest.fixture
+def recorded(app):
+    """(statement, parameters) of every SELECT, UPDATE and DELETE from here on."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def _call(client, method, url, expect=(200, 201), **kwargs):
+    r = client.open(url, method=method, **kwargs)
+    assert r.status_code in expect, '%s %s -> %d %s' % (method, url, r.status_code, r.get_data(as_text=True)[:200])
+    return r.get_json(silent=True)
+
+
+def _full_scans(app, statements):
+    """'statement: plan' for each distinct statement whose plan scans a table outside ALLOWED_SCANS."""
+    found = []
+    seen = set()
+    with app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement, parameters in statements:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                plan = [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                if any(t not in ALLOWED_SCANS for line in plan for t in SCAN_RE.findall(line)):
+                    found.append('%s\n  %s' % (' '.join(statement.split()), '\n  '.join(plan)))
+        finally:
+            raw.close()
+    return found
+
+
+def test_catalog_endpoints_use_indexes(app, client, catalog_ids, recorded):
+    category_ids, variants, fts = catalog_ids
+    sound_id = next(iter(variants))
+    _call(client, 'GET', '/api/catalog')
+    _call(client, 'GET', '/api/categories')
+    assert len(_call(client, 'GET', '/api/sounds?category_id=%d' % category_ids[1])['sounds']) == 20
+    if fts:  # the LIKE fallback scans by design
+        assert _call(client, 'GET', '/api/sounds?q=sound')['sounds']
+        assert _call(client, 'GET', '/api/sounds?q=v1&category_id=%d' % category_ids[2])['sounds']
+    _call(client, 'GET', '/api/sounds/%d' % sound_id)
+    _call(client, 'GET', '/api/sounds/%d/peaks' % sound_id, expect=(200, 404))  # no peaks files: lookup only
+    _call(client, 'GET', '/api/sounds/%d/peaks?variant=%d' % (sound_id, variants[sound_id][1]), expect=(200, 404))
+    _call(client, 'GET', '/audio/m/0123456789abcdef/category-0/0.wav', expect=(404,))  # unhashed: lookup only
+
+    assert any('FROM sounds' in s for s, _ in recorded), 'the snapshot build was not recorded'
+    assert _full_scans(app, recorded) == []
+
+
+def test_session_list_and_auth_endpoints_use_indexes(app, client, user, catalog_ids, recorded):
+    variants = catalog_ids[1]
+    sound_ids = list(variants)
+    _call(client, 'POST', '/auth/login', json={'email': 'dm@example.com', 'password': PASSWORD})
+    _call(client, 'GET', '/auth/me')
+    _call(client, 'GET', '/auth/profile')
+    list_id = _call(client, 'POST', '/api/session-lists', json={'name': 'Plans'})['id']
+    for sound_id in sound_ids[2:16:4]:
+        _call(client, 'POST', '/api/session-lists/%d/sounds' % list_id, json={'sound_id': sound_id})
+    _call(client, 'POST', '/api/session-lists/%d/sounds/batch' % list_id, json={
+        'add': [{'sound_id': sound_ids[20], 'sound_variant_id': variants[sound_ids[20]][0]}, {'sound_id': sound_ids[21]}],
+        'remove': [{'sound_id': sound_ids[2]}],
+    })
+    entries = _call(client, 'GET', '/api/session-lists/%d' % list_id)['sounds']
+    _call(client, 'PUT', '/api/session-lists/%d/sounds/%d/position' % (list_id, entries[0]['id']),
+          json={'after_id': entries[-1]['id']})
+    _call(client, 'PUT', '/api/session-lists/%d/sounds/reorder' % list_id,
+          json={'entry_ids': [e['id'] for e in reversed(entries)]})
+    _call(client, 'GET', '/api/session-lists')
+    _call(client, 'GET', '/api/session-lists/summary')
+    _call(client, 'GET', '/api/session-lists/%d/manifest' % list_id)
+    _call(client, 'GET', '/api/session-lists/%d/sprite' % list_id, expect=(200, 404))  # no audio files: lookup only
+    _call(client, 'DELETE', '/api/session-lists/%d/sounds/%d' % (list_id, sound_ids[6]))
+    _call(client, 'PUT', '/api/session-lists/%d' % list_id, json={'name': 'Plans (renamed)'})
+    _call(client, 'POST', '/auth/profile/request-email-change', json={'new_email': 'dm2@example.com'},
+          expect=(200, 503))
+    _call(client, 'DELETE', '/api/session-lists/%d' % list_id)
+    _call(client, 'POST', '/auth/logout')
+
+    assert _full_scans(app, recorded) == []
@@ -0,0 +1,47 @@
+"""/audio/m/<hash>/<path>: immutable only under the file's current hash."""
+import pytest
+
+from flask_app import db, routes_audio
+from flask_app.models import Category, Sound
+from tests.conftest import write_wav
+
+PATH = 'combat/Sword Hit.wav'
+
+
+@pytest.fixture
+def master(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(routes_audio, 'AUDIO_DIR', str(tmp_path))
+    write_wav(str(tmp_path / PATH))
+    with app.app_context():
+        cat = Category(name='Combat', slug='combat')
+        db.session.add(cat)
+        db.session.flush()
+        db.session.add(Sound(name='Sword Hit', category_id=cat.id, file_path=PATH, content_hash='0123456789abcdef'))
+        db.session.commit()
+    return tmp_path
+
+
+def test_current_hash_is_immutable(client, master):
+    r = client.get('/audio/m/0123456789abcdef/combat/Sword%20Hit.wav')
+    assert r.status_code == 200
+    assert 'immutable' in r.headers['Cache-Control']
+    assert r.data[:4] == b'RIFF'
+
+
+def test_range_request(client, master):
+    r = client.get('/audio/m/0123456789abcdef/combat/Sword%20Hit.wav', headers={'Range': 'bytes=0-99'})
+    assert r.status_code == 206
+    assert len(r.data) == 100
+
+
+def test_stale_hash_redirects_uncached(client, master):
+    r = client.get('/audio/m/ffffffffffffffff/combat/Sword%20Hit.wav')
+    assert r.status_code == 302
+    assert r.headers['Location'] == '/audio/m/0123456789abcdef/combat/Sword%20Hit.wav'
+    assert 'immutable' not in r.headers['Cache-Control']
+    assert 'no-cache' in r.headers['Cache-Control']
+
+
+def test_unhashed_path_is_not_found(client, master):
+    write_wav(str(master / 'combat' / 'unsynced.wav'))
+    assert client.get('/audio/m/0123456789abcdef/combat/unsynced.wav').status_code == 404
@@ -0,0 +1,65 @@
+"""Sound search (flask_app/search.py): FTS5 ranking, the LIKE fallback and punctuation-only queries."""
+import pytest
+
+from flask_app import catalog, db, search
+from flask_app.models import Category, Sound, SoundVariant
+
+
+@pytest.fixture
+def sounds(app):
+    """Sound ids by name; the FTS index is built when this SQLite has FTS5 (and dropped afterwards)."""
+    with app.app_context():
+        cat = Category(name='Weather', slug='weather')
+        db.session.add(cat)
+        db.session.flush()
+        rows = {
+            # Sorts first by name, but only its path says thunder.
+            'Distant Rumble': Sound(name='Distant Rumble', category_id=cat.id, file_path='weather/thunder-far.wav'),
+            'Thunder Clap': Sound(name='Thunder Clap', category_id=cat.id, file_path='weather/clap.wav'),
+            "Jack-o'-Lantern": Sound(name="Jack-o'-Lantern", category_id=cat.id, file_path='weather/lantern.wav'),
+            'Rain': Sound(name='Rain', category_id=cat.id, file_path='weather/rain.wav'),
+        }
+        db.session.add_all(rows.values())
+        db.session.flush()
+        db.session.add(SoundVariant(sound_id=rows['Rain'].id, label='Heavy downpour', file_path='weather/rain/1.wav'))
+        built = search.rebuild_index()
+        catalog.bump_version()
+        db.session.commit()
+        yield {name: s.id for name, s in rows.items()}, built
+        db.session.execute(db.text('DROP TABLE IF EXISTS %s' % search.FTS_TABLE))
+        db.session.commit()
+
+
+def test_name_match_outranks_path_match(app, sounds):
+    ids, built = sounds
+    if not built:
+        pytest.skip('SQLite without FTS5')
+    with app.app_context():
+        assert search.search_sound_ids('thunder') == [ids['Thunder Clap'], ids['Distant Rumble']]
+        assert search.search_sound_ids('thun') == [ids['Thunder Clap'], ids['Distant Rumble']]  # prefixes
+        assert search.search_sound_ids('down') == [ids['Rain']]  # variant labels
+        assert search.search_sound_ids('thunder clap') == [ids['Thunder Clap']]  # every token must match
+
+
+def test_like_fallback_finds_the_same_sounds(app, sounds):
+    ids, _ = sounds
+    with app.app_context():
+        ranked = {q: search.search_sound_ids(q) for q in ('thunder', 'down', 'weather rain')}
+        db.session.execute(db.text('DROP TABLE IF EXISTS %s' % search.FTS_TABLE))
+        db.session.commit()
+        for q, found in ranked.items():
+            assert sorted(search._like_search(search.query_tokens(q), None)) == sorted(found)
+            assert sorted(search.search_sound_ids(q)) == sorted(found)  # falls back without the index
+    assert sorted(ranked['thunder']) == sorted([ids['Thunder Clap'], ids['Distant Rumble']])
+
+
+def test_punctuation_only_is_a_name_substring(app, client, sounds):
+    ids, _ = sounds
+    with app.app_context():
+        assert search.query_tokens("'-") == []
+        assert search.search_sound_ids("'") == [ids["Jack-o'-Lantern"]]
+        assert search.search_sound_ids("'-") == [ids["Jack-o'-Lantern"]]
+        assert search.search_sound_ids('%') == []  # LIKE wildcards are matched literally
+        assert search.search_sound_ids('  ') == []
+    r = client.get('/api/sounds', query_string={'q': '-'})
+    assert [s['id'] for s in r.get_json()['sounds']] == [ids["Jack-o'-Lantern"]]
@@ -0,0 +1,113 @@
+"""Session list listings and batch edits cost a fixed number of queries, however many lists and entries there are."""
+import pytest
+
+from flask_app import db
+from flask_app.list_order import ORDER_GAP
+from flask_app.models import SessionList, SessionListSound, SoundVariant
+from tests.conftest import seed_catalog
+
+# User, lists, entries; then by eager load sounds (with categories), pinned variants, sound
+# renditions, each sound's variants and renditions of both kinds of variant.
+LISTS_QUERIES = 9
+# User, then one aggregate over lists and entries.
+SUMMARY_QUERIES = 2
+# User, list; sounds and variants to validate additions; entries; one DELETE, one INSERT;
+# entries again; one CASE UPDATE of sort orders; the list's updated_at.
+BATCH_QUERIES = 10
+
+
+@pytest.fixture
+def sound_ids(app):
+    with app.app_context():
+        return seed_catalog(sounds=8, variants=2)
+
+
+def _seed_lists(app, user_id, sound_ids, lists, entries):
+    with app.app_context():
+        variants = {v.sound_id: v.id for v in SoundVariant.query.filter_by(sort_order=1)}
+        for n in range(lists):
+            lst = SessionList(user_id=user_id, name='List %d' % n)
+            db.session.add(lst)
+            db.session.flush()
+            for i, sound_id in enumerate(sound_ids[:entries]):
+                # Every other entry (the first included) pins a variant, so even a one-entry list
+                # has rows for each eager load.
+                db.session.add(SessionListSound(session_list_id=lst.id, sound_id=sound_id, sort_order=(i + 1) * 1024,
+                                                sound_variant_id=None if i % 2 else variants[sound_id]))
+        db.session.commit()
+
+
+def _count(client, queries, url):
+    queries.clear()
+    r = client.get(url)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return len(queries), r.get_json()['session_lists']
+
+
+@pytest.mark.parametrize('url, expected', [('/api/session-lists', LISTS_QUERIES),
+                                           ('/api/session-lists/summary', SUMMARY_QUERIES)])
+def test_query_count_is_fixed(app, logged_in, user, sound_ids, queries, url, expected):
+    _seed_lists(app, user, sound_ids, lists=1, entries=1)
+    one, lists = _count(logged_in, queries, url)
+    assert len(lists) == 1
+    assert one == expected
+
+    with app.app_context():
+        SessionListSound.query.delete()
+        SessionList.query.delete()
+        db.session.commit()
+    _seed_lists(app, user, sound_ids, lists=6, entries=8)
+    many, lists = _count(logged_in, queries, url)
+    assert len(lists) == 6
+    assert one == many
+
+
+def test_lists_serialize_entries(app, logged_in, user, sound_ids, queries):
+    _seed_lists(app, user, sound_ids, lists=3, entries=4)
+    count, lists = _count(logged_in, queries, '/api/session-lists')
+    assert count == LISTS_QUERIES
+    assert [len(lst['sounds']) for lst in lists] == [4, 4, 4]
+    summary = _count(logged_in, queries, '/api/session-lists/summary')[1]
+    assert sorted(s['sound_count'] for s in summary) == [4, 4, 4]
+
+
+def _batch(client, queries, list_id, body):
+    queries.clear()
+    r = client.post('/api/session-lists/%d/sounds/batch' % list_id, json=body)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return len(queries), r.get_json()
+
+
+@pytest.mark.parametrize('entries, adds', [(3, 1), (6, 2)])
+def test_batch_costs_a_fixed_number_of_statements(app, logged_in, user, sound_ids, queries, entries, adds):
+    _seed_lists(app, user, sound_ids, lists=1, entries=entries)
+    with app.app_context():
+        lst = SessionList.query.one()
+        before = [e.id for e in lst.sounds.order_by(SessionListSound.sort_order)]
+        variant = SoundVariant.query.filter_by(sound_id=sound_ids[entries], sort_order=0).one().id
+    add = [{'sound_id': sound_ids[entries], 'sound_variant_id': variant}]
+    add += [{'sound_id': sound_id} for sound_id in sound_ids[entries + 1:entries + adds]]
+    body = {'add': add, 'remove': [{'id': before[0]}], 'order': [{'id': before[-1]}]}
+    count, result = _batch(logged_in, queries, lst.id, body)
+    assert count == BATCH_QUERIES
+
+    with app.app_context():
+        after = SessionList.query.one().sounds.order_by(SessionListSound.sort_order).all()
+    added = [e.id for e in after if e.id not in before]
+    assert result['removed'] == [before[0]]
+    assert sorted(result['added']) == sorted(added) and len(added) == adds
+    # The moved entry first, the rest in their old order, new entries appended.
+    assert [e.id for e in after] == [before[-1]] + before[1:-1] + added
+    assert [e.sort_order for e in after] == [i * ORDER_GAP for i in range(len(after))]
+    changed = {item['id']: item['sort_order'] for item in result['order']}
+    assert changed and all(e.sort_order == changed[e.id] for e in after if e.id in changed)
+    assert before[-1] in changed
+
+
+def test_batch_needs_an_object(app, logged_in, user, sound_ids):
+    _seed_lists(app, user, sound_ids, lists=1, entries=1)
+    with app.app_context():
+        list_id = SessionList.query.one().id
+    r = logged_in.post('/api/session-lists/%d/sounds/batch' % list_id, json=[{'sound_id': sound_ids[0]}])
+    assert r.status_code == 400
+    assert 'error' in r.get_json()
@@ -0,0 +1,66 @@
+"""Spectral similarity (flask_app/similarity.py): features of WAV tones, the index and /similar."""
+import pytest
+
+from flask_app import catalog, db
+from flask_app.models import Sound
+from tests.conftest import seed_catalog, write_wav
+
+pytest.importorskip('numpy')
+
+from flask_app import similarity  # noqa: E402
+
+# Two low tones and two high ones: each should find its neighbour first.
+TONES = (220.0, 247.0, 4000.0, 4400.0)
+
+
+@pytest.fixture
+def sound_ids(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity, 'INDEX_PATH', str(tmp_path / 'similarity.npy'))
+    monkeypatch.setattr(similarity, '_index', None)
+    with app.app_context():
+        ids = seed_catalog(sounds=len(TONES), variants=0)
+    rows = []
+    for sound_id, freq in zip(ids, TONES):
+        embedding = similarity.features(write_wav(str(tmp_path / ('%d.wav' % freq)), seconds=1, freq=freq))
+        assert len(embedding) == similarity.EMBED_DIM
+        rows.append((sound_id, None, embedding))
+    assert similarity.write_index(rows) == len(TONES)
+    return ids
+
+
+def _similar(client, sound_id, **args):
+    resp = client.get('/api/sounds/%d/similar' % sound_id, query_string=args)
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    return [(item['sound']['id'], item['score']) for item in resp.get_json()['similar']]
+
+
+def test_nearest_tone_comes_first(client, sound_ids):
+    low, low2, high, high2 = sound_ids
+    results = _similar(client, low)
+    assert [sound_id for sound_id, _ in results][0] == low2
+    assert low not in [sound_id for sound_id, _ in results]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert _similar(client, high)[0][0] == high2
+    assert len(_similar(client, low, limit=1)) == 1
+
+
+def test_inactive_sounds_are_left_out(app, client, sound_ids):
+    low, low2 = sound_ids[:2]
+    with app.app_context():
+        db.session.get(Sound, low2).is_active = False
+        catalog.bump_version()
+        db.session.commit()
+    assert low2 not in [sound_id for sound_id, _ in _similar(client, low)]
+    assert client.get('/api/sounds/%d/similar' % low2).status_code == 404
+
+
+def test_silence_has_no_features_and_no_index_is_404(app, client, tmp_path, monkeypatch):
+    assert similarity.features(write_wav(str(tmp_path / 'silence.wav'), amplitude=0.0)) == []
+    monkeypatch.setattr(similarity, 'INDEX_PATH', str(tmp_path / 'missing.npy'))
+    monkeypatch.setattr(similarity, '_index', None)
+    with app.app_context():
+        sound_id = seed_catalog(sounds=1, variants=0)[0]
+    resp = client.get('/api/sounds/%d/similar' % sound_id)
+    assert resp.status_code == 404
+    assert resp.get_json() == similarity.NO_INDEX[0]
@@ -0,0 +1,96 @@
+"""Session list sprites (flask_app/sprite.py): segment offsets, skipped files and the cache."""
+import io
+import wave
+
+import pytest
+
+from flask_app import db, routes_audio, session_lists
+from flask_app.models import Category, SessionList, SessionListSound, Sound
+from tests.conftest import write_wav
+
+np = pytest.importorskip('numpy')
+
+from flask_app import sprite  # noqa: E402
+
+RATE = sprite.MIX_RATE
+GAP = int(sprite.GAP_SECONDS * RATE)
+
+
+@pytest.fixture
+def list_id(app, user, tmp_path, monkeypatch):
+    """A list of a 0.5 s tone, a 0.25 s tone at 44.1 kHz and a 31 s ambience bed."""
+    audio = tmp_path / 'audio'
+    for module in (sprite, routes_audio, session_lists):
+        monkeypatch.setattr(module, 'AUDIO_DIR', str(audio))
+    for module in (sprite, routes_audio):
+        monkeypatch.setattr(module, 'SPRITES_DIR', str(tmp_path / 'sprites'))
+    monkeypatch.setattr(sprite, 'SEGMENTS_DIR', str(tmp_path / 'segments'))
+    monkeypatch.setitem(app.config, 'AUDIO_DEFAULT_RENDITION', 'wav')
+    write_wav(str(audio / 'fx' / 'hit.wav'), seconds=0.5)
+    write_wav(str(audio / 'fx' / 'click.wav'), seconds=0.25, rate=44100)
+    write_wav(str(audio / 'fx' / 'bed.wav'), seconds=0.1)
+    with app.app_context():
+        cat = Category(name='FX', slug='fx')
+        db.session.add(cat)
+        db.session.flush()
+        # Segments are laid out by content hash: hit ('a...') first, then click ('b...').
+        sounds = [
+            Sound(name='Click', category_id=cat.id, file_path='fx/click.wav', content_hash='b' * 16, is_active=True),
+            Sound(name='Hit', category_id=cat.id, file_path='fx/hit.wav', content_hash='a' * 16, is_active=True),
+            Sound(name='Bed', category_id=cat.id, file_path='fx/bed.wav', content_hash='c' * 16, is_active=True,
+                  duration_seconds=31.0),
+        ]
+        db.session.add_all(sounds)
+        lst = SessionList(user_id=user, name='Ambush')
+        db.session.add(lst)
+        db.session.flush()
+        for i, sound in enumerate(sounds):
+            db.session.add(SessionListSound(session_list_id=lst.id, sound_id=sound.id, sort_order=(i + 1) * 1024))
+        db.session.commit()
+        return lst.id
+
+
+def _pack(client, list_id):
+    resp = client.get('/api/session-lists/%d/sprite?format=wav' % list_id)
+    assert resp.status_code == 200, resp.get_data(as_text=True)
+    return resp.get_json()
+
+
+def test_segment_offsets_match_the_sprite(logged_in, list_id):
+    result = _pack(logged_in, list_id)
+    assert result['format'] == 'wav'
+    click, hit = result['segments']  # list order
+    assert hit['start'] == sprite.GAP_SECONDS and hit['duration'] == 0.5
+    assert click['start'] == round(0.5 + 2 * sprite.GAP_SECONDS, 6)
+    assert click['duration'] == pytest.approx(0.25, abs=2.0 / RATE)  # resampled from 44.1 kHz
+    assert result['duration'] == pytest.approx(click['start'] + click['duration'] + sprite.GAP_SECONDS, abs=1e-4)
+    assert [s['reason'] for s in result['skipped']] == ['longer than %d s' % sprite.MAX_SEGMENT_SECONDS]
+
+    resp = logged_in.get(result['url'])
+    assert resp.status_code == 200
+    assert result['size_bytes'] == len(resp.data)
+    with wave.open(io.BytesIO(resp.data)) as w:
+        assert (w.getframerate(), w.getnchannels()) == (RATE, 2)
+        pcm = np.abs(np.frombuffer(w.readframes(w.getnframes()), '<i2').reshape(-1, 2)).max(axis=1)
+    assert len(pcm) == pytest.approx(result['duration'] * RATE, abs=RATE * 1e-4)  # duration has 4 decimals
+    for segment in (hit, click):
+        start, end = int(round(segment['start'] * RATE)), int(round((segment['start'] + segment['duration']) * RATE))
+        assert pcm[start - GAP:start].max() == 0  # the gap before it is silent
+        assert pcm[start:start + 100].max() > 0  # and the tone starts right at the offset
+        assert pcm[end - 100:end].max() > 0
+        assert pcm[end:end + GAP].max() == 0
+
+
+def test_sprite_is_cached_and_shared(app, logged_in, list_id, user):
+    first = _pack(logged_in, list_id)
+    with app.app_context():  # the same files in another order: the same sprite
+        for entry in SessionListSound.query.filter_by(session_list_id=list_id):
+            entry.sort_order = -entry.sort_order
+        db.session.commit()
+    again = _pack(logged_in, list_id)
+    assert again['url'] == first['url']
+    assert [s['sound_id'] for s in again['segments']] == [s['sound_id'] for s in reversed(first['segments'])]
+
+
+def test_sprite_needs_sign_in(client, list_id):
+    assert client.get('/api/session-lists/%d/sprite' % list_id).status_code == 401
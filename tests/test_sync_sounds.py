@@ -0,0 +1,67 @@
+"""sync_sounds.py against a scratch audio tree: incremental runs and matching existing rows."""
+import os
+
+import pytest
+
+import sync_sounds
+from flask_app import db
+from flask_app.models import Category, Sound, SoundVariant
+from tests.conftest import write_wav
+
+
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    audio = tmp_path / 'audio'
+    audio.mkdir()
+    monkeypatch.setattr(sync_sounds, 'AUDIO_DIR', str(audio))
+    monkeypatch.setattr(sync_sounds, 'MANIFEST_PATH', str(tmp_path / 'manifest.json'))
+    return audio
+
+
+def _sync(**kwargs):
+    sync_sounds.sync(measure=False, waveforms=False, similar=False, dedup=False, **kwargs)
+
+
+def test_removed_variant_is_dropped_incrementally(app, audio_dir):
+    write_wav(str(audio_dir / 'combat' / 'sword-swing' / 'a.wav'))
+    write_wav(str(audio_dir / 'combat' / 'sword-swing' / 'b.wav'), freq=660)
+    write_wav(str(audio_dir / 'magic' / 'zap.wav'))
+    _sync()
+    with app.app_context():
+        assert sorted(v.file_path for v in SoundVariant.query) == ['combat/sword-swing/a.wav', 'combat/sword-swing/b.wav']
+
+    os.remove(audio_dir / 'combat' / 'sword-swing' / 'b.wav')
+    _sync()
+    with app.app_context():
+        sound = Sound.query.filter_by(name='Sword Swing').one()
+        assert sound.is_active
+        assert [v.file_path for v in sound.variants] == ['combat/sword-swing/a.wav']
+        assert sound.file_path == 'combat/sword-swing/a.wav'
+
+
+def test_untouched_category_is_skipped(app, audio_dir, capsys):
+    write_wav(str(audio_dir / 'combat' / 'hit.wav'))
+    write_wav(str(audio_dir / 'magic' / 'zap.wav'))
+    _sync()
+    write_wav(str(audio_dir / 'magic' / 'fizzle.wav'))
+    capsys.readouterr()
+    _sync()
+    out = capsys.readouterr().out
+    assert '+ magic/fizzle.wav' in out
+    assert 'combat' not in out
+
+
+def test_row_in_another_category_is_moved_not_duplicated(app, audio_dir):
+    write_wav(str(audio_dir / 'combat' / 'hit.wav'))
+    with app.app_context():
+        # As init_db.py seeds rows: same path, filed under another category.
+        other = Category(name='Misc', slug='misc', sort_order=5)
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Sound(name='Hit', category_id=other.id, file_path='combat/hit.wav', is_active=True))
+        db.session.commit()
+    _sync()
+    with app.app_context():
+        rows = Sound.query.filter_by(file_path='combat/hit.wav').all()
+        assert len(rows) == 1
+        assert rows[0].category.slug == 'combat'
@@ -0,0 +1,59 @@
+"""Rendition profiles and the ffmpeg encode step (flask_app/transcode.py)."""
+import os
+import stat
+
+import pytest
+
+from flask_app import transcode
+from tests.conftest import write_wav
+
+
+def test_parse_profiles():
+    profiles = transcode.parse_profiles(' AAC:96, opus:64 ,,mp3')
+    assert [(p.format, p.bitrate_kbps) for p in profiles] == [('aac', 96), ('opus', 64), ('mp3', 96)]
+    assert [(p.extension, p.muxer) for p in profiles] == [('m4a', 'ipod'), ('opus', 'ogg'), ('mp3', 'mp3')]
+    assert profiles[1].output_path('ab' + 'c' * 38) == 'ab/ab%s-opus64.opus' % ('c' * 38)
+    assert transcode.parse_profiles('') == transcode.parse_profiles(None) == []
+
+
+@pytest.mark.parametrize('spec', ['flac:96', 'aac:fast', 'aac:96,:64'])
+def test_parse_profiles_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        transcode.parse_profiles(spec)
+
+
+def test_rendition_url():
+    assert transcode.rendition_url('ab/abc-aac96.m4a') == '/audio/r/ab/abc-aac96.m4a'
+
+
+def _job(ffmpeg, tmp_path, fmt='opus', bitrate=64):
+    src = write_wav(str(tmp_path / 'master.wav'), seconds=0.5)
+    profile = transcode.RenditionProfile(fmt, bitrate)
+    dst = str(tmp_path / 'out' / profile.output_path('ab' * 20))
+    return (ffmpeg, src, dst, profile.muxer, profile.codec_args, bitrate), dst
+
+
+def test_failed_encode_leaves_no_file(tmp_path):
+    # Stands in for an ffmpeg that writes part of its output and then fails.
+    fake = tmp_path / 'ffmpeg'
+    fake.write_text('#!/bin/sh\nfor last; do :; done\necho partial > "$last"\necho "Invalid data found" >&2\nexit 1\n')
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    job, dst = _job(str(fake), tmp_path)
+    assert transcode.encode(job) == (None, 'Invalid data found')
+    assert os.listdir(os.path.dirname(dst)) == []
+
+
+def test_missing_binary_is_an_error(tmp_path):
+    job, dst = _job(str(tmp_path / 'no-ffmpeg'), tmp_path)
+    size, err = transcode.encode(job)
+    assert size is None and err
+    assert not os.path.exists(dst)
+
+
+@pytest.mark.skipif(not transcode.ffmpeg_binary(), reason='ffmpeg is not installed')
+def test_encode_with_ffmpeg(tmp_path):
+    job, dst = _job(transcode.ffmpeg_binary(), tmp_path, fmt='aac', bitrate=96)
+    size, err = transcode.encode(job)
+    assert err is None
+    assert size == os.path.getsize(dst) > 0
+    assert os.listdir(os.path.dirname(dst)) == [os.path.basename(dst)]